@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf8 -*-
+
+"""
+benchmarks.bench_indicators
+
+Compare the time needed to compute technical indicators over many candles
+with naive per-row loops (like the scripts re-parsing the ohlc table) and
+with clikraken.indicators, and check that the results are the same.
+
+Usage:
+
+    python benchmarks/bench_indicators.py [-n COUNT]
+
+Licensed under the Apache License, Version 2.0. See the LICENSE file.
+"""
+
+import argparse
+import math
+import random
+import time
+
+import numpy as np
+
+from clikraken.indicators import atr, bollinger, ema, rsi, sma
+
+PERIOD = 20
+
+
+def naive_sma(close, n):
+    return [None if i < n - 1 else sum(close[i - n + 1:i + 1]) / n for i in range(len(close))]
+
+
+def naive_ema(close, n):
+    alpha = 2 / (n + 1)
+    out = [None] * len(close)
+    out[n - 1] = avg = sum(close[:n]) / n
+    for i in range(n, len(close)):
+        avg = alpha * close[i] + (1 - alpha) * avg
+        out[i] = avg
+    return out
+
+
+def naive_wilder(values, n):
+    out = [None] * len(values)
+    out[n - 1] = avg = sum(values[:n]) / n
+    for i in range(n, len(values)):
+        avg = (avg * (n - 1) + values[i]) / n
+        out[i] = avg
+    return out
+
+
+def naive_rsi(close, n):
+    gains, losses = [], []
+    for prev, cur in zip(close[:-1], close[1:]):
+        gains.append(max(cur - prev, 0))
+        losses.append(max(prev - cur, 0))
+    avg_gains, avg_losses = naive_wilder(gains, n), naive_wilder(losses, n)
+    out = [None]
+    for g, lo in zip(avg_gains, avg_losses):
+        out.append(None if g is None else (50.0 if g + lo == 0 else 100.0 * g / (g + lo)))
+    return out
+
+
+def naive_bollinger(close, n, k=2.0):
+    lower, upper = [], []
+    for i in range(len(close)):
+        if i < n - 1:
+            lower.append(None)
+            upper.append(None)
+            continue
+        window = close[i - n + 1:i + 1]
+        mean = sum(window) / n
+        std = math.sqrt(sum((v - mean) ** 2 for v in window) / n)
+        lower.append(mean - k * std)
+        upper.append(mean + k * std)
+    return lower, upper
+
+
+def naive_atr(high, low, close, n):
+    true_ranges = [high[0] - low[0]]
+    for i in range(1, len(close)):
+        true_ranges.append(max(high[i] - low[i], abs(high[i] - close[i - 1]), abs(low[i] - close[i - 1])))
+    return naive_wilder(true_ranges, n)
+
+
+def naive(high, low, close):
+    return [naive_sma(close, PERIOD), naive_ema(close, PERIOD), naive_rsi(close, PERIOD)] + \
+        list(naive_bollinger(close, PERIOD)) + [naive_atr(high, low, close, PERIOD)]
+
+
+def vectorized(high, low, close):
+    lower, _, upper = bollinger(close, PERIOD)
+    return [sma(close, PERIOD), ema(close, PERIOD), rsi(close, PERIOD), lower, upper, atr(high, low, close, PERIOD)]
+
+
+def same(expected, result):
+    expected = np.array([np.nan if v is None else v for v in expected])
+    return np.allclose(expected, result, rtol=1e-9, equal_nan=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='clikraken indicators benchmark')
+    parser.add_argument('-n', '--count', type=int, default=50000, help='number of candles')
+    args = parser.parse_args()
+
+    close = [100.0]
+    for _ in range(args.count - 1):
+        close.append(max(1.0, close[-1] + random.gauss(0, 1)))
+    high = [c + random.random() for c in close]
+    low = [c - random.random() for c in close]
+
+    print('{} candles, SMA/EMA/RSI/Bollinger/ATR over {} candles\n'.format(args.count, PERIOD))
+
+    t0 = time.perf_counter()
+    expected = naive(high, low, close)
+    t_naive = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    result = vectorized(np.array(high), np.array(low), np.array(close))
+    t_vectorized = time.perf_counter() - t0
+
+    print('{:12} {:10.1f} ms'.format('naive loops', t_naive * 1000))
+    print('{:12} {:10.1f} ms'.format('vectorized', t_vectorized * 1000))
+    print('\nspeedup: {:.1f}x, same results: {}'.format(
+        t_naive / t_vectorized, all(same(e, r) for e, r in zip(expected, result))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf8 -*-
+
+"""
+benchmarks.bench_pnl
+
+Measure the time needed by the pnl command to process a big history of
+trades from the local mirror (in a temporary database), then to process
+a few new trades appended to it, resuming from the saved state.
+
+Usage:
+
+    python benchmarks/bench_pnl.py [-n COUNT] [-m METHOD]
+
+Licensed under the Apache License, Version 2.0. See the LICENSE file.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import clikraken.global_vars as gv
+from clikraken.api.private.pnl import local_engine
+from clikraken.history_db import HistoryDB
+from clikraken.pnl import METHODS, PnLEngine
+
+PAIRS = ['XETHZEUR', 'XXBTZEUR', 'XLTCZEUR', 'XXRPZEUR']
+
+
+def trades(start, count, seed=1):
+    rnd = random.Random(seed)
+    for i in range(start, start + count):
+        vol = rnd.random() * 10
+        price = 100 + rnd.random() * 10
+        yield 'T{:08d}'.format(i), {
+            'ordertxid': 'O{:08d}'.format(i), 'pair': PAIRS[i % len(PAIRS)], 'time': 1500000000.0 + 60 * i,
+            'type': 'buy' if rnd.random() < 0.55 else 'sell', 'ordertype': 'limit', 'price': '{:.5f}'.format(price),
+            'cost': '{:.5f}'.format(vol * price), 'fee': '{:.5f}'.format(vol * price * 0.0026),
+            'vol': '{:.8f}'.format(vol), 'margin': '0.00000', 'misc': ''}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='clikraken pnl benchmark')
+    parser.add_argument('-n', '--count', type=int, default=1000000, help='number of trades')
+    parser.add_argument('-m', '--method', default='fifo', choices=METHODS, help='cost basis method')
+    args = parser.parse_args()
+
+    print('{} trades, {}\n'.format(args.count, args.method))
+
+    history = list(trades(0, args.count))
+    t0 = time.perf_counter()
+    PnLEngine(args.method).add_many(history)
+    print('{:28} {:8.2f} s'.format('engine (in memory)', time.perf_counter() - t0))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        gv.HISTORY_DB_PATH = os.path.join(tmp, 'history.sqlite')
+        db = HistoryDB()
+        db.upsert('trades', dict(history))
+
+        t0 = time.perf_counter()
+        local_engine(args.method, rebuild=True)
+        print('{:28} {:8.2f} s'.format('pnl --local --rebuild', time.perf_counter() - t0))
+
+        db.upsert('trades', dict(trades(args.count, 1000, seed=2)))
+        db.close()
+        t0 = time.perf_counter()
+        engine = local_engine(args.method)
+        print('{:28} {:8.2f} s'.format('pnl --local (+1000 trades)', time.perf_counter() - t0))
+        assert engine.processed == args.count + 1000
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf8 -*-
+
+"""
+benchmarks.bench_records
+
+Compare the memory and time needed to hold a big ledger export as one
+OrderedDict per row (as clikraken used to do) and as LedgerEntry records,
+and check that the CSV outputs are identical.
+
+Usage:
+
+    python benchmarks/bench_records.py [-n COUNT]
+
+Licensed under the Apache License, Version 2.0. See the LICENSE file.
+"""
+
+import argparse
+import io
+import time
+import tracemalloc
+from collections import OrderedDict
+
+import clikraken.global_vars as gv
+from clikraken.clikraken_utils import write_csv
+from clikraken.records import LedgerEntry
+
+
+def ledger_values(count):
+    for i in range(count):
+        yield ('L{:08d}'.format(i), 'R{:08d}'.format(i), '2018-01-01 00:00:00+00:00', 'trade', 'ETH', 'currency',
+               float(i), 0.0, float(i))
+
+
+def as_dicts(count):
+    return [OrderedDict(zip(LedgerEntry._fields, values)) for values in ledger_values(count)]
+
+
+def as_records(count):
+    return [LedgerEntry(*values) for values in ledger_values(count)]
+
+
+def measure(func, count):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    rows = func(count)
+    elapsed = time.perf_counter() - t0
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return rows, elapsed, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description='clikraken row records benchmark')
+    parser.add_argument('-n', '--count', type=int, default=500000, help='number of ledger entries')
+    args = parser.parse_args()
+
+    gv.CSV_SEPARATOR = ','
+
+    print('{} ledger entries\n'.format(args.count))
+    print('{:12} {:>10} {:>12} {:>10}'.format('', 'build [ms]', 'memory [MB]', 'csv [ms]'))
+    outputs = []
+    for name, func in (('OrderedDict', as_dicts), ('records', as_records)):
+        rows, elapsed, size = measure(func, args.count)
+        out = io.StringIO()
+        t0 = time.perf_counter()
+        write_csv(rows, headers="keys", file=out)
+        t_csv = time.perf_counter() - t0
+        outputs.append(out.getvalue())
+        del rows
+        print('{:12} {:10.1f} {:12.1f} {:10.1f}'.format(name, elapsed * 1000, size / 1e6, t_csv * 1000))
+
+    print('\nidentical CSV output: {}'.format(outputs[0] == outputs[1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf8 -*-
+
+"""
+benchmarks.bench_replay
+
+Generate synthetic cassettes with big results (50k ledger entries, 50k
+trades and 10k open orders by default) and measure the time spent by the
+subcommands parsing and rendering them, replayed offline (see
+clikraken.cassette), phase by phase (see clikraken.timings).
+
+The cassettes are generated in DIR (a temporary directory by default)
+unless they already exist there, and can be replayed by hand:
+
+    python benchmarks/bench_replay.py [-d DIR] [--ledgers COUNT] [--trades COUNT] [--orders COUNT]
+    clikraken --replay DIR/ledgers_50000.jsonl.gz --timings ledgers --all
+
+Licensed under the Apache License, Version 2.0. See the LICENSE file.
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import tempfile
+
+import clikraken.global_vars as gv
+from clikraken.cassette import cassette_entry, open_cassette
+from clikraken.clikraken import execute
+from clikraken.clikraken_cmd import parse_args
+from clikraken.clikraken_utils import load_config
+from clikraken.timings import Timings
+
+START = 1500000000
+ASSETS = [('XXBT', 'XXBTZEUR', 9000.0), ('XETH', 'XETHZEUR', 300.0), ('XLTC', 'XLTCZEUR', 60.0)]
+
+
+def ledgers_result(count, rand):
+    ledger = {}
+    for i in range(count):
+        asset, _, price = rand.choice(ASSETS)
+        amount = rand.uniform(-1, 1)
+        ledger['L{:06d}-ABCDE-FGHIJK'.format(i)] = {
+            'refid': 'T{:06d}-ABCDE-FGHIJK'.format(i), 'time': START + i * 60.1234, 'type': 'trade',
+            'subtype': '', 'aclass': 'currency', 'asset': asset, 'amount': '{:.10f}'.format(amount),
+            'fee': '{:.10f}'.format(abs(amount) * 0.0026), 'balance': '{:.10f}'.format(rand.uniform(0, 100)),
+        }
+    return {'ledger': ledger, 'count': count}
+
+
+def trades_result(count, rand):
+    trades = {}
+    for i in range(count):
+        _, pair, price = rand.choice(ASSETS)
+        vol = rand.uniform(0.01, 2)
+        price *= rand.uniform(0.9, 1.1)
+        trades['T{:06d}-ABCDE-FGHIJK'.format(i)] = {
+            'ordertxid': 'O{:06d}-ABCDE-FGHIJK'.format(i), 'postxid': 'TKH2SE-M7IF5-CFI7LT', 'pair': pair,
+            'time': START + i * 60.1234, 'type': rand.choice(['buy', 'sell']), 'ordertype': 'limit',
+            'price': '{:.5f}'.format(price), 'cost': '{:.5f}'.format(price * vol),
+            'fee': '{:.5f}'.format(price * vol * 0.0026), 'vol': '{:.8f}'.format(vol), 'margin': '0.00000',
+            'misc': '',
+        }
+    return {'trades': trades, 'count': count}
+
+
+def open_orders_result(count, rand):
+    orders = {}
+    for i in range(count):
+        _, pair, price = rand.choice(ASSETS)
+        otype = rand.choice(['buy', 'sell'])
+        vol = rand.uniform(0.01, 2)
+        price *= rand.uniform(0.8, 0.99) if otype == 'buy' else rand.uniform(1.01, 1.2)
+        orders['O{:06d}-ABCDE-FGHIJK'.format(i)] = {
+            'refid': None, 'userref': 0, 'status': 'open', 'opentm': START + i * 60.1234, 'starttm': 0,
+            'expiretm': 0, 'vol': '{:.8f}'.format(vol), 'vol_exec': '0.00000000', 'cost': '0.00000',
+            'fee': '0.00000', 'price': '0.00000', 'stopprice': '0.00000', 'limitprice': '0.00000',
+            'misc': '', 'oflags': 'fciq',
+            'descr': {'pair': pair[1:4] + pair[5:], 'type': otype, 'ordertype': 'limit',
+                      'price': '{:.1f}'.format(price), 'price2': '0', 'leverage': 'none', 'close': '',
+                      'order': '{} {:.8f} {} @ limit {:.1f}'.format(otype, vol, pair, price)},
+        }
+    return {'open': orders}
+
+
+def write_cassette(path, method, params, result):
+    with open_cassette(path, 'w') as f:
+        f.write(cassette_entry('private', method, params, {'error': [], 'result': result}) + '\n')
+
+
+def make_cassettes(directory, counts):
+    """Generate the synthetic cassettes which don't exist yet, and return their paths"""
+    # parameters of the queries of the subcommands by default
+    makers = {'ledgers': ('Ledgers', {'asset': 'all', 'type': 'all'}, ledgers_result),
+              'trades': ('TradesHistory', {'type': 'all'}, trades_result),
+              'orders': ('OpenOrders', {}, open_orders_result)}
+    paths = {}
+    for name, count in counts.items():
+        paths[name] = os.path.join(directory, '{}_{}.jsonl.gz'.format(name, count))
+        if not os.path.exists(paths[name]):
+            method, params, make_result = makers[name]
+            write_cassette(paths[name], method, params, make_result(count, random.Random(42)))
+    return paths
+
+
+def replay(cassette, argv):
+    """Run a subcommand replaying a cassette and return its timings"""
+    gv.KRAKEN_API = None
+    gv.ASSET_PAIRS_INDEX = None
+    timings = Timings()
+    args = parse_args(['--replay', cassette, '--timings'] + argv)
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        try:
+            execute(args, timings)
+        except SystemExit:
+            pass
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='clikraken offline replay benchmark')
+    parser.add_argument('-d', '--dir', help='directory of the cassettes (default: temporary directory)')
+    parser.add_argument('--ledgers', type=int, default=50000, help='number of ledger entries')
+    parser.add_argument('--trades', type=int, default=50000, help='number of trades')
+    parser.add_argument('--orders', type=int, default=10000, help='number of open orders')
+    args = parser.parse_args()
+
+    load_config()
+    gv.TIMINGS_FILE = ''
+
+    with contextlib.ExitStack() as stack:
+        directory = args.dir or stack.enter_context(tempfile.TemporaryDirectory())
+        os.makedirs(directory, exist_ok=True)
+        paths = make_cassettes(directory, {'ledgers': args.ledgers, 'trades': args.trades, 'orders': args.orders})
+
+        commands = [
+            (paths['ledgers'], ['ledgers', '--all']),
+            (paths['ledgers'], ['--csv', 'ledgers', '--all']),
+            (paths['trades'], ['trades', '--all']),
+            (paths['trades'], ['--csv', 'trades', '--all']),
+            (paths['orders'], ['olist']),
+            (paths['orders'], ['--csv', 'olist']),
+        ]
+
+        phases = ['load_api_keyfile', 'json', 'command', 'tabulate']
+        print('{:24}'.format('') + ''.join('{:>18}'.format(p + ' [ms]') for p in phases + ['total']))
+        for cassette, argv in commands:
+            timings = replay(cassette, argv)
+            walls = [timings.phases.get(p, [0, 0.0, 0.0])[1] for p in phases] + [timings.totals()[0]]
+            print('{:24}'.format(' '.join(argv)) + ''.join('{:18.1f}'.format(w * 1000) for w in walls))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf8 -*-
+
+"""
+benchmarks.bench_startup
+
+Measure the cold start time of clikraken for each subcommand
+and give a breakdown of the import time of the heaviest modules.
+
+Each measurement spawns a fresh Python interpreter and calls the subcommand
+with `--help`, so that no request is sent to Kraken's API. The time measured
+is thus the time spent starting Python, importing the modules and parsing
+the arguments.
+
+Usage:
+
+    python benchmarks/bench_startup.py [-n RUNS] [-t TOP]
+
+Licensed under the Apache License, Version 2.0. See the LICENSE file.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SUBCOMMANDS = [
+    None,  # only `clikraken -V`
+    'generate_settings',
+    'asset_pairs', 'ticker', 'depth', 'last_trades', 'ohlc',
+    'balance', 'trade_balance', 'place', 'cancel', 'olist', 'positions',
+    'clist', 'ledgers', 'trades', 'deposit_methods', 'deposit_addresses',
+]
+
+# modules that should never be imported just to parse the command line
+HEAVY_MODULES = ['arrow', 'tabulate', 'krakenex', 'requests']
+
+
+def _cmd(subcommand):
+    base = [sys.executable, '-m', 'clikraken']
+    if subcommand is None:
+        return base + ['-V']
+    return base + [subcommand, '--help']
+
+
+def _env():
+    # use an empty settings path in order to not depend on the local setup
+    env = dict(os.environ)
+    env.setdefault('CLIKRAKEN_USER_SETTINGS_PATH', os.devnull)
+    return env
+
+
+def time_subcommand(subcommand, runs):
+    """Return the list of wall times (in ms) of `runs` cold starts of a subcommand"""
+    timings = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        subprocess.run(_cmd(subcommand), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                       env=_env(), check=True)
+        timings.append((time.perf_counter() - t0) * 1000)
+    return timings
+
+
+def import_breakdown(subcommand):
+    """Return a list of (cumulative_us, self_us, module) as reported by `python -X importtime`"""
+    cmd = _cmd(subcommand)
+    cmd.insert(1, '-X')
+    cmd.insert(2, 'importtime')
+    proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                          env=_env(), universal_newlines=True, check=True)
+    entries = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        entries.append((int(cumulative_us), int(self_us), module.rstrip()))
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description='clikraken startup benchmark')
+    parser.add_argument('-n', '--runs', type=int, default=5, help='number of cold starts per subcommand')
+    parser.add_argument('-t', '--top', type=int, default=15, help='number of modules in the import breakdown')
+    args = parser.parse_args()
+
+    print('Cold start time per subcommand ({} runs, --help only)\n'.format(args.runs))
+    print('{:20} {:>10} {:>10} {:>10}'.format('subcommand', 'min [ms]', 'median', 'max'))
+    for subcommand in SUBCOMMANDS:
+        t = time_subcommand(subcommand, args.runs)
+        print('{:20} {:10.1f} {:10.1f} {:10.1f}'.format(
+            subcommand or '-V', min(t), statistics.median(t), max(t)))
+
+    for subcommand in (None, 'ticker'):
+        entries = import_breakdown(subcommand)
+        loaded = [m for m in HEAVY_MODULES if any(e[2].strip() == m for e in entries)]
+        print('\nImport time breakdown for `clikraken {}` (top {} by cumulative time)\n'.format(
+            subcommand + ' --help' if subcommand else '-V', args.top))
+        print('{:>12} {:>12}  {}'.format('cumul. [us]', 'self [us]', 'module'))
+        for cumulative_us, self_us, module in sorted(entries, reverse=True)[:args.top]:
+            print('{:12d} {:12d}  {}'.format(cumulative_us, self_us, module))
+        print('\nHeavy modules loaded: {}'.format(', '.join(loaded) or 'none'))
+
+
+if __name__ == '__main__':
+    main()
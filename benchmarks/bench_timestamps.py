@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf8 -*-
+
+"""
+benchmarks.bench_timestamps
+
+Compare the time needed to format and humanize a column of timestamps
+with arrow (one Arrow object per timestamp, as clikraken used to do) and
+with clikraken.timestamp_utils, and check that the outputs are identical.
+
+The timestamps are spread over the last year, like a big ledger export.
+
+Usage:
+
+    python benchmarks/bench_timestamps.py [-n COUNT] [-z TIMEZONE]
+
+Licensed under the Apache License, Version 2.0. See the LICENSE file.
+"""
+
+import argparse
+import random
+import time
+
+import arrow
+
+from clikraken.timestamp_utils import TimestampFormatter, humanize_many
+
+
+def arrow_format(timestamps, tz):
+    return [arrow.get(ts).to(tz).replace(microsecond=0).format('YYYY-MM-DD HH:mm:ssZZ') for ts in timestamps]
+
+
+def arrow_humanize(timestamps, tz):
+    return [arrow.get(ts).humanize() for ts in timestamps]
+
+
+def fast_format(timestamps, tz):
+    return TimestampFormatter(tz).format_many(timestamps)
+
+
+def fast_humanize(timestamps, tz):
+    return humanize_many(timestamps)
+
+
+def timed(func, *args):
+    t0 = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='clikraken timestamp formatting benchmark')
+    parser.add_argument('-n', '--count', type=int, default=100000, help='number of timestamps')
+    parser.add_argument('-z', '--tz', default='Europe/Berlin', help='timezone')
+    args = parser.parse_args()
+
+    now = time.time()
+    timestamps = sorted(random.uniform(now - 365 * 86400, now) for _ in range(args.count))
+
+    print('{} timestamps, timezone {}\n'.format(args.count, args.tz))
+    print('{:10} {:>12} {:>12} {:>10}  {}'.format('', 'arrow [ms]', 'new [ms]', 'speedup', 'identical'))
+    for name, old, new in (('format', arrow_format, fast_format),
+                           ('humanize', arrow_humanize, fast_humanize)):
+        expected, t_old = timed(old, timestamps, args.tz)
+        result, t_new = timed(new, timestamps, args.tz)
+        print('{:10} {:12.1f} {:12.1f} {:9.1f}x  {}'.format(
+            name, t_old * 1000, t_new * 1000, t_old / t_new, result == expected))
+
+
+if __name__ == '__main__':
+    main()
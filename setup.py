@@ -36,6 +36,16 @@ setup(
         'tabulate',
         'colorlog',
     ],
+    extras_require={
+        # streaming market data from the WebSocket API (--stream options)
+        'websocket': ['websocket-client'],
+        # asyncio client (clikraken.api.async_client)
+        'async': ['aiohttp'],
+        # typed Parquet/Arrow output (--output options)
+        'columnar': ['pyarrow'],
+        # technical indicators (ohlc --indicators)
+        'indicators': ['numpy'],
+    },
     classifiers=[
         "Programming Language :: Python",
         "Development Status :: 4 - Beta",
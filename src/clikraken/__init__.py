@@ -1,4 +1,9 @@
-from clikraken.__about__ import (
+import time as _time
+
+# start of the imports of clikraken, for the timings (see clikraken.timings)
+_import_start = (_time.perf_counter(), _time.process_time())
+
+from clikraken.__about__ import (  # noqa: E402
     __title__, __summary__, __url__, __version__,
     __author__, __email__, __license__,
 )
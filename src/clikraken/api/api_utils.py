@@ -9,28 +9,42 @@ with or processing data from Kraken's API.
 Licensed under the Apache License, Version 2.0. See the LICENSE file.
 """
 
-import http.client
-import requests.exceptions
-import socket
-from collections import OrderedDict
-
-import krakenex
+import copy
+import json
 import os
+import socket
+import sys
+import threading
+import time
 
 import clikraken.global_vars as gv
-from clikraken.clikraken_utils import format_timestamp, print_results
+from clikraken.api.nonce import setup_nonce_allocator
+from clikraken.api.rate_limiter import setup_rate_limiter
+from clikraken.api.retry import (classify_failure, log_retry, reconcile, record_placed_orders, setup_retry_policy,
+                                 should_retry)
+from clikraken.clikraken_utils import _tabulate as tabulate
+from clikraken.clikraken_utils import write_csv, format_timestamp, print_results
 from clikraken.log_utils import logger
+from clikraken.records import ClosedOrder, OpenOrder
+from clikraken.timings import timed
+
+# thread local storage for the API objects used by the worker threads
+_thread_local = threading.local()
 
 
 def load_api_keyfile():
     """Load the Kraken API keyfile"""
 
+    # krakenex (and requests through it) is imported here rather than at the
+    # module level so that it is only loaded when the API is actually needed.
+    from clikraken.api.kraken_api import KrakenAPI
+
     if not os.path.exists(gv.KRAKEN_API_KEYFILE):
         logger.warning("The API keyfile {} was not found!".format(gv.KRAKEN_API_KEYFILE))
         gv.API_KEY_LOADED = False
 
     # Instanciate the krakenex module to communicate with Kraken's API
-    gv.KRAKEN_API = krakenex.API()
+    gv.KRAKEN_API = KrakenAPI()
 
     if gv.API_KEY_LOADED is None:
         # Load the API key of the user
@@ -40,28 +54,121 @@ def load_api_keyfile():
         else:
             gv.API_KEY_LOADED = False
 
+    # Client-side rate limiting of the queries
+    try:
+        gv.RATE_LIMITER = setup_rate_limiter(gv.API_TIER, gv.RATE_LIMIT_FILE)
+    except ValueError as e:
+        logger.error('{} Rate limiting disabled.'.format(e))
+        gv.RATE_LIMITER = None
 
-def query_api(api_type, api_method, api_params, args):
+    # Nonces shared with the other clikraken processes
+    gv.NONCE_ALLOCATOR = setup_nonce_allocator(gv.NONCE_FILE)
+
+    # Retries of the failed queries
+    gv.RETRY_POLICY = setup_retry_policy(gv.MAX_RETRIES, gv.RETRY_BACKOFF)
+
+
+def _get_api():
+    """Return the krakenex API object to be used by the current thread"""
+    return getattr(_thread_local, 'api', None) or gv.KRAKEN_API
+
+
+def query_kraken(api_type, api_method, api_params, json_body=False):
     """
-    Wrapper to query Kraken's API through krakenex
-    and handle connection errors.
+    Query Kraken's API through krakenex and handle connection errors.
+
+    Errors are logged and the full response is returned
+    (an empty dict in case of connection error).
+
+    With json_body, the parameters of a private query are sent as
+    JSON (required by some methods, e.g. CancelOrderBatch).
+
+    Failed queries are sent again when it is safe (see clikraken.api.retry
+    and the settings max_retries and retry_backoff); only the error of the
+    last attempt is logged.
     """
 
-    # Abort here if the API key isn't available and we are trying to query the private API
-    if api_type == 'private' and not gv.API_KEY_LOADED:
-        logger.critical('The API key must be set for private API queries! Aborting...')
-        exit(2)
+    import http.client
+    import requests.exceptions
+
+    network_errors = (socket.timeout, socket.error, http.client.BadStatusLine, requests.exceptions.HTTPError)
 
     # default to empty dict because that's the expected return type
     res = {}
+    exc = None
+
+    api = _get_api()
 
     # just a mapping from api_type to the function to be called
     api_func = {
-        'public': gv.KRAKEN_API.query_public,
-        'private': gv.KRAKEN_API.query_private
+        'public': 'query_public',
+        'private': 'query_private_json' if json_body else 'query_private'
     }
     # select the appropriate method depending on the api_type string
-    func = api_func.get(api_type)
+    func = getattr(api, api_func[api_type]) if api_type in api_func else None
+
+    policy = gv.RETRY_POLICY
+    retries = 0
+    start = time.perf_counter()
+    sent = time.time()
+
+    while func is not None:
+        # wait here if the query would exceed Kraken's rate limit
+        if gv.RATE_LIMITER is not None:
+            with timed('rate_limit'):
+                gv.RATE_LIMITER.acquire(api_type, api_method)
+
+        res, exc = {}, None
+        try:
+            # call to the krakenex API
+            res = func(api_method, api_params)
+        except Exception as e:
+            exc = e
+
+        penalize_rate_limit(api_type, res)
+
+        kind, reason = classify_failure(res, exc, network_errors)
+        safe = should_retry(policy, retries, kind, api_type, api_method, api_params)
+        if safe is None:
+            break
+
+        delay = policy.delay(retries)
+        retries += 1
+        if gv.DEBUG:
+            log_retry(api_method, reason, retries, policy, delay)
+        with timed('retry_wait'):
+            policy.sleep(delay)
+
+        if not safe:
+            # the query may have been processed, check it before sending it again
+            known, reconciled = reconcile(api_method, api_params, sent, query_kraken)
+            if not known:
+                break
+            if reconciled is not None:
+                if gv.DEBUG:
+                    logger.debug('{} was processed despite the failure'.format(api_method))
+                res, exc = reconciled, None
+                break
+
+    if exc is not None:
+        log_query_exception(exc, network_errors)
+
+    record_placed_orders(api_method, res)
+    log_api_errors(api_type, res)
+
+    if gv.DEBUG and func is not None:
+        logger.debug('{} took {:.0f} ms{}'.format(
+            api_method, (time.perf_counter() - start) * 1000,
+            ' ({} retries)'.format(retries) if retries else ''))
+
+    return res
+
+
+def log_query_exception(e, network_errors):
+    """
+    Log an exception raised while querying Kraken's API, depending on its kind:
+    network errors (the given exception classes), invalid responses or anything else.
+    """
 
     # if cron mode is active, tone down some connection related errors in order to
     # not raise too many cron emails when Kraken is temporarily not available
@@ -70,21 +177,20 @@ def query_api(api_type, api_method, api_params, args):
     else:
         log = logger.error
 
-    if func is not None:
-        try:
-            # call to the krakenex API
-            res = func(api_method, api_params)
-        except (socket.timeout, socket.error,
-                http.client.BadStatusLine, requests.exceptions.HTTPError) as e:
-            log('Network error while querying Kraken API!')
-            log('Error details: ' + repr(e))
-        except ValueError as e:
-            log('Invalid response from Kraken API! '
-                '(This can happen when Kraken API is overloaded. '
-                'Try your luck again later.)')
-            log('Error details: ' + repr(e))
-        except Exception:
-            logger.exception('Exception while querying Kraken API!')
+    if isinstance(e, network_errors):
+        log('Network error while querying Kraken API!')
+        log('Error details: ' + repr(e))
+    elif isinstance(e, ValueError):
+        log('Invalid response from Kraken API! '
+            '(This can happen when Kraken API is overloaded. '
+            'Try your luck again later.)')
+        log('Error details: ' + repr(e))
+    else:
+        logger.error('Exception while querying Kraken API!', exc_info=e)
+
+
+def log_api_errors(api_type, res):
+    """Log the errors reported in a response of Kraken's API"""
 
     err = res.get('error', [])
     for e in err:
@@ -96,6 +202,30 @@ def query_api(api_type, api_method, api_params, args):
             log = logger.error
         log('{}'.format(e))
 
+
+def penalize_rate_limit(api_type, res):
+    """Resynchronize our model of the rate limit with Kraken's if a response reports that it was exceeded"""
+    if gv.RATE_LIMITER is not None and 'EAPI:Rate limit exceeded' in res.get('error', []):
+        gv.RATE_LIMITER.penalize(api_type)
+
+
+def _check_api_key(api_type):
+    """Abort here if the API key isn't available and we are trying to query the private API"""
+    if api_type == 'private' and not gv.API_KEY_LOADED:
+        logger.critical('The API key must be set for private API queries! Aborting...')
+        exit(2)
+
+
+def query_api(api_type, api_method, api_params, args):
+    """
+    Wrapper to query Kraken's API through krakenex
+    and handle connection errors.
+    """
+
+    _check_api_key(api_type)
+
+    res = query_kraken(api_type, api_method, api_params)
+
     if args.raw:
         print_results(res)
         if not args.debug:
@@ -108,12 +238,206 @@ def query_api(api_type, api_method, api_params, args):
     return res
 
 
-def parse_order_res(in_ol, status_list_filter=None):
+class IncompleteResultsError(Exception):
+    """Raised when fetching several pages of results failed before the end"""
+
+
+class NoResultsError(IncompleteResultsError):
+    """Raised when fetching several pages of results failed from the first page"""
+
+
+def query_api_pages(api_type, api_method, api_params, result_key, args, time_key='time'):
+    """
+    Query all the pages of results of a method returning at most 50 results
+    at a time, most recent first (Ledgers, TradesHistory, ClosedOrders).
+
+    Yield the dict of results (result[result_key]) of each page. The pages are
+    walked by setting the `end` parameter to the oldest entry of the previous page,
+    which unlike `ofs` is not affected by new entries appearing in the meantime.
+    Since `end` is inclusive, the entries already yielded (this one, and the other
+    ones with the same time) are dropped from the next pages.
+    The pace of the queries is controlled by the rate limiter.
+
+    Raise NoResultsError if the first query fails, IncompleteResultsError if a
+    query fails after the first page.
+    """
+
+    _check_api_key(api_type)
+
+    params = dict(api_params)
+    first_page = True
+    seen = set()
+
+    while True:
+        res = query_kraken(api_type, api_method, params).get('result')
+        if res is None:
+            if first_page:
+                raise NoResultsError('Could not fetch the {} results!'.format(api_method))
+            raise IncompleteResultsError('Stopped fetching {} results before the end!'.format(api_method))
+
+        page = res.get(result_key) or {}
+        new_entries = {k: v for k, v in page.items() if k not in seen}
+        if not new_entries:
+            # nothing left but the entries of the previous pages
+            return
+
+        seen.update(new_entries)
+        yield new_entries
+
+        # 'count' is the number of results matching the query, including this page
+        if len(page) >= int(res.get('count', 0)):
+            return
+
+        # continue from the oldest entry of the page (end is inclusive)
+        params['end'] = min(page, key=lambda k: float(page[k][time_key]))
+        params.pop('ofs', None)
+        first_page = False
+
+
+def _log_incomplete(pages):
+    """
+    Pass the pages through, only logging an error if they are incomplete.
+    Exit if there is no result at all (the error of the query is already logged).
+    """
+    try:
+        for page in pages:
+            yield page
+    except NoResultsError:
+        exit(0)
+    except IncompleteResultsError as e:
+        logger.error(str(e))
+
+
+def print_pages(pages, parse_page, sort_key, args, writer=None):
+    """
+    Output the entries of pages of results (see query_api_pages).
+
+    In raw and CSV mode, or to a columnar writer (see clikraken.columnar), the
+    entries are streamed as the pages arrive (one JSON object per line in raw
+    mode, one batch per page with a writer), from the most recent to the oldest.
+    Otherwise they are collected and output as one table sorted with sort_key.
+
+    parse_page(page, typed=False) returns the rows of a page.
+    """
+
+    pages = _log_incomplete(pages)
+
+    if args.raw:
+        for page in pages:
+            for key, entry in page.items():
+                print(json.dumps({key: entry}))
+            sys.stdout.flush()
+        return
+
+    if writer is not None:
+        with writer:
+            for page in pages:
+                writer.write(sorted(parse_page(page, typed=True), key=sort_key, reverse=True))
+        return
+
+    if args.csv:
+        headers = "keys"
+        for page in pages:
+            rows = sorted(parse_page(page), key=sort_key, reverse=True)
+            if write_csv(rows, headers=headers):
+                # headers are only output once
+                headers = None
+        return
+
+    rows = []
+    for page in pages:
+        rows.extend(parse_page(page))
+
+    if rows:
+        print(tabulate(sorted(rows, key=sort_key), headers="keys"))
+
+
+def _query_in_thread(api_type, api_method, api_params, json_body=False):
+    """Run query_kraken with an API object dedicated to the current thread"""
+    if getattr(_thread_local, 'api', None) is None:
+        # krakenex.API objects store the last response as an attribute, so they
+        # can't be shared between threads. The shallow copy still shares the
+        # keep-alive HTTP session (and the API key) with the main API object.
+        _thread_local.api = copy.copy(gv.KRAKEN_API)
+    return query_kraken(api_type, api_method, api_params, json_body)
+
+
+def query_kraken_concurrently(api_type, api_method, api_params_list, json_body=False):
+    """
+    Run query_kraken several times with different parameters and return the responses.
+
+    The queries are run concurrently in a bounded thread pool (see the setting
+    max_concurrent_queries) sharing the same HTTP session. The responses are
+    returned in the same order as api_params_list.
+    """
+
+    max_workers = max(1, min(gv.MAX_CONCURRENT_QUERIES, len(api_params_list)))
+
+    if max_workers == 1:
+        responses = [query_kraken(api_type, api_method, p, json_body) for p in api_params_list]
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        import requests.adapters
+
+        # make sure that the HTTP connection pool is big enough for all the workers
+        session = gv.KRAKEN_API.session
+        if getattr(session.get_adapter(gv.KRAKEN_API.uri), '_pool_maxsize', 0) < max_workers:
+            session.mount(gv.KRAKEN_API.uri, requests.adapters.HTTPAdapter(pool_maxsize=max_workers))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            responses = list(executor.map(
+                lambda p: _query_in_thread(api_type, api_method, p, json_body), api_params_list))
+
+    return responses
+
+
+def query_api_concurrently(api_type, api_method, api_params_list, args):
+    """
+    Query the same method of Kraken's API several times with different parameters
+    (concurrently, see query_kraken_concurrently).
+
+    The results are returned in the same order as api_params_list.
+    If a query fails, its result is None.
+    """
+
+    _check_api_key(api_type)
+
+    responses = query_kraken_concurrently(api_type, api_method, api_params_list)
+
+    if args.raw:
+        for res in responses:
+            print_results(res)
+        if not args.debug:
+            exit(0)
+
+    results = [res.get('result') or None for res in responses]
+    if not any(results):
+        exit(0)
+
+    return results
+
+
+def get_pair_result(res, pair):
+    """
+    Extract the data for an asset pair from the results of a Depth, OHLC or Trades query.
+
+    Kraken always uses the full asset pair name in the results (e.g. XETHZEUR),
+    even if the query used the alternative name (e.g. ETHEUR).
+    """
+    if pair in res:
+        return res[pair]
+    return next(v for k, v in res.items() if k != 'last')
+
+
+def parse_order_res(in_ol, status_list_filter=None, typed=False):
     """
     Helper to parse the order results from the API.
 
     Depending on the status of the orders, different
-    properties are available.
+    properties are available: open orders are parsed into
+    OpenOrder records, the other ones into ClosedOrder records.
+    With typed, the dates are kept as given by the API (see
+    clikraken.columnar).
 
     See Kraken's API documentation for details.
     """
@@ -121,70 +445,35 @@ def parse_order_res(in_ol, status_list_filter=None):
     # we will store the buy and sell orders separately during parsing
     ol = {'buy': [], 'sell': []}
 
-    date_field = {
-        'open': 'opentm',
-        'closed': 'closetm',
-        'canceled': 'closetm',
-        'expired': 'closetm'
-    }
-
-    date_label = {
-        'open': 'opening_date',
-        'closed': 'closing_date',
-        'canceled': 'closing_date',
-        'expired': 'closing_date'
-    }
-
     # status_list_filter is an optional argument of type list
     # the default value can't be set in the function signature
     if status_list_filter is None:
         status_list_filter = ['open', 'closed']
 
-    # iterate over the given order list
-    for txid in in_ol:
-        # extract the current order dict
-        o = in_ol[txid]
+    date = (lambda ts: ts) if typed else format_timestamp
 
+    # iterate over the given order list
+    for txid, o in in_ol.items():
         ostatus = o['status']
 
-        # We store the parsed orders in an OrderedDict to garantee
-        # the order of columns for use later in the tabulate function.
-        # (one key == "one column")
-        odict = OrderedDict()
-
-        odict['orderid'] = txid
-        odict['status'] = ostatus
-        odict['type'] = o['descr']['type']
-        odict['vol'] = o['vol']
-
-        # Volume executed is only available if the order isn't open
-        # TODO: check if that's really true
-        if ostatus != 'open':
-            odict['vol_exec'] = o['vol_exec']
+        # filter here based on the list of status that we want
+        if ostatus not in status_list_filter:
+            continue
 
-        odict['pair'] = o['descr']['pair']
-        odict['ordertype'] = o['descr']['ordertype']
+        descr = o['descr']
+        viqc = 'viqc' in o['oflags']  # boolean check
 
-        # If the order is open, take the price from the order description
-        # if the order is closed, take the average price
         if ostatus == 'open':
-            odict['price'] = o['descr']['price']
+            # If the order is open, take the price from the order description
+            order = OpenOrder(txid, ostatus, descr['type'], o['vol'], descr['pair'], descr['ordertype'],
+                              descr['price'], viqc, date(o['opentm']))
         else:
-            odict['price'] = o['price']
-
-        # Cost and Fee are only available if the order isn't open
-        if ostatus != 'open':
-            odict['cost'] = o['cost']
-            odict['fee'] = o['fee']
+            # if the order is closed, take the average price. The executed volume,
+            # cost and fee are only available if the order isn't open.
+            order = ClosedOrder(txid, ostatus, descr['type'], o['vol'], o['vol_exec'], descr['pair'],
+                                descr['ordertype'], o['price'], o['cost'], o['fee'], viqc,
+                                date(o['closetm']))
 
-        odict['viqc'] = ('viqc' in o['oflags'])  # boolean check
-
-        # date_label[ostatus] is the column name and changes
-        # depending on the status of the order.
-        odict[date_label[ostatus]] = format_timestamp(o[date_field[ostatus]])
-
-        # filter here based on the list of status that we want
-        if ostatus in status_list_filter:
-            ol.get(odict['type']).append(odict)
+        ol[order.type].append(order)
 
     return ol
@@ -0,0 +1,131 @@
+# -*- coding: utf8 -*-
+
+"""
+clikraken.api.asset_pairs_index
+
+This module keeps a cache of the results of the AssetPairs method
+of Kraken's API on disk, and builds an index from it mapping the
+different names of an asset pair (pair name, altname and wsname)
+to its canonical name and short base and quote names.
+
+Licensed under the Apache License, Version 2.0. See the LICENSE file.
+"""
+
+import json
+import os
+import time
+
+import clikraken.global_vars as gv
+from clikraken.log_utils import logger
+
+
+def asset_short(asset):
+    """Remove the leading Z or X of an asset name of length 4 (XXBT -> XBT, ZEUR -> EUR)"""
+    return asset[1:] if len(asset) == 4 and asset[0] in ['Z', 'X'] else asset
+
+
+def build_pair_index(asset_pairs):
+    """
+    Build the index of asset pairs from the results of the AssetPairs method.
+
+    The keys are the upper case names of the asset pairs (pair name, altname and wsname)
+    and the values are tuples (pair name, short base name, short quote name).
+    """
+
+    index = {}
+
+    for pair, info in asset_pairs.items():
+        # skip the dark pools
+        if pair.endswith('.d'):
+            continue
+
+        wsname = info.get('wsname')
+        if wsname and '/' in wsname:
+            base, quote = wsname.split('/', 1)
+        else:
+            base, quote = asset_short(info['base']), asset_short(info['quote'])
+
+        entry = (pair, base, quote)
+        for name in (pair, info.get('altname'), wsname):
+            if name:
+                index[name.upper()] = entry
+
+    return index
+
+
+def cache_enabled():
+    """Return True if the AssetPairs results are cached (setting asset_pairs_cache_ttl)"""
+    return bool(gv.ASSET_PAIRS_CACHE_TTL) and gv.ASSET_PAIRS_CACHE_TTL > 0
+
+
+def read_cache(max_age=None):
+    """
+    Return the cached AssetPairs results, or None if there is no cache
+    or if it is older than max_age seconds.
+    """
+
+    try:
+        with open(gv.ASSET_PAIRS_CACHE_PATH) as f:
+            cache = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+    if max_age is not None and time.time() - cache.get('timestamp', 0) > max_age:
+        return None
+
+    return cache.get('result')
+
+
+def write_cache(asset_pairs):
+    """Store AssetPairs results in the cache file"""
+
+    cache = {
+        'timestamp': time.time(),
+        'result': asset_pairs,
+    }
+
+    try:
+        os.makedirs(os.path.dirname(gv.ASSET_PAIRS_CACHE_PATH), exist_ok=True)
+        # write to a temporary file first so that other processes never read a partial file
+        tmp_path = '{}.{}.tmp'.format(gv.ASSET_PAIRS_CACHE_PATH, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, gv.ASSET_PAIRS_CACHE_PATH)
+    except (IOError, OSError) as e:
+        logger.debug('Could not write the asset pairs cache: {}'.format(e))
+
+
+def load_asset_pairs(refresh=False):
+    """
+    Return the results of the AssetPairs method, from the cache if it is fresh enough.
+
+    Otherwise the API is queried and the cache updated. If the query fails,
+    a stale cache is used if available. Returns None if nothing is available.
+    """
+
+    # imported here to avoid circular imports
+    from clikraken.api.api_utils import query_kraken
+
+    if not refresh and cache_enabled():
+        asset_pairs = read_cache(max_age=gv.ASSET_PAIRS_CACHE_TTL)
+        if asset_pairs:
+            return asset_pairs
+
+    asset_pairs = query_kraken('public', 'AssetPairs', {}).get('result')
+
+    if asset_pairs:
+        if cache_enabled():
+            write_cache(asset_pairs)
+        return asset_pairs
+
+    # better a stale cache than nothing
+    return read_cache()
+
+
+def load_pair_index():
+    """Return the index of asset pairs (empty if the asset pairs are unavailable)"""
+    asset_pairs = load_asset_pairs()
+    if not asset_pairs:
+        logger.debug('Asset pairs unavailable, falling back to guessing base and quote from the pair names.')
+        return {}
+    return build_pair_index(asset_pairs)
@@ -0,0 +1,186 @@
+# -*- coding: utf8 -*-
+
+"""
+clikraken.api.async_client
+
+This module implements an asyncio client of Kraken's REST API, for
+embedding clikraken in asyncio applications without running each
+query in a thread.
+
+The queries are signed like krakenex does, and the failed queries are
+retried and the errors logged like for query_kraken (see
+clikraken.api.retry). All the queries of a client share one pool of
+connections, so many of them can be in flight at the same time.
+
+The results have the same format as with krakenex, so the parsing
+functions of the subcommands can be reused on them, for example:
+
+    from clikraken.api.async_client import AsyncKrakenAPI
+    from clikraken.api.public.depth import parse_depth
+
+    async with AsyncKrakenAPI() as api:
+        res = await api.query('public', 'Depth', {'pair': 'XETHZEUR'})
+        depth = parse_depth('XETHZEUR', res['result'])
+
+The aiohttp package is required (pip install aiohttp).
+
+Licensed under the Apache License, Version 2.0. See the LICENSE file.
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import time
+import urllib.parse
+
+import clikraken.global_vars as gv
+from clikraken.api.api_utils import log_api_errors, log_query_exception, penalize_rate_limit
+from clikraken.api.nonce import next_nonce
+from clikraken.api.retry import classify_failure, log_retry, reconcile_async, record_placed_orders, should_retry
+
+
+def sign(secret, urlpath, data):
+    """Sign the parameters of a query to the private API (same scheme as krakenex)"""
+    postdata = urllib.parse.urlencode(data)
+    encoded = (str(data['nonce']) + postdata).encode()
+    message = urlpath.encode() + hashlib.sha256(encoded).digest()
+    signature = hmac.new(base64.b64decode(secret), message, hashlib.sha512)
+    return base64.b64encode(signature.digest()).decode()
+
+
+class AsyncKrakenAPI(object):
+    """asyncio counterpart of krakenex.API"""
+
+    def __init__(self, key='', secret='', uri='https://api.kraken.com', max_connections=None, timeout=30):
+        self.key = key
+        self.secret = secret
+        self.uri = uri
+        self.apiversion = '0'
+        self.max_connections = max_connections or gv.MAX_CONCURRENT_QUERIES or 8
+        self.timeout = timeout
+        self.session = None
+
+    def load_key(self, path):
+        """Load the key and secret from a file (same format as for krakenex)"""
+        with open(path, 'r') as f:
+            self.key = f.readline().strip()
+            self.secret = f.readline().strip()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _session(self):
+        if self.session is None:
+            import aiohttp
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _nonce(self):
+        """Always increasing nonce, shared with the other clients and processes (see clikraken.api.nonce)"""
+        return next_nonce()
+
+    async def _query(self, urlpath, data, headers=None):
+        url = self.uri + urlpath
+        session = self._session()
+        # public endpoints only support GET
+        if '/public/' in urlpath:
+            request = session.get(url, params=data, headers=headers)
+        else:
+            request = session.post(url, data=data, headers=headers)
+        async with request as response:
+            if response.status not in (200, 201, 202):
+                response.raise_for_status()
+            return json.loads(await response.text())
+
+    async def query_public(self, method, data=None):
+        """Query a method of the public API and return the response (raises on errors, like krakenex)"""
+        urlpath = '/' + self.apiversion + '/public/' + method
+        return await self._query(urlpath, dict(data or {}))
+
+    async def query_private(self, method, data=None):
+        """Query a method of the private API and return the response (raises on errors, like krakenex)"""
+        if not self.key or not self.secret:
+            raise Exception('Either key or secret is not set! (Use `load_key()`.')
+        data = dict(data or {})
+        data['nonce'] = self._nonce()
+        urlpath = '/' + self.apiversion + '/private/' + method
+        headers = {
+            'API-Key': self.key,
+            'API-Sign': sign(self.secret, urlpath, data),
+        }
+        return await self._query(urlpath, data, headers)
+
+    async def query(self, api_type, api_method, api_params=None):
+        """
+        Query Kraken's API like query_kraken does: the queries are rate limited,
+        the failed queries are sent again when it is safe (see the setting max_retries),
+        the errors are logged and the full response is returned
+        (an empty dict in case of connection error).
+        """
+
+        import aiohttp
+
+        network_errors = (aiohttp.ClientError, asyncio.TimeoutError, OSError)
+        func = {'public': self.query_public, 'private': self.query_private}[api_type]
+        api_params = api_params or {}
+
+        policy = gv.RETRY_POLICY
+        retries = 0
+        sent = time.time()
+
+        while True:
+            # wait here if the query would exceed Kraken's rate limit
+            if gv.RATE_LIMITER is not None:
+                await asyncio.sleep(gv.RATE_LIMITER.reserve(api_type, api_method))
+
+            res, exc = {}, None
+            try:
+                res = await func(api_method, api_params)
+            except Exception as e:
+                exc = e
+
+            penalize_rate_limit(api_type, res)
+
+            kind, reason = classify_failure(res, exc, network_errors)
+            safe = should_retry(policy, retries, kind, api_type, api_method, api_params)
+            if safe is None:
+                break
+
+            delay = policy.delay(retries)
+            retries += 1
+            if gv.DEBUG:
+                log_retry(api_method, reason, retries, policy, delay)
+            await asyncio.sleep(delay)
+
+            if not safe:
+                # the query may have been processed, check it before sending it again
+                known, reconciled = await reconcile_async(api_method, api_params, sent, self.query)
+                if not known:
+                    break
+                if reconciled is not None:
+                    res, exc = reconciled, None
+                    break
+
+        if exc is not None:
+            log_query_exception(exc, network_errors)
+
+        record_placed_orders(api_method, res)
+        log_api_errors(api_type, res)
+
+        return res
+
+    async def query_many(self, api_type, api_method, api_params_list):
+        """Send the same query with different parameters concurrently, and return the responses in order"""
+        return await asyncio.gather(*(self.query(api_type, api_method, p) for p in api_params_list))
@@ -0,0 +1,81 @@
+# -*- coding: utf8 -*-
+
+"""
+clikraken.api.kraken_api
+
+This module extends krakenex.API with what clikraken needs on top of it:
+
+- the nonces of the private queries are allocated by clikraken.api.nonce,
+  strictly increasing for all the threads of the process (and the copies
+  of the API object made for them) and all the clikraken processes;
+- queries to the private methods taking a JSON body instead of form data
+  (e.g. CancelOrderBatch), which krakenex doesn't support;
+- the HTTP round trip and the decoding of the JSON response are timed
+  separately (see clikraken.timings).
+
+Licensed under the Apache License, Version 2.0. See the LICENSE file.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+
+import krakenex
+
+from clikraken.api.nonce import next_nonce
+from clikraken.timings import record_request, timed
+
+
+class KrakenAPI(krakenex.API):
+    """krakenex.API with shared nonces, JSON queries and timings"""
+
+    def _nonce(self):
+        return next_nonce()
+
+    def _send(self, urlpath, request):
+        """Send a request (function returning a requests.Response) and decode its JSON response"""
+
+        with timed('http'):
+            self.response = request()
+        record_request(urlpath.rsplit('/', 1)[-1], self.response)
+
+        if self.response.status_code not in (200, 201, 202):
+            self.response.raise_for_status()
+
+        with timed('json'):
+            return self.response.json(**self._json_options)
+
+    def _query(self, urlpath, data, headers=None, timeout=None):
+        # same as krakenex.API._query, through _send
+        url = self.uri + urlpath
+
+        # Since 2024-01-31, public endpoints only support GET.
+        if '/public/' in urlpath:
+            return self._send(urlpath, lambda: self.session.get(
+                url, params=data or {}, headers=headers or {}, timeout=timeout))
+        return self._send(urlpath, lambda: self.session.post(
+            url, data=data or {}, headers=headers or {}, timeout=timeout))
+
+    def query_private_json(self, method, data=None, timeout=None):
+        """Same as query_private, but send the parameters as a JSON body"""
+
+        if not self.key or not self.secret:
+            raise Exception('Either key or secret is not set! (Use `load_key()`.')
+
+        data = dict(data or {})
+        data['nonce'] = self._nonce()
+        body = json.dumps(data)
+
+        urlpath = '/' + self.apiversion + '/private/' + method
+        message = urlpath.encode() + hashlib.sha256((str(data['nonce']) + body).encode()).digest()
+        signature = hmac.new(base64.b64decode(self.secret), message, hashlib.sha512)
+
+        headers = {
+            'API-Key': self.key,
+            'API-Sign': base64.b64encode(signature.digest()).decode(),
+            'Content-Type': 'application/json',
+        }
+
+        return self._send(urlpath, lambda: self.session.post(
+            self.uri + urlpath, data=body, headers=headers, timeout=timeout))
@@ -0,0 +1,105 @@
+# -*- coding: utf8 -*-
+
+"""
+clikraken.api.nonce
+
+This module allocates the nonces of the queries to the private API.
+
+Kraken rejects a query whose nonce isn't greater than the last one
+received for the same API key ("EAPI:Invalid nonce"). The nonces are
+derived from the time in milliseconds, and kept strictly increasing by
+remembering the last one allocated: in memory for the threads of the
+process, and in a state file (protected by a lock) for all the clikraken
+processes of the host, e.g. parallel cron jobs.
+
+The nonces are allocated in order, but concurrent queries may still reach
+Kraken in another order. Set a nonce window for the API key in Kraken's
+settings to accept them.
+
+Licensed under the Apache License, Version 2.0. See the LICENSE file.
+"""
+
+import os
+import threading
+import time
+
+import clikraken.global_vars as gv
+from clikraken.log_utils import logger
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+
+class NonceAllocator(object):
+    """Strictly increasing nonces, optionally shared with other processes through a state file"""
+
+    def __init__(self, state_file=None, clock=time.time):
+        if state_file and fcntl is None:
+            logger.debug('Sharing the nonces between processes is not supported on this platform.')
+            state_file = None
+        self.state_file = state_file
+        self.clock = clock
+        self._last = 0
+        self._lock = threading.Lock()
+
+    def _shared_last(self, nonce):
+        """Return the last nonce allocated by any process, and store nonce instead if greater"""
+        with open(self.state_file, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    last = int(f.read() or 0)
+                except ValueError:
+                    logger.warning('Invalid nonce state file {}, resetting it.'.format(self.state_file))
+                    last = 0
+                nonce = max(nonce, last + 1)
+                f.seek(0)
+                f.truncate()
+                f.write(str(nonce))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return nonce
+
+    def next(self):
+        """Return a nonce greater than all the previous ones"""
+        with self._lock:
+            nonce = max(self._last + 1, int(1000 * self.clock()))
+            if self.state_file:
+                try:
+                    nonce = self._shared_last(nonce)
+                except (IOError, OSError) as e:
+                    logger.warning('Could not use the nonce state file {}: {}'.format(self.state_file, e))
+                    self.state_file = None
+            self._last = nonce
+            return nonce
+
+
+# used when no allocator was set up (see setup_nonce_allocator)
+_default_allocator = NonceAllocator()
+
+
+def setup_nonce_allocator(state_file=''):
+    """
+    Return the nonce allocator corresponding to the settings: shared through state_file,
+    or through a file in the cache directory if empty, or only for this process if "none".
+    """
+    if state_file == 'none':
+        return NonceAllocator()
+    if not state_file:
+        state_file = os.path.join(gv.CACHE_DIR, 'nonce')
+    state_file = os.path.normpath(os.path.expanduser(state_file))
+    try:
+        os.makedirs(os.path.dirname(state_file), exist_ok=True)
+    except OSError as e:
+        logger.warning('Could not create the directory of the nonce state file: {}'.format(e))
+        return NonceAllocator()
+    return NonceAllocator(state_file)
+
+
+def next_nonce():
+    """Return the next nonce of the allocator set up for the process"""
+    return (gv.NONCE_ALLOCATOR or _default_allocator).next()
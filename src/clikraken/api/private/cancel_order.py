@@ -3,31 +3,188 @@
 """
 clikraken.api.private.cancel_order
 
-This module queries the CancelOrder method of Kraken's API
-and outputs the results in a tabular format.
+This module queries the CancelOrderBatch, CancelOrder and CancelAll
+methods of Kraken's API and outputs the results in a tabular format.
+
+The orders to cancel are given by their ids, or selected among the open
+orders (all of them, or those of an asset pair or a user reference).
+They are cancelled by batches of 50 with CancelOrderBatch, all the
+batches being sent concurrently. If a batch fails (or with --no-batch),
+its orders are cancelled with concurrent CancelOrder queries instead.
+
+When Kraken reports less cancelled orders than requested, the status
+of the orders is checked with QueryOrders to know which ones are left.
 
 Licensed under the Apache License, Version 2.0. See the LICENSE file.
 """
 
-from clikraken.api.api_utils import query_api
+import time
+from collections import OrderedDict
+
+from clikraken.api.api_utils import _check_api_key, query_kraken, query_kraken_concurrently
+from clikraken.clikraken_utils import print_results, same_asset_pair
+from clikraken.clikraken_utils import _tabulate as tabulate
+from clikraken.clikraken_utils import write_csv
 from clikraken.log_utils import logger
 
+# maximum number of orders of a CancelOrderBatch or QueryOrders query
+BATCH_SIZE = 50
+
+# result of the cancellation depending on the status of the order (see QueryOrders)
+STATUS_RESULTS = {
+    'canceled': 'cancelled',
+    'closed': 'already closed',
+    'expired': 'expired',
+    'open': 'not cancelled',
+    'pending': 'not cancelled',
+}
+
+
+def _chunks(txids):
+    return [txids[i:i + BATCH_SIZE] for i in range(0, len(txids), BATCH_SIZE)]
+
+
+def _error(res):
+    return ', '.join(res.get('error') or []) or 'no response'
+
+
+def select_orders(args):
+    """Return the ids of the open orders selected with --all, --pair or --userref (None in case of error)"""
+
+    api_params = {}
+    if args.userref is not None:
+        api_params['userref'] = args.userref
+
+    res = query_kraken('private', 'OpenOrders', api_params).get('result')
+    if res is None:
+        return None
+
+    orders = sorted((res.get('open') or {}).items(), key=lambda kv: float(kv[1]['opentm']))
+    return [txid for txid, o in orders if not args.pair or same_asset_pair(o['descr']['pair'], args.pair)]
+
+
+def order_results(txids):
+    """Return {txid: result} of orders from their current status"""
+
+    results = {}
+    responses = query_kraken_concurrently('private', 'QueryOrders', [{'txid': ','.join(c)} for c in _chunks(txids)])
+    for chunk, res in zip(_chunks(txids), responses):
+        orders = res.get('result')
+        for txid in chunk:
+            if orders is None:
+                results[txid] = 'unknown ({})'.format(_error(res))
+            elif txid not in orders:
+                results[txid] = 'unknown order'
+            else:
+                status = orders[txid]['status']
+                results[txid] = STATUS_RESULTS.get(status, status)
+    return results
+
+
+def _checked(txids, count):
+    """Return the results of orders of which Kraken reported count cancelled"""
+    if count >= len(txids):
+        return OrderedDict((txid, 'cancelled') for txid in txids)
+    return order_results(txids)
+
+
+def cancel_batches(txids):
+    """
+    Cancel orders by batches with CancelOrderBatch.
+    Return {txid: result} for the batches which succeeded.
+    """
+
+    results = {}
+    chunks = _chunks(txids)
+    responses = query_kraken_concurrently('private', 'CancelOrderBatch',
+                                          [{'orders': chunk} for chunk in chunks], json_body=True)
+    for chunk, res in zip(chunks, responses):
+        result = res.get('result')
+        if result is None:
+            logger.info('CancelOrderBatch failed, cancelling the orders one by one.')
+            continue
+        results.update(_checked(chunk, int(result.get('count', 0))))
+    return results
+
+
+def cancel_one_by_one(txids):
+    """Cancel orders with concurrent CancelOrder queries, return {txid: result}"""
+
+    responses = query_kraken_concurrently('private', 'CancelOrder', [{'txid': txid} for txid in txids])
+
+    results = {}
+    for txid, res in zip(txids, responses):
+        result = res.get('result')
+        if result is None:
+            results[txid] = _error(res)
+        elif result.get('pending'):
+            results[txid] = 'pending'
+        elif int(result.get('count', 0)):
+            results[txid] = 'cancelled'
+        else:
+            results[txid] = 'not cancelled'
+    return results
+
 
 def cancel_order(args):
-    """Cancel an open order."""
+    """Cancel orders."""
+
+    selectors = args.all or args.pair or args.userref is not None
+    if not args.order_ids and not selectors:
+        logger.error('Give the ids of the orders to cancel, or select them with --all, --pair or --userref.')
+        return
+    if args.all and (args.order_ids or args.pair or args.userref is not None):
+        logger.error('--all cancels all the open orders, it can\'t be combined with other selections.')
+        return
+
+    _check_api_key('private')
+    t0 = time.perf_counter()
+
+    # remove duplicates but keep the order
+    txids = list(OrderedDict.fromkeys(args.order_ids))
+    if selectors:
+        selected = select_orders(args)
+        if selected is None:
+            return
+        txids.extend(txid for txid in selected if txid not in txids)
+        if not txids:
+            logger.info('No open orders to cancel.')
+            return
+
+    if args.raw:
+        # the queries are printed instead of the per-order results
+        if args.all:
+            print_results(query_kraken('private', 'CancelAll', {}))
+        else:
+            for res in query_kraken_concurrently('private', 'CancelOrder', [{'txid': txid} for txid in txids]):
+                print_results(res)
+        return
 
-    for order_id in args.order_ids:
-        # Parameters to pass to the API
-        api_params = {
-            'txid': order_id,
-        }
+    if args.all:
+        res = query_kraken('private', 'CancelAll', {})
+        result = res.get('result')
+        if result is None:
+            results = OrderedDict((txid, _error(res)) for txid in txids)
+        else:
+            results = _checked(txids, int(result.get('count', 0)))
+    else:
+        results = {} if args.no_batch else cancel_batches(txids)
+        left = [txid for txid in txids if txid not in results]
+        if left:
+            results.update(cancel_one_by_one(left))
 
-        res = query_api('private', 'CancelOrder', api_params, args)
+    elapsed = time.perf_counter() - t0
 
-        count = res.get('count')
-        pending = res.get('pending')
+    rows = []
+    for txid in txids:
+        rdict = OrderedDict()
+        rdict['txid'] = txid
+        rdict['result'] = results.get(txid, 'not cancelled')
+        rows.append(rdict)
 
-        if count:
-            print('{} - count: {}'.format(order_id, count))
-        if pending:
-            logger.info('{} - order(s) is/are pending cancellation!'.format(order_id))
+    if args.csv:
+        write_csv(rows, headers="keys")
+    else:
+        print(tabulate(rows, headers="keys"))
+        cancelled = sum(1 for row in rows if row['result'] in ('cancelled', 'pending'))
+        print('\n{} of {} orders cancelled in {:.2f} s'.format(cancelled, len(rows), elapsed))
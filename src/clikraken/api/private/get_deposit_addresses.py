@@ -12,7 +12,7 @@ Licensed under the Apache License, Version 2.0. See the LICENSE file.
 from collections import OrderedDict
 
 from clikraken.api.api_utils import query_api
-from clikraken.clikraken_utils import csv, format_timestamp
+from clikraken.clikraken_utils import write_csv, format_timestamp
 from clikraken.clikraken_utils import _tabulate as tabulate
 
 
@@ -58,6 +58,6 @@ def get_deposit_addresses(args=None):
     addresses_list = sorted(addresses_list, key=lambda odict: odict['expiretm'])
 
     if args.csv:
-        print(csv(addresses_list, headers="keys"))
+        write_csv(addresses_list, headers="keys")
     else:
         print(tabulate(addresses_list, headers="keys"))
@@ -4,24 +4,91 @@
 clikraken.api.private.get_ledgers
 
 This module queries the Ledgers or QueryLedgers method of Kraken's API
-and outputs the results in a tabular format.
+(or the local mirror of the history) and outputs the results in a tabular format.
 
 Licensed under the Apache License, Version 2.0. See the LICENSE file.
 """
 
-from collections import OrderedDict
+from operator import attrgetter
 
-from clikraken.api.api_utils import query_api
+from clikraken.api.api_utils import print_pages, query_api, query_api_pages
+from clikraken.api.asset_pairs_index import asset_short
 from clikraken.clikraken_utils import _tabulate as tabulate
-from clikraken.clikraken_utils import csv
+from clikraken.clikraken_utils import write_csv
 from clikraken.clikraken_utils import format_timestamp
+from clikraken.columnar import record_writer
+from clikraken.history_db import HistoryDB
+from clikraken.records import LedgerEntry
+
+
+def parse_ledgers(lg, typed=False):
+    """Parse a dict of ledger entries from the API into a list of rows."""
+    return list(iter_ledger_rows(lg.items(), typed))
+
+
+def iter_ledger_rows(entries, typed=False):
+    """
+    Generate the rows of an iterable of (id, ledger entry) pairs.
+
+    With typed, the times and amounts are kept as given by the API (see clikraken.columnar).
+    """
+
+    number = str if typed else float
+
+    for refid, item in entries:
+        # Remove leading Z or X from item pair if it is of length 4
+        asset = item['asset']
+        yield LedgerEntry(
+            refid,
+            item['refid'],
+            item['time'] if typed else format_timestamp(int(item['time'])),
+            item['type'],
+            asset[1:] if len(asset) == 4 and asset[0] in ['Z', 'X'] else asset,
+            item['aclass'],
+            number(item['amount']),
+            number(item['fee']),
+            number(item['balance']))
+
+
+def query_local_ledgers(args):
+    """Query the ledgers from the local mirror of the history, as (id, entry) pairs sorted by date."""
+
+    db = HistoryDB()
+    try:
+        yield from db.iter_query(
+            'ledgers',
+            ids=args.id.split(',') if args.id else None,
+            start=args.start,
+            end=args.end,
+            asset=[asset_short(a.strip()) for a in args.asset.split(',')] if args.asset != 'all' else None,
+            type=[args.type] if args.type != 'all' else None)
+    finally:
+        db.close()
 
 
 def get_ledgers(args):
     """Get ledgers info"""
 
+    writer = None
+    if args.output:
+        writer = record_writer(args.output, LedgerEntry)
+        if writer is None:
+            return
+
+    if args.local:
+        entries = query_local_ledgers(args)
+        if writer is not None:
+            # stream the entries straight from the database, in batches
+            with writer:
+                writer.write_all(iter_ledger_rows(entries, typed=True))
+            return
+        if args.csv:
+            # stream the entries (already sorted by date) straight from the database
+            write_csv(iter_ledger_rows(entries), headers="keys")
+            return
+        lg = dict(entries)
     # If id is specified, then query just that
-    if args.id:
+    elif args.id:
         api_params = {
             'id': args.id,
         }
@@ -40,36 +107,31 @@ def get_ledgers(args):
             api_params.update({'end': args.end})
         if args.ofs:
             api_params.update({'ofs': args.ofs})
+
+        if args.all:
+            # walk through all the pages of results
+            pages = query_api_pages('private', 'Ledgers', api_params, 'ledger', args)
+            print_pages(pages, parse_ledgers, attrgetter('time'), args, writer)
+            return
+
         res = query_api('private', 'Ledgers', api_params, args)
         # extract list of ledgers from API results
         lg = res['ledger']
 
-    lg_list = []
-    for refid, item in lg.items():
-        # Initialize an OrderedDict to garantee the column order
-        # for later use with the tabulate function
-        asset_dict = OrderedDict()
-        asset_dict['id'] = refid
-        asset_dict['refid'] = item['refid']
-        asset_dict['time'] = format_timestamp(int(item['time']))
-        asset_dict['type'] = item['type']
-        # Remove leading Z or X from item pair if it is of length 4
-        asset_dict['asset'] = item['asset'][1:] \
-            if len(item['asset']) == 4 and item['asset'][0] in ['Z', 'X'] else item['asset']
-        asset_dict['aclass'] = item['aclass']
-        asset_dict['amount'] = float(item['amount'])
-        asset_dict['fee'] = float(item['fee'])
-        asset_dict['balance'] = float(item['balance'])
+    lg_list = parse_ledgers(lg, typed=writer is not None)
 
-        lg_list.append(asset_dict)
+    # sort by date
+    lg_list = sorted(lg_list, key=attrgetter('time'))
 
-    if not lg_list:
+    if writer is not None:
+        with writer:
+            writer.write(lg_list)
         return
 
-    # sort by date
-    lg_list = sorted(lg_list, key=lambda odict: odict['time'])
+    if not lg_list:
+        return
 
     if args.csv:
-        print(csv(lg_list, headers="keys"))
+        write_csv(lg_list, headers="keys")
     else:
         print(tabulate(lg_list, headers="keys"))
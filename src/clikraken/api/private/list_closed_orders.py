@@ -4,7 +4,7 @@
 clikraken.api.private.list_list_closed_orders
 
 This module queries the ClosedOrders method of Kraken's API
-and outputs the results in a tabular format.
+(or the local mirror of the history) and outputs the results in a tabular format.
 
 Licensed under the Apache License, Version 2.0. See the LICENSE file.
 """
@@ -12,9 +12,12 @@ Licensed under the Apache License, Version 2.0. See the LICENSE file.
 from decimal import Decimal
 
 from clikraken.api.api_utils import parse_order_res, query_api
-from clikraken.clikraken_utils import asset_pair_short
+from clikraken.clikraken_utils import same_asset_pair
 from clikraken.clikraken_utils import _tabulate as tabulate
-from clikraken.clikraken_utils import csv
+from clikraken.clikraken_utils import write_csv
+from clikraken.columnar import record_writer
+from clikraken.history_db import HistoryDB
+from clikraken.records import ClosedOrder
 
 
 def list_closed_orders(args):
@@ -24,7 +27,20 @@ def list_closed_orders(args):
     api_params = {
         # TODO
     }
-    if args.txid:
+
+    writer = None
+    if args.output:
+        writer = record_writer(args.output, ClosedOrder)
+        if writer is None:
+            return
+
+    if args.local:
+        db = HistoryDB()
+        try:
+            res_ol = db.query('closed_orders', ids=args.txid.split(',') if args.txid else None)
+        finally:
+            db.close()
+    elif args.txid:
         api_params.update({'txid': args.txid})
         res_ol = query_api('private', 'QueryOrders', api_params, args)
     else:
@@ -33,23 +49,28 @@ def list_closed_orders(args):
         res_ol = res['closed']
 
     # the parsing is done in an helper function
-    ol = parse_order_res(res_ol, ['closed', 'canceled'])
+    ol = parse_order_res(res_ol, ['closed', 'canceled'], typed=writer is not None)
 
     # merge order types in one list
     ol = ol['buy'] + ol['sell']
 
     # filter out orders with zero volume executed
-    ol = [odict for odict in ol if Decimal(odict['vol_exec']) > 0]
+    ol = [order for order in ol if Decimal(order.vol_exec) > 0]
     if 'pair' in args and args.pair:
-        ol = [odict for odict in ol if odict['pair'] in [args.pair, asset_pair_short(args.pair)]]
+        ol = [order for order in ol if same_asset_pair(order.pair, args.pair)]
 
-    if not ol:
+    # sort by date
+    ol = sorted(ol, key=lambda order: order.closing_date)
+
+    if writer is not None:
+        with writer:
+            writer.write(ol)
         return
 
-    # sort by date
-    ol = sorted(ol, key=lambda odict: odict['closing_date'])
+    if not ol:
+        return
 
     if args.csv:
-        print(csv(ol, headers="keys"))
+        write_csv(ol, headers="keys")
     else:
         print(tabulate(ol, headers="keys"))
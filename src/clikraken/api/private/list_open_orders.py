@@ -12,9 +12,9 @@ Licensed under the Apache License, Version 2.0. See the LICENSE file.
 from decimal import Decimal
 
 from clikraken.api.api_utils import parse_order_res, query_api
-from clikraken.clikraken_utils import asset_pair_short
+from clikraken.clikraken_utils import same_asset_pair
 from clikraken.clikraken_utils import _tabulate as tabulate
-from clikraken.clikraken_utils import csv
+from clikraken.clikraken_utils import write_csv
 
 
 def list_open_orders(args):
@@ -39,10 +39,10 @@ def list_open_orders(args):
     for otype in ol:
         # filter orders based on currency pair
         if 'pair' in args and args.pair:
-            ol[otype] = [odict for odict in ol[otype]
-                         if (odict['pair'] in [args.pair, asset_pair_short(args.pair)] or args.pair == 'all')]
+            ol[otype] = [order for order in ol[otype]
+                         if (args.pair == 'all' or same_asset_pair(order.pair, args.pair))]
         # sort orders by price
-        ol[otype] = sorted(ol[otype], key=lambda odict: Decimal(odict['price']))
+        ol[otype] = sorted(ol[otype], key=lambda order: Decimal(order.price))
 
     # final list is concatenation of buy orders followed by sell orders
     ol_all = ol['buy'] + ol['sell']
@@ -51,6 +51,6 @@ def list_open_orders(args):
         return
 
     if args.csv:
-        print(csv(ol_all, headers="keys"))
+        write_csv(ol_all, headers="keys")
     else:
         print(tabulate(ol_all, headers="keys"))
@@ -0,0 +1,430 @@
+# -*- coding: utf8 -*-
+
+"""
+clikraken.api.private.place_batch
+
+This module places many orders at once with the AddOrderBatch and
+AddOrder methods of Kraken's API and outputs the results in a tabular
+format.
+
+The orders are read from a CSV or JSON file, or generated as a ladder
+(orders of the same side at evenly spaced prices) or a grid (buys below
+a center price and sells above it). All of them are validated locally
+before any is submitted: if one is invalid, none is placed.
+
+The orders of the same asset pair are sent by batches of 15 with
+AddOrderBatch, all the batches concurrently. The batches rejected by
+Kraken (or all the orders with --no-batch) are placed with concurrent
+AddOrder queries instead. Orders are never sent again when Kraken may
+have received them (network errors, service unavailable...), to not
+place them twice.
+
+Licensed under the Apache License, Version 2.0. See the LICENSE file.
+"""
+
+import csv
+import io
+import json
+import sys
+import time
+from collections import OrderedDict
+from decimal import ROUND_DOWN, Decimal, InvalidOperation
+
+import clikraken.global_vars as gv
+from clikraken.api.api_utils import _check_api_key, query_kraken_concurrently
+from clikraken.api.asset_pairs_index import build_pair_index, load_asset_pairs
+from clikraken.api.retry import REJECTED, classify_failure
+from clikraken.clikraken_utils import _tabulate as tabulate
+from clikraken.clikraken_utils import check_trading_agreement, write_csv
+from clikraken.log_utils import logger
+
+# maximum number of orders of an AddOrderBatch query (all of the same asset pair)
+BATCH_SIZE = 15
+
+# decimals of the generated prices and volumes when the precision of the asset pair is unknown
+DEFAULT_DECIMALS = 8
+
+# fields of an order in the input files
+FIELDS = ['pair', 'type', 'ordertype', 'volume', 'price', 'leverage', 'userref']
+
+ORDER_TYPES = ['limit', 'market']
+
+DISTRIBUTIONS = ['flat', 'linear', 'geometric']
+
+# errors of the orders rejected by Kraken's validation, before placing any of them
+VALIDATION_ERRORS = ('EOrder:', 'EGeneral:Invalid arguments')
+
+
+class OrderError(Exception):
+    """Raised when orders can't be read, generated or validated"""
+
+
+def read_orders(f):
+    """
+    Read orders from a file: a JSON list of objects (or an object with an
+    "orders" list), or CSV data with a header line. Return a list of dicts.
+    """
+
+    data = f.read()
+    if data.lstrip()[:1] in ('[', '{'):
+        try:
+            orders = json.loads(data)
+        except ValueError as e:
+            raise OrderError('Invalid JSON: {}'.format(e))
+        if isinstance(orders, dict):
+            orders = orders.get('orders', [])
+        if not isinstance(orders, list) or not all(isinstance(o, dict) for o in orders):
+            raise OrderError('The JSON data must be a list of orders.')
+        return orders
+
+    try:
+        dialect = csv.Sniffer().sniff(data.split('\n', 1)[0], delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    return [{k.strip(): v for k, v in row.items() if k} for row in csv.DictReader(io.StringIO(data), dialect=dialect)]
+
+
+def ladder_prices(start, end, steps):
+    """Return steps prices evenly spaced from start to end (included)"""
+    if steps < 1:
+        raise OrderError('The number of steps must be at least 1.')
+    if steps == 1:
+        return [start]
+    step = (end - start) / (steps - 1)
+    return [start + step * i for i in range(steps)]
+
+
+def distribute(volume, steps, distribution='flat', factor=Decimal(2)):
+    """
+    Split a total volume between steps orders. With the linear and geometric
+    distributions, the volume of the last order is factor times the volume of
+    the first one, the ones in between growing linearly or geometrically.
+    """
+
+    if distribution not in DISTRIBUTIONS:
+        raise OrderError('Unknown volume distribution "{}" (possible values: {})'.format(
+            distribution, ', '.join(DISTRIBUTIONS)))
+    if factor <= 0:
+        raise OrderError('The factor of the volume distribution must be positive.')
+
+    if steps == 1 or distribution == 'flat':
+        weights = [Decimal(1)] * steps
+    elif distribution == 'linear':
+        weights = [1 + (factor - 1) * i / (steps - 1) for i in range(steps)]
+    else:
+        weights = [factor ** (Decimal(i) / (steps - 1)) for i in range(steps)]
+
+    total = sum(weights)
+    return [volume * w / total for w in weights]
+
+
+def generate_orders(args):
+    """Return the orders of the ladder (--ladder) or the grid (--grid) of the arguments"""
+
+    for name in ('start', 'end', 'steps', 'volume'):
+        if getattr(args, name) is None:
+            raise OrderError('--{} is required to generate a ladder or a grid.'.format(name))
+
+    prices = ladder_prices(args.start, args.end, args.steps)
+    if args.grid is not None:
+        # no order at the center of the grid
+        prices = [price for price in prices if price != args.grid]
+    volumes = distribute(args.volume, len(prices), args.distribution, args.factor)
+
+    orders = []
+    for price, volume in zip(prices, volumes):
+        otype = args.ladder or ('buy' if price < args.grid else 'sell')
+        orders.append({'type': otype, 'volume': volume, 'price': price})
+    return orders
+
+
+def _decimal(value, name):
+    try:
+        number = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise OrderError('invalid {} "{}"'.format(name, value))
+    if not number.is_finite() or number <= 0:
+        raise OrderError('the {} must be positive'.format(name))
+    return number
+
+
+def _fit(value, decimals, rounding, exact):
+    """
+    Round a value to a number of decimals, or check that it has at most as many if exact.
+    Return it formatted without exponent.
+    """
+    if decimals is None:
+        if exact:
+            return '{:f}'.format(value)
+        decimals = DEFAULT_DECIMALS
+    rounded = value.quantize(Decimal(1).scaleb(-decimals), rounding=rounding)
+    if exact and rounded != value:
+        raise OrderError('at most {} decimals are allowed'.format(decimals))
+    return '{:f}'.format(value if exact else rounded)
+
+
+def validate_order(order, args, asset_pairs, pair_index, generated=False):
+    """
+    Check an order and complete it with the defaults of the arguments.
+    Return the parameters of the AddOrder query, or raise OrderError.
+
+    The prices and volumes of generated orders are rounded to the precision
+    allowed for the asset pair, the ones given in a file must already fit.
+    """
+
+    unknown = set(order) - set(FIELDS)
+    if unknown:
+        raise OrderError('unknown fields: {}'.format(', '.join(sorted(unknown))))
+
+    pair = order.get('pair') or args.pair
+    info = None
+    if pair_index:
+        entry = pair_index.get(pair.upper())
+        if entry is None:
+            raise OrderError('unknown asset pair "{}"'.format(pair))
+        pair = entry[0]
+        info = asset_pairs[pair]
+
+    otype = order.get('type')
+    if otype not in ('buy', 'sell'):
+        raise OrderError('the type must be buy or sell, not "{}"'.format(otype))
+
+    ordertype = order.get('ordertype') or args.ordertype
+    if ordertype not in ORDER_TYPES:
+        raise OrderError('the order type must be one of {}, not "{}"'.format(', '.join(ORDER_TYPES), ordertype))
+
+    params = OrderedDict()
+    params['pair'] = pair
+    params['type'] = otype
+    params['ordertype'] = ordertype
+
+    lot_decimals = info.get('lot_decimals') if info else None
+    try:
+        volume = _fit(_decimal(order.get('volume'), 'volume'), lot_decimals, ROUND_DOWN, not generated)
+    except OrderError as e:
+        raise OrderError('volume: {}'.format(e))
+    ordermin = info.get('ordermin') if info else None
+    if ordermin and Decimal(volume) < Decimal(ordermin):
+        raise OrderError('the volume {} is below the minimum of {}'.format(volume, ordermin))
+    params['volume'] = volume
+
+    price = order.get('price')
+    if ordertype == 'limit':
+        if price in (None, ''):
+            raise OrderError('the price is required for limit orders')
+        pair_decimals = info.get('pair_decimals') if info else None
+        try:
+            params['price'] = _fit(_decimal(price, 'price'), pair_decimals, None, not generated)
+        except OrderError as e:
+            raise OrderError('price: {}'.format(e))
+    elif price not in (None, ''):
+        raise OrderError('market orders have no price')
+
+    leverage = order.get('leverage') or args.leverage
+    if leverage and leverage != 'none':
+        params['leverage'] = str(leverage)
+
+    userref = order.get('userref')
+    if userref in (None, ''):
+        userref = args.userref
+    if userref not in (None, ''):
+        try:
+            params['userref'] = int(userref)
+        except ValueError:
+            raise OrderError('the user reference must be an integer, not "{}"'.format(userref))
+
+    if ordertype == 'limit' and not args.nopost:
+        # like the place command, limit orders are post-only by default
+        params['oflags'] = 'post'
+
+    return params
+
+
+def load_orders(args):
+    """Read or generate the orders of the arguments and validate them, return the AddOrder parameters"""
+
+    sources = [bool(args.file), args.ladder is not None, args.grid is not None]
+    if sum(sources) != 1:
+        raise OrderError('Give exactly one of --file, --ladder or --grid.')
+
+    if args.file:
+        if args.file == '-':
+            orders = read_orders(sys.stdin)
+        else:
+            try:
+                with open(args.file) as f:
+                    orders = read_orders(f)
+            except (IOError, OSError) as e:
+                raise OrderError('Can\'t read the orders: {}'.format(e))
+    else:
+        orders = generate_orders(args)
+
+    if not orders:
+        raise OrderError('No orders to place.')
+
+    asset_pairs = load_asset_pairs() or {}
+    pair_index = build_pair_index(asset_pairs)
+    if not pair_index:
+        logger.warning('Asset pairs unavailable, the asset pairs and the precision of the orders are not checked.')
+
+    validated = []
+    errors = []
+    for i, order in enumerate(orders, 1):
+        try:
+            validated.append(validate_order(order, args, asset_pairs, pair_index, generated=not args.file))
+        except OrderError as e:
+            errors.append('order {}: {}'.format(i, e))
+    if errors:
+        raise OrderError('Invalid orders, none was placed:\n' + '\n'.join(errors))
+
+    return validated
+
+
+def _order_result(res):
+    """Return the txid(s) of an order placed (or the error) from a response of AddOrder"""
+    result = res.get('result')
+    if result is None:
+        return None, ', '.join(res.get('error') or [])
+    return ','.join(result.get('txid') or []), None
+
+
+def _batch_rejected(res):
+    """Return True if a failed AddOrderBatch query wasn't processed by Kraken, so its orders can be sent again"""
+    if classify_failure(res, None, ())[0] == REJECTED:
+        return True
+    errors = res.get('error') or []
+    return bool(errors) and all(e.startswith(VALIDATION_ERRORS) for e in errors)
+
+
+def place_batches(orders, validate=False):
+    """
+    Place orders (AddOrder parameters) with AddOrderBatch. Return {index of the order: (txid, error)}
+    for the orders of the batches which Kraken answered, the other ones are left out.
+    """
+
+    by_pair = OrderedDict()
+    for i, params in enumerate(orders):
+        by_pair.setdefault(params['pair'], []).append(i)
+
+    batches = []
+    for pair, indexes in by_pair.items():
+        for start in range(0, len(indexes), BATCH_SIZE):
+            chunk = indexes[start:start + BATCH_SIZE]
+            # AddOrderBatch takes at least 2 orders
+            if len(chunk) > 1:
+                batches.append(chunk)
+
+    params_list = []
+    for chunk in batches:
+        batch_orders = []
+        for i in chunk:
+            # the asset pair is given once for the batch, and the
+            # trading agreement is only accepted by AddOrder
+            order = dict(orders[i])
+            del order['pair']
+            order.pop('trading_agreement', None)
+            batch_orders.append(order)
+        batch_params = {'pair': orders[chunk[0]]['pair'], 'orders': batch_orders}
+        if validate:
+            batch_params['validate'] = True
+        params_list.append(batch_params)
+
+    responses = query_kraken_concurrently('private', 'AddOrderBatch', params_list, json_body=True)
+
+    results = {}
+    for chunk, res in zip(batches, responses):
+        result = res.get('result')
+        if result is None:
+            if not res:
+                # no answer: the orders may have been placed anyway
+                results.update((i, (None, 'unknown (network error), check the open orders')) for i in chunk)
+            elif _batch_rejected(res):
+                logger.info('AddOrderBatch failed, placing the orders one by one.')
+            else:
+                # e.g. EService:Unavailable: the orders may have been placed anyway
+                error = 'unknown ({}), check the open orders'.format(', '.join(res.get('error') or []))
+                results.update((i, (None, error)) for i in chunk)
+            continue
+        for i, order_res in zip(chunk, result.get('orders', [])):
+            if order_res.get('error'):
+                results[i] = (None, order_res['error'])
+            else:
+                txid = order_res.get('txid') or ''
+                results[i] = (txid if isinstance(txid, str) else ','.join(txid), None)
+    return results
+
+
+def place_one_by_one(orders, validate=False):
+    """Place orders (AddOrder parameters) with concurrent AddOrder queries, return [(txid, error)]"""
+
+    params_list = []
+    for params in orders:
+        params = dict(params)
+        if validate:
+            params['validate'] = 'true'
+        params_list.append(params)
+
+    responses = query_kraken_concurrently('private', 'AddOrder', params_list)
+
+    results = []
+    for res in responses:
+        if not res:
+            results.append((None, 'unknown (network error), check the open orders'))
+        else:
+            results.append(_order_result(res))
+    return results
+
+
+def place_batch(args):
+    """Place many orders at once."""
+
+    try:
+        orders = load_orders(args)
+    except OrderError as e:
+        logger.error(str(e))
+        return
+
+    if any(params['ordertype'] == 'market' for params in orders):
+        check_trading_agreement()
+    if gv.TRADING_AGREEMENT == 'agree':
+        for params in orders:
+            params['trading_agreement'] = 'agree'
+
+    t0 = time.perf_counter()
+    if args.dry_run:
+        results = {}
+    else:
+        _check_api_key('private')
+        results = {} if args.no_batch else place_batches(orders, args.validate)
+        left = [i for i in range(len(orders)) if i not in results]
+        if left:
+            results.update(zip(left, place_one_by_one([orders[i] for i in left], args.validate)))
+    elapsed = time.perf_counter() - t0
+
+    rows = []
+    for i, params in enumerate(orders):
+        txid, error = results.get(i, (None, None))
+        odict = OrderedDict()
+        odict['pair'] = params['pair']
+        odict['type'] = params['type']
+        odict['ordertype'] = params['ordertype']
+        odict['volume'] = params['volume']
+        odict['price'] = params.get('price', '')
+        if args.dry_run:
+            odict['result'] = 'not submitted'
+        elif error:
+            odict['result'] = error
+        elif args.validate:
+            odict['result'] = 'validated'
+        else:
+            odict['result'] = txid
+        rows.append(odict)
+
+    if args.csv:
+        write_csv(rows, headers="keys")
+    else:
+        print(tabulate(rows, headers="keys"))
+        if not args.dry_run:
+            done = sum(1 for i in range(len(orders)) if i in results and not results[i][1])
+            print('\n{} of {} orders {} in {:.2f} s'.format(
+                done, len(orders), 'validated' if args.validate else 'placed', elapsed))
@@ -0,0 +1,158 @@
+# -*- coding: utf8 -*-
+
+"""
+clikraken.api.private.pnl
+
+This module computes the realized profit and loss and the cost basis of
+the holdings from the trades history, queried with the TradesHistory
+method of Kraken's API (or from the local mirror of the history, where
+the computation is resumed from the last trade processed), and outputs
+the results in a tabular format.
+
+Licensed under the Apache License, Version 2.0. See the LICENSE file.
+"""
+
+from collections import OrderedDict
+from decimal import Decimal
+
+from clikraken.api.api_utils import IncompleteResultsError, query_api_pages, query_kraken
+from clikraken.clikraken_utils import asset_pair_short, same_asset_pair
+from clikraken.clikraken_utils import _tabulate as tabulate
+from clikraken.clikraken_utils import write_csv
+from clikraken.history_db import HistoryDB
+from clikraken.log_utils import logger
+from clikraken.pnl import BASIS, FEES, PROCEEDS, REALIZED, SELLS, VOLUME, PnLEngine
+
+# the amounts are output with 8 decimals, like Kraken does
+QUANTUM = Decimal('1e-8')
+
+
+def _amount(value):
+    return value.quantize(QUANTUM)
+
+
+def local_engine(method, rebuild=False):
+    """
+    Return the PnL engine of a cost basis method updated with the trades of the local mirror
+    of the history. Only the trades newer than the last one processed by the previous run are
+    processed, unless the trades already processed changed (e.g. after a full sync).
+    """
+
+    name = 'pnl_' + method
+    db = HistoryDB()
+    try:
+        state = None if rebuild else db.load_state(name)
+        engine = PnLEngine.from_state(state) if state else PnLEngine(method)
+
+        if engine.last_time is not None and db.count('trades', until=engine.last_time) != engine.processed:
+            logger.info('The local history of trades changed, computing the PnL from the first trade.')
+            engine = PnLEngine(method)
+
+        # the trades with the same time as the last one processed are skipped by the engine
+        start = engine.last_time - 1 if engine.last_time is not None else None
+        new = engine.add_many(db.iter_query('trades', start=start))
+        logger.debug('{} new trades processed'.format(new))
+
+        db.save_state(name, engine.to_state())
+    finally:
+        db.close()
+
+    return engine
+
+
+def api_engine(method, args):
+    """Return the PnL engine of a cost basis method fed with all the trades from the API"""
+
+    trades = {}
+    try:
+        for page in query_api_pages('private', 'TradesHistory', {}, 'trades', args):
+            trades.update(page)
+    except IncompleteResultsError as e:
+        # the PnL can't be computed without the whole history
+        logger.error(str(e))
+        return None
+
+    engine = PnLEngine(method)
+    engine.add_many(sorted(trades.items(), key=lambda kv: (float(kv[1]['time']), kv[0])))
+    return engine
+
+
+def query_prices(pairs):
+    """Return the last trade price of asset pairs from the Ticker method ({} in case of error)"""
+
+    res = query_kraken('public', 'Ticker', {'pair': ','.join(pairs)}).get('result') or {}
+
+    prices = {}
+    for pair in pairs:
+        for res_pair, pair_res in res.items():
+            if res_pair == pair or same_asset_pair(res_pair, pair):
+                prices[pair] = Decimal(pair_res['c'][0])
+                break
+    return prices
+
+
+def realized_rows(engine, period):
+    rows = []
+    for (period_key, pair), stats in engine.report(period):
+        pdict = OrderedDict()
+        pdict['period'] = period_key
+        pdict['pair'] = asset_pair_short(pair)
+        pdict['sells'] = stats[SELLS]
+        pdict['volume'] = _amount(stats[VOLUME])
+        pdict['proceeds'] = _amount(stats[PROCEEDS])
+        pdict['cost basis'] = _amount(stats[BASIS])
+        pdict['fees'] = _amount(stats[FEES])
+        pdict['realized'] = _amount(stats[REALIZED])
+        rows.append(pdict)
+    return rows
+
+
+def holdings_rows(engine):
+    holdings = engine.holdings()
+    prices = query_prices([pair for pair, _, _ in holdings]) if holdings else {}
+
+    rows = []
+    for pair, volume, basis in holdings:
+        price = prices.get(pair)
+        hdict = OrderedDict()
+        hdict['pair'] = asset_pair_short(pair)
+        hdict['volume'] = _amount(volume)
+        hdict['cost basis'] = _amount(basis)
+        hdict['average cost'] = _amount(basis / volume)
+        hdict['price'] = price if price is not None else ''
+        hdict['value'] = _amount(volume * price) if price is not None else ''
+        hdict['unrealized'] = _amount(volume * price - basis) if price is not None else ''
+        rows.append(hdict)
+    return rows
+
+
+def pnl(args):
+    """Compute the realized PnL by period and asset pair, or the cost basis of the holdings."""
+
+    if args.local:
+        engine = local_engine(args.method, args.rebuild)
+    else:
+        engine = api_engine(args.method, args)
+        if engine is None:
+            return
+
+    if engine.skipped:
+        logger.warning('{} margin trades ignored.'.format(engine.skipped))
+    for pair, volume in sorted(engine.unmatched.items()):
+        logger.warning('{} {} sold without matching buys of this asset pair (incomplete history, or bought '
+                       'with another quote currency?) not included in the realized PnL.'.format(
+                           volume, asset_pair_short(pair)))
+
+    rows = holdings_rows(engine) if args.holdings else realized_rows(engine, args.period)
+
+    if args.pair:
+        shortpair = asset_pair_short(args.pair)
+        rows = [row for row in rows if row['pair'] == shortpair]
+
+    if not rows:
+        return
+
+    if args.csv:
+        write_csv(rows, headers="keys")
+    else:
+        print(tabulate(rows, headers="keys"))
@@ -0,0 +1,108 @@
+# -*- coding: utf8 -*-
+
+"""
+clikraken.api.private.sync
+
+This module synchronizes the local mirror of the account history
+with the Ledgers, TradesHistory and ClosedOrders methods of Kraken's API
+and outputs a summary in a tabular format.
+
+Licensed under the Apache License, Version 2.0. See the LICENSE file.
+"""
+
+from collections import OrderedDict
+
+from clikraken.api.api_utils import IncompleteResultsError, NoResultsError, query_api_pages
+from clikraken.clikraken_utils import _tabulate as tabulate
+from clikraken.clikraken_utils import write_csv, format_timestamp
+from clikraken.history_db import HistoryDB
+from clikraken.log_utils import logger
+
+# name of the table -> (API method, key of the results, extra parameters, time field of the entries)
+SOURCES = OrderedDict([
+    ('ledgers', ('Ledgers', 'ledger', {}, 'time')),
+    ('trades', ('TradesHistory', 'trades', {}, 'time')),
+    ('closed_orders', ('ClosedOrders', 'closed', {'closetime': 'close'}, 'closetm')),
+])
+
+# Overlap (in seconds) with the previous synchronization, in case several
+# entries share the same timestamp. Entries fetched twice are simply updated.
+OVERLAP = 1
+
+
+def sync_table(db, table, args):
+    """
+    Fetch the entries newer than the high-water mark of a table and store them.
+
+    Return the number of entries fetched. The high-water mark is only
+    moved forward once all the pages have been fetched, because the pages
+    arrive from the most recent to the oldest entries.
+    """
+
+    api_method, result_key, extra_params, time_key = SOURCES[table]
+
+    api_params = dict(extra_params)
+    hwm = None if args.full else db.high_water_mark(table)
+    if hwm is not None:
+        api_params['start'] = int(hwm) - OVERLAP
+
+    fetched = 0
+    new_hwm = hwm
+    for page in query_api_pages('private', api_method, api_params, result_key, args, time_key=time_key):
+        fetched += db.upsert(table, page)
+        page_max = max(float(entry[time_key]) for entry in page.values())
+        new_hwm = page_max if new_hwm is None else max(new_hwm, page_max)
+
+    if new_hwm is not None:
+        db.set_high_water_mark(table, new_hwm)
+
+    return fetched
+
+
+def sync(args):
+    """Synchronize the local mirror of the account history."""
+
+    tables = list(SOURCES) if args.tables == 'all' else [t.strip() for t in args.tables.split(',')]
+    unknown = [t for t in tables if t not in SOURCES]
+    if unknown:
+        logger.error('Unknown history to synchronize: {} (expected: {})'.format(
+            ', '.join(unknown), ', '.join(SOURCES)))
+        return
+
+    db = HistoryDB()
+
+    summary = []
+    failed = False
+    try:
+        for table in tables:
+            # the other histories are synchronized even if one fails
+            try:
+                fetched = sync_table(db, table, args)
+            except NoResultsError as e:
+                logger.error('{}: {}'.format(table, e))
+                fetched = 'failed'
+                failed = True
+            except IncompleteResultsError as e:
+                # what was fetched is kept, the next run will fetch the rest
+                logger.error('{}: {}'.format(table, e))
+                fetched = 'incomplete'
+                failed = True
+
+            hwm = db.high_water_mark(table)
+
+            sdict = OrderedDict()
+            sdict['history'] = table
+            sdict['fetched'] = fetched
+            sdict['total'] = db.count(table)
+            sdict['synced until'] = format_timestamp(hwm) if hwm is not None else ''
+            summary.append(sdict)
+    finally:
+        db.close()
+
+    if args.csv:
+        write_csv(summary, headers="keys")
+    else:
+        print(tabulate(summary, headers="keys"))
+
+    if failed:
+        exit(1)
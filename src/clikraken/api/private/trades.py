@@ -4,17 +4,70 @@
 clikraken.api.private.trades
 
 This module queries the TradesHistory or QueryTrades method of Kraken's API
-and outputs the results in a tabular format.
+(or the local mirror of the history) and outputs the results in a tabular format.
 
 Licensed under the Apache License, Version 2.0. See the LICENSE file.
 """
 
-from collections import OrderedDict
+from functools import partial
+from operator import attrgetter
 
-from clikraken.api.api_utils import query_api
-from clikraken.clikraken_utils import asset_pair_short
-from clikraken.clikraken_utils import csv, format_timestamp
+from clikraken.api.api_utils import print_pages, query_api, query_api_pages
+from clikraken.clikraken_utils import same_asset_pair
+from clikraken.clikraken_utils import write_csv, format_timestamp
 from clikraken.clikraken_utils import _tabulate as tabulate
+from clikraken.columnar import record_writer
+from clikraken.history_db import HistoryDB
+from clikraken.log_utils import logger
+from clikraken.records import HistoryTrade
+
+
+def parse_trades(res_trades, pair=None, typed=False):
+    """
+    Parse a dict of trades from the API into a list of rows, optionally filtered by asset pair.
+
+    With typed, the times are kept as given by the API (see clikraken.columnar).
+    """
+
+    tl = []
+    for trade_id, trade_data in res_trades.items():
+        # filter trades based on currency pair
+        if pair and pair != 'all' and not same_asset_pair(trade_data['pair'], pair):
+            continue
+
+        tpair = trade_data['pair']
+        tl.append(HistoryTrade(
+            trade_id,
+            trade_data['time'] if typed else format_timestamp(int(trade_data['time'])),
+            tpair[1:] if len(tpair) == 4 and tpair[0] in ['Z', 'X'] else tpair,
+            trade_data['type'],
+            trade_data['ordertype'],
+            trade_data['vol'],
+            trade_data['price'],
+            trade_data['cost'],
+            trade_data['fee'],
+            trade_data['margin'],
+            trade_data['ordertxid'],
+            trade_data['misc']))
+
+    return tl
+
+
+def query_local_trades(args):
+    """Query the trades from the local mirror of the history."""
+
+    if args.type and args.type != 'all':
+        logger.warning('The type of trade can not be filtered in the local history, ignoring it.')
+
+    db = HistoryDB()
+    try:
+        return db.query(
+            'trades',
+            ids=args.id.split(',') if args.id else None,
+            start=args.start,
+            end=args.end)
+    finally:
+        db.close()
 
 
 def trades(args):
@@ -33,52 +86,45 @@ def trades(args):
     if args.ofs:
         api_params.update({'ofs': args.ofs})
 
-    if args.id:
+    pair = args.pair if 'pair' in args else None
+
+    writer = None
+    if args.output:
+        writer = record_writer(args.output, HistoryTrade)
+        if writer is None:
+            return
+
+    if args.local:
+        res_trades = query_local_trades(args)
+    elif args.id:
         api_params.update({
             'txid': args.id,
         })
         res_trades = query_api('private', 'QueryTrades', api_params, args)
+    elif args.all:
+        # walk through all the pages of results
+        pages = query_api_pages('private', 'TradesHistory', api_params, 'trades', args)
+        print_pages(pages, partial(parse_trades, pair=pair), attrgetter('time'), args, writer)
+        return
     else:
         res = query_api('private', 'TradesHistory', api_params, args)
         # extract list of orders from API results
         res_trades = res['trades']
 
-    # put all in a list
-    tl = []
-    for trade_id, trade_data in res_trades.items():
-        trade_data.update({'tradeid': trade_id})
-        tl += [trade_data]
-
-    # filter orders based on currency pair
-    if 'pair' in args and args.pair:
-        tl = [td for td in tl if (td['pair'] in [args.pair, asset_pair_short(args.pair)] or args.pair == 'all')]
-
-    # Lets get some order and filter some unnecessary fields
-    tl2 = []
-    for trade_data in tl:
-        trade_dict = OrderedDict()
-        trade_dict['txid'] = trade_data['tradeid']
-        trade_dict['time'] = format_timestamp(int(trade_data['time']))
-        trade_dict['pair'] = trade_data['pair'][1:] if len(trade_data['pair']) == 4 and \
-            trade_data['pair'][0] in ['Z', 'X'] else trade_data['pair']
-        trade_dict['type'] = trade_data['type']
-        trade_dict['ordertype'] = trade_data['ordertype']
-        trade_dict['vol'] = trade_data['vol']
-        trade_dict['price'] = trade_data['price']
-        trade_dict['cost'] = trade_data['cost']
-        trade_dict['fee'] = trade_data['fee']
-        trade_dict['margin'] = trade_data['margin']
-        trade_dict['ordertxid'] = trade_data['ordertxid']
-        trade_dict['misc'] = trade_data['misc']
-        tl2.append(trade_dict)
+    tl2 = parse_trades(res_trades, pair, typed=writer is not None)
 
     # sort orders by time
-    tl2 = sorted(tl2, key=lambda x: x['time'])
+    tl2 = sorted(tl2, key=attrgetter('time'))
+
+    if writer is not None:
+        with writer:
+            writer.write(tl2)
+        return
 
     if not tl2:
         return
 
     if args.csv:
-        print(csv(tl2, headers="keys"))
+        write_csv(tl2, headers="keys")
     else:
         print(tabulate(tl2, headers="keys"))
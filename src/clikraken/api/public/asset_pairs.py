@@ -4,7 +4,7 @@
 clikraken.api.public.asset_pairs
 
 This module queries the AssetPairs method of Kraken's API
-and outputs the results in a tabular format.
+(or reads its cached results) and outputs the results in a tabular format.
 
 Licensed under the Apache License, Version 2.0. See the LICENSE file.
 """
@@ -12,17 +12,26 @@ Licensed under the Apache License, Version 2.0. See the LICENSE file.
 from collections import OrderedDict
 
 from clikraken.api.api_utils import query_api
+from clikraken.api.asset_pairs_index import cache_enabled, load_asset_pairs, write_cache
 from clikraken.clikraken_utils import _tabulate as tabulate
-from clikraken.clikraken_utils import csv
+from clikraken.clikraken_utils import write_csv
 
 
 def asset_pairs(args):
     """Get available asset pairs."""
 
-    # Parameters to pass to the API
-    api_params = {}
+    if args.raw or args.refresh:
+        # Parameters to pass to the API
+        api_params = {}
 
-    res = query_api('public', 'AssetPairs', api_params, args)
+        res = query_api('public', 'AssetPairs', api_params, args)
+        if cache_enabled():
+            write_cache(res)
+    else:
+        # answer from the cache if it is fresh enough
+        res = load_asset_pairs()
+        if not res:
+            return
 
     # initialize a list to store the parsed assets pairs
     assetlist = []
@@ -38,7 +47,7 @@ def asset_pairs(args):
         assetlist.append(ad)
 
     if args.csv:
-        print(csv(assetlist, headers="keys"))
+        write_csv(assetlist, headers="keys")
     else:
         print(tabulate(assetlist, headers='keys'))
         print('--- Total: {} pairs'.format(len(assetlist)))
@@ -9,70 +9,217 @@ and outputs the results in a tabular format.
 Licensed under the Apache License, Version 2.0. See the LICENSE file.
 """
 
+import json
+import time
 from collections import OrderedDict
 from decimal import Decimal
 
-from clikraken.api.api_utils import query_api
-from clikraken.clikraken_utils import asset_pair_short, humanize_timestamp
+from clikraken.api.api_utils import _check_api_key, get_pair_result, query_api_concurrently, query_kraken_concurrently
+from clikraken.clikraken_utils import asset_pair_short, format_timestamp, humanize_timestamps
 from clikraken.clikraken_utils import _tabulate as tabulate
-from clikraken.clikraken_utils import csv
+from clikraken.clikraken_utils import write_csv
+from clikraken.api.websocket_client import ChecksumError, LocalOrderBook, book_depth, stream_channel, ws_pair_names
+from clikraken.log_utils import logger
+from clikraken.order_book import TerminalRenderer, book_from_depth, book_lines, diff_books
+from clikraken.records import BookLevel
 
+DEPTH_LABELS = {'asks': "Ask", 'bids': "Bid"}
 
-def depth(args):
-    """Get market depth information."""
+# columns of the csv output
+CSV_HEADERS = ['dtype', 'pair', 'price', 'Volume', 'Age']
 
-    # Parameters to pass to the API
-    api_params = {
-        'pair': args.pair,
-        'count': args.count
-    }
+# line format of the changes of the order book: time, pair, side, kind, price, old volume, new volume
+CHANGE_ROW_FORMAT = '{:25} {:>10} {:4} {:7} {:>18} {:>18} -> {}'
 
-    res = query_api('public', 'Depth', api_params, args)
 
-    depth_dict = {'asks': [], 'bids': []}
-    depth_label = {'asks': "Ask", 'bids': "Bid"}
+def parse_depth(pair, res):
+    """Parse the market depth results of an asset pair into lists of asks and bids (BookLevel records)."""
 
-    shortpair = asset_pair_short(args.pair)
+    depth_dict = {'asks': [], 'bids': []}
 
     # dtype is 'asks' or 'bids'
     for dtype in depth_dict:
         # extract the array of market depth from the api results
-        dlist = res[args.pair][dtype]
-        # build a column label depending on the asset pair and dtype
-        price_label = shortpair + " " + depth_label[dtype]
-
-        for delem in dlist:
-            # Initialize an OrderedDict to garantee the column order
-            # for later use with the tabulate function
-            dentry = OrderedDict()
-            dentry[price_label] = delem[0]
-            dentry["Volume"] = delem[1]
-            dentry["Age"] = humanize_timestamp(delem[2])
-            depth_dict[dtype].append(dentry)
-
-        if not dlist:
-            continue
+        dlist = get_pair_result(res, pair)[dtype]
+
+        # humanize all the timestamps relatively to the same current time
+        ages = humanize_timestamps(delem[2] for delem in dlist)
+
+        levels = [BookLevel(delem[0], delem[1], age) for delem, age in zip(dlist, ages)]
 
         # sort by price descending
-        depth_dict[dtype] = reversed(sorted(depth_dict[dtype], key=lambda dentry: Decimal(dentry[price_label])))
+        levels.sort(key=lambda level: Decimal(level.price), reverse=True)
+        depth_dict[dtype] = levels
+
+    return depth_dict
+
+
+def depth_headers(pair, dtype):
+    """Column headers of the table of asks or bids of an asset pair"""
+    # the price column is labelled with the asset pair and dtype
+    return [asset_pair_short(pair) + " " + DEPTH_LABELS[dtype], "Volume", "Age"]
+
+
+def depth(args):
+    """Get market depth information."""
+
+    # Several asset pairs can be given, they are queried concurrently
+    pairs = [pair.strip() for pair in args.pair.split(',') if pair.strip()]
+
+    # Parameters to pass to the API
+    api_params_list = [{
+        'pair': pair,
+        'count': args.count
+    } for pair in pairs]
+
+    if args.stream:
+        stream_depth(pairs, args)
+        return
+
+    if args.watch:
+        watch_depth(pairs, api_params_list, args)
+        return
+
+    results = query_api_concurrently('public', 'Depth', api_params_list, args)
+
+    depth_dicts = [(pair, parse_depth(pair, res)) for pair, res in zip(pairs, results) if res]
 
     if args.csv:
         output = []
-        for dtype in depth_dict.keys():
-            for o in depth_dict[dtype]:
-                it = OrderedDict()
-                it['dtype'] = dtype
-                for k, v in o.items():
-                    if len(k.split(' ')) > 1:
-                        # key has a space, this is the "price_label" column -> "XABCZDEF Ask"
-                        it['pair'] = k.split(' ')[0]  # keep only "XABCZDEF"
-                        it['price'] = v
-                    else:
-                        # the other columns don't contain a space
-                        it[k] = v
-                output += [it]
-        print(csv(output, headers="keys"))
+        for pair, depth_dict in depth_dicts:
+            shortpair = asset_pair_short(pair)
+            for dtype, levels in depth_dict.items():
+                output.extend((dtype, shortpair) + level for level in levels)
+        if output:
+            write_csv(output, headers=CSV_HEADERS)
     else:
-        asks_table = tabulate(depth_dict['asks'], headers="keys")
-        bids_table = tabulate(depth_dict['bids'], headers="keys")
-        print("{}\n\n{}".format(asks_table, bids_table))
+        tables = []
+        for pair, depth_dict in depth_dicts:
+            asks_table = tabulate(depth_dict['asks'], headers=depth_headers(pair, 'asks'))
+            bids_table = tabulate(depth_dict['bids'], headers=depth_headers(pair, 'bids'))
+            tables.append("{}\n\n{}".format(asks_table, bids_table))
+        print("\n\n".join(tables))
+
+
+def watch_depth(pairs, api_params_list, args, clock=time.time, sleep=time.sleep, renderer=None):
+    """
+    Query the market depth every args.watch seconds until interrupted, and either
+    redraw the lines of the order books which changed, or with args.changes_only,
+    output the changes of each level (the first snapshot is output as added levels).
+    """
+
+    _check_api_key('public')
+
+    books = OrderedDict()
+    renderer = renderer or TerminalRenderer()
+    headers = "keys"
+
+    try:
+        while True:
+            responses = query_kraken_concurrently('public', 'Depth', api_params_list)
+            now = format_timestamp(clock())
+
+            for pair, res in zip(pairs, responses):
+                if args.raw:
+                    print(json.dumps(res))
+                    continue
+
+                # errors are logged by query_kraken, just try again at the next query
+                result = res.get('result')
+                if not result:
+                    continue
+
+                book = book_from_depth(get_pair_result(result, pair))
+                changes = diff_books(books.get(pair), book)
+                books[pair] = book
+
+                if args.changes_only and changes:
+                    rows = change_rows(now, pair, changes)
+                    if args.csv:
+                        if write_csv(rows, headers=headers):
+                            headers = None
+                    else:
+                        for row in rows:
+                            print(CHANGE_ROW_FORMAT.format(*row.values()))
+
+            if not args.changes_only and not args.raw and books:
+                lines = []
+                for pair, book in books.items():
+                    if lines:
+                        lines.append('')
+                    lines.extend(book_lines('{} ({})'.format(asset_pair_short(pair), now), book))
+                renderer.render(lines)
+
+            sleep(args.watch)
+    except KeyboardInterrupt:
+        pass
+
+
+def stream_depth(pairs, args, renderer=None):
+    """
+    Maintain the order books of asset pairs from the book channel of the WebSocket API,
+    and either redraw the lines which changed, or with args.changes_only, output the
+    changes of each level like watch_depth.
+    """
+
+    ws_pairs = ws_pair_names(pairs)
+    depth = book_depth(args.count)
+    books = OrderedDict((ws_pair, LocalOrderBook(depth)) for ws_pair in ws_pairs)
+    snapshots = {}
+    renderer = renderer or TerminalRenderer()
+    headers = "keys"
+
+    def handle(client, ws_pair, payloads):
+        nonlocal headers
+        book = books[ws_pair]
+        try:
+            if not book.apply(payloads):
+                return
+        except ChecksumError as e:
+            # the local book is out of sync, start again from a new snapshot
+            logger.warning('{} for {}, resubscribing.'.format(e, ws_pair))
+            client.unsubscribe([ws_pair], 'book', depth=depth)
+            client.subscribe([ws_pair], 'book', depth=depth)
+            return
+
+        pair = ws_pairs[ws_pair]
+        snapshot = book.snapshot(args.count)
+
+        if args.changes_only:
+            changes = diff_books(snapshots.get(pair), snapshot)
+            snapshots[pair] = snapshot
+            rows = change_rows(format_timestamp(time.time()), pair, changes)
+            if args.csv:
+                if write_csv(rows, headers=headers):
+                    headers = None
+            else:
+                for row in rows:
+                    print(CHANGE_ROW_FORMAT.format(*row.values()))
+            return
+
+        snapshots[pair] = snapshot
+        lines = []
+        for p, s in snapshots.items():
+            if lines:
+                lines.append('')
+            lines.extend(book_lines(asset_pair_short(p), s))
+        renderer.render(lines)
+
+    stream_channel(ws_pairs, 'book', handle, raw=args.raw, depth=depth)
+
+
+def change_rows(now, pair, changes):
+    """Rows of the changes of the order book of an asset pair"""
+    shortpair = asset_pair_short(pair)
+    rows = []
+    for change in changes:
+        row = OrderedDict()
+        row['time'] = now
+        row['pair'] = shortpair
+        row['dtype'] = change.side
+        row['change'] = change.kind
+        row['price'] = change.price
+        row['old_volume'] = change.old_volume or ''
+        row['new_volume'] = change.new_volume or ''
+        rows.append(row)
+    return rows
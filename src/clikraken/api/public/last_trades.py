@@ -9,30 +9,28 @@ and outputs the results in a tabular format.
 Licensed under the Apache License, Version 2.0. See the LICENSE file.
 """
 
+import json
+import sys
+import time
 from collections import OrderedDict
 
-from clikraken.api.api_utils import query_api
-from clikraken.clikraken_utils import humanize_timestamp, base_quote_short_from_asset_pair
+from clikraken.api.api_utils import _check_api_key, get_pair_result, query_api_concurrently, query_kraken_concurrently
+from clikraken.api.websocket_client import stream_channel, ws_pair_names
+from clikraken.clikraken_utils import asset_pair_short, humanize_timestamps, base_quote_short_from_asset_pair
+from clikraken.clikraken_utils import format_timestamps
 from clikraken.clikraken_utils import _tabulate as tabulate
-from clikraken.clikraken_utils import csv
+from clikraken.clikraken_utils import write_csv
+from clikraken.log_utils import logger
+from clikraken.trade_stats import TradeStats, parse_trade
 
+# line format of the trades in follow mode: time, pair, trade type, order type, price, volume
+FOLLOW_ROW_FORMAT = '{:25} {:>10} {:4} {:6} {:>16} {:>16}'
 
-def last_trades(args):
-    """Get last trades."""
-
-    _, quote_currency = base_quote_short_from_asset_pair(args.pair)
-
-    # Parameters to pass to the API
-    api_params = {
-        'pair': args.pair,
-    }
-    if args.since:
-        api_params['since'] = args.since
 
-    res = query_api('public', 'Trades', api_params, args)
+def parse_trades(pair, res):
+    """Parse the trades results of an asset pair, most recent trade first."""
 
-    results = res[args.pair]
-    last_id = res['last']
+    results = get_pair_result(res, pair)
 
     # initialize a list to store the parsed trades
     tlist = []
@@ -41,7 +39,10 @@ def last_trades(args):
     ttype_label = {'b': 'buy', 's': 'sell'}
     otype_label = {'l': 'limit', 'm': 'market'}
 
-    for trade in results:
+    # humanize all the timestamps relatively to the same current time
+    ages = humanize_timestamps(trade[2] for trade in results)
+
+    for trade, age in zip(results, ages):
         # Initialize an OrderedDict to garantee the column order
         # for later use with the tabulate function
         tdict = OrderedDict()
@@ -49,33 +50,198 @@ def last_trades(args):
         tdict["Order type"] = otype_label.get(trade[4], 'unknown')
         tdict["Price"] = trade[0]
         tdict["Volume"] = trade[1]
-        tdict["Age"] = humanize_timestamp(trade[2])
+        tdict["Age"] = age
         # tdict["Misc"] = trade[5]
         tlist.append(tdict)
 
-    if not tlist:
+    # Reverse trade list to have the most recent trades at the top
+    return tlist[::-1]
+
+
+def last_trades(args):
+    """Get last trades."""
+
+    # Several asset pairs can be given, they are queried concurrently
+    pairs = [pair.strip() for pair in args.pair.split(',') if pair.strip()]
+
+    # Parameters to pass to the API
+    api_params = {}
+    if args.since:
+        api_params['since'] = args.since
+
+    if args.stream:
+        stream_trades(pairs, args)
         return
 
-    # Reverse trade list to have the most recent trades at the top
-    tlist = tlist[::-1]
+    if args.follow:
+        follow_trades(pairs, args)
+        return
+
+    api_params_list = [dict(api_params, pair=pair) for pair in pairs]
+
+    results = query_api_concurrently('public', 'Trades', api_params_list, args)
 
     if args.csv:
-        print(csv(tlist[:args.count], headers="keys"))
-    else:
-        print(tabulate(tlist[:args.count], headers="keys") + '\n')
+        output = []
+        for pair, res in zip(pairs, results):
+            if not res:
+                continue
+            for tdict in parse_trades(pair, res)[:args.count]:
+                if len(pairs) > 1:
+                    # add a column to identify the asset pair when there are several of them
+                    tdict = OrderedDict([("Pair", asset_pair_short(pair))] + list(tdict.items()))
+                output.append(tdict)
+        if output:
+            write_csv(output, headers="keys")
+        return
+
+    first = True
+    for pair, res in zip(pairs, results):
+        if not res:
+            continue
+
+        tlist = parse_trades(pair, res)
+        if not tlist:
+            continue
+
+        if not first:
+            print('')
+        first = False
+
+        if len(pairs) > 1:
+            print('Asset pair: ' + asset_pair_short(pair) + '\n')
+
+        print_last_trades(tlist, pair, args.count, res['last'])
+
 
-        # separate the trades based on their type
-        sell_trades = [x for x in tlist if x["Trade type"] == "sell"]
-        buy_trades = [x for x in tlist if x["Trade type"] == "buy"]
+def print_last_trades(tlist, pair, count, last_id):
+    """Print the table of the last trades of an asset pair, followed by a summary."""
 
+    _, quote_currency = base_quote_short_from_asset_pair(pair)
+
+    print(tabulate(tlist[:count], headers="keys") + '\n')
+
+    # separate the trades based on their type
+    sell_trades = [x for x in tlist if x["Trade type"] == "sell"]
+    buy_trades = [x for x in tlist if x["Trade type"] == "buy"]
+
+    lt = [["", "Price (" + quote_currency + ")", "Volume", "Age"]]
+    if sell_trades:
         last_sell = sell_trades[0]
+        lt.append(["Last Sell", last_sell["Price"], last_sell["Volume"], last_sell["Age"]])
+    if buy_trades:
         last_buy = buy_trades[0]
-        lt = [
-            ["", "Price (" + quote_currency + ")", "Volume", "Age"],
-            ["Last Sell", last_sell["Price"], last_sell["Volume"], last_sell["Age"]],
-            ["Last Buy", last_buy["Price"], last_buy["Volume"], last_buy["Age"]],
-        ]
+        lt.append(["Last Buy", last_buy["Price"], last_buy["Volume"], last_buy["Age"]])
+
+    print(tabulate(lt, headers="firstrow") + '\n')
+
+    print('Last ID = {}'.format(last_id))
 
-        print(tabulate(lt, headers="firstrow") + '\n')
 
-        print('Last ID = {}'.format(last_id))
+def follow_trades(pairs, args, clock=time.time, sleep=time.sleep):
+    """
+    Poll the Trades method with the `last` cursor of the previous results,
+    output only the new trades and keep rolling statistics about them,
+    until interrupted.
+    """
+
+    _check_api_key('public')
+
+    windows = [w.strip() for w in args.windows.split(',') if w.strip()]
+    try:
+        stats = {pair: TradeStats(windows, args.buffer) for pair in pairs}
+    except ValueError as e:
+        logger.error(str(e))
+        return
+
+    since = {pair: args.since for pair in pairs}
+    headers = "keys"
+    first_poll = True
+
+    try:
+        while True:
+            api_params_list = [dict(pair=pair, since=since[pair]) if since[pair] else dict(pair=pair)
+                               for pair in pairs]
+            responses = query_kraken_concurrently('public', 'Trades', api_params_list)
+            now = clock()
+
+            for pair, res in zip(pairs, responses):
+                if args.raw:
+                    print(json.dumps(res))
+
+                # errors are logged by query_kraken, just try again at the next poll
+                result = res.get('result')
+                if not result:
+                    continue
+
+                since[pair] = result['last']
+                trades = [parse_trade(t) for t in get_pair_result(result, pair)]
+                stats[pair].add(trades)
+
+                if first_poll:
+                    # the first results can contain a long history, only show the end of it
+                    trades = trades[-args.count:]
+                if not trades or args.raw:
+                    continue
+
+                rows = trade_rows(pair, trades)
+                if args.csv:
+                    if write_csv(rows, headers=headers):
+                        headers = None
+                else:
+                    for row in rows:
+                        print(FOLLOW_ROW_FORMAT.format(*row.values()))
+                    print_follow_summary(pair, stats[pair].summary(now))
+
+            sys.stdout.flush()
+            first_poll = False
+            sleep(args.poll)
+    except KeyboardInterrupt:
+        pass
+
+
+def stream_trades(pairs, args):
+    """Stream the trades of asset pairs from the WebSocket API, as they happen."""
+
+    ws_pairs = ws_pair_names(pairs)
+    headers = "keys"
+
+    def handle(client, ws_pair, payloads):
+        nonlocal headers
+        pair = ws_pairs.get(ws_pair, ws_pair)
+        # the trades are sent in the same format as the results of the Trades method
+        rows = trade_rows(pair, [parse_trade(t) for t in payloads[0]])
+        if args.csv:
+            if write_csv(rows, headers=headers):
+                headers = None
+        else:
+            for row in rows:
+                print(FOLLOW_ROW_FORMAT.format(*row.values()))
+
+    stream_channel(ws_pairs, 'trade', handle, raw=args.raw)
+
+
+def trade_rows(pair, trades):
+    """Rows of the trades output in follow mode, oldest first"""
+    shortpair = asset_pair_short(pair)
+    rows = []
+    for trade, trade_time in zip(trades, format_timestamps(t.time for t in trades)):
+        row = OrderedDict()
+        row["Time"] = trade_time
+        row["Pair"] = shortpair
+        row["Trade type"] = trade.side
+        row["Order type"] = trade.ordertype
+        row["Price"] = trade.price
+        row["Volume"] = trade.volume
+        rows.append(row)
+    return rows
+
+
+def print_follow_summary(pair, summary):
+    """Print the rolling statistics of an asset pair on one line"""
+    parts = []
+    for row in summary:
+        parts.append('{}: VWAP {}, buy {}, sell {}, {} trades/min'.format(
+            row['Window'], row['VWAP'], row['Buy volume'], row['Sell volume'], row['Trades/min']))
+    last_price = summary[0]['Last price'] if summary else None
+    print('[{}] last {} | {}'.format(asset_pair_short(pair), last_price, ' | '.join(parts)))
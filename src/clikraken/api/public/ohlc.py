@@ -9,22 +9,65 @@ and outputs the results in a tabular format.
 Licensed under the Apache License, Version 2.0. See the LICENSE file.
 """
 
-from collections import OrderedDict
-
-from clikraken.api.api_utils import query_api
-from clikraken.clikraken_utils import format_timestamp, asset_pair_short
+from clikraken.api.api_utils import get_pair_result, query_api_concurrently
+from clikraken.clikraken_utils import format_timestamps, asset_pair_short
 from clikraken.clikraken_utils import _tabulate as tabulate
-from clikraken.clikraken_utils import csv
+from clikraken.clikraken_utils import write_csv
+from clikraken.columnar import record_writer
+from clikraken.log_utils import logger
+from clikraken.records import Candle
+
+
+def parse_ohlc(pair, res, typed=False):
+    """
+    Parse the OHLC results of an asset pair, most recent interval first.
+
+    With typed, the times are kept as given by the API (see clikraken.columnar).
+    """
+
+    results = get_pair_result(res, pair)
+
+    if typed:
+        times = [period[0] for period in results]
+    else:
+        # format the whole column of timestamps at once (much faster for big results)
+        times = format_timestamps(period[0] for period in results)
+
+    ohlclist = [Candle(period_time, *period[1:8]) for period, period_time in zip(results, times)]
+
+    # Reverse trade list to have the most recent interval at the top
+    return ohlclist[::-1]
+
+
+def ohlc_rows(pair, res, count, indicators=None, typed=False):
+    """
+    Return the headers and the rows of the count most recent candles of an asset pair,
+    with the values of the indicators (see clikraken.indicators) appended if any.
+
+    With typed, the rows are the ones of the columnar output (see parse_ohlc).
+    """
+
+    candles = parse_ohlc(pair, res, typed)
+    headers = list(Candle._fields)
+
+    if not indicators:
+        return headers, candles[:count]
+
+    # the indicators are computed over all the candles returned by the API
+    from clikraken.indicators import append_indicators
+    labels, rows = append_indicators(candles, indicators, count, typed)
+    return headers + labels, rows
 
 
 def ohlc(args):
     """Get OHLC data for asset pairs for various minute intervals:
     1 (default), 5, 15, 30, 60, 240, 1440, 10800, 21600."""
 
+    # Several asset pairs can be given, they are queried concurrently
+    pairs = [pair.strip() for pair in args.pair.split(',') if pair.strip()]
+
     # Parameters to pass to the API
-    api_params = {
-        'pair': args.pair,
-    }
+    api_params = {}
     if args.since:
         api_params['since'] = args.since
 
@@ -33,40 +76,101 @@ def ohlc(args):
     else:
         interval = 1
 
-    res = query_api('public', 'OHLC', api_params, args)
-
-    results = res[args.pair]
-    last_id = res['last']
-
-    # initialize a list to store the parsed ohlc data
-    ohlclist = []
-
-    for period in results:
-        # Initialize an OrderedDict to garantee the column order
-        # for later use with the tabulate function
-        ohlcdict = OrderedDict()
-        ohlcdict["Time"] = format_timestamp(period[0])
-        ohlcdict["Open"] = period[1]
-        ohlcdict["High"] = period[2]
-        ohlcdict["Low"] = period[3]
-        ohlcdict["Close"] = period[4]
-        ohlcdict["VWAP"] = period[5]
-        ohlcdict["Volume"] = period[6]
-        ohlcdict["Count"] = period[7]
-        ohlclist.append(ohlcdict)
-
-    if not ohlclist:
+    api_params_list = [dict(api_params, pair=pair) for pair in pairs]
+
+    indicators = None
+    if args.indicators:
+        try:
+            from clikraken.indicators import IndicatorError, indicator_labels, parse_indicators
+        except ImportError:
+            logger.error('The numpy package is required for the indicators (pip install numpy)')
+            return
+        try:
+            indicators = parse_indicators(args.indicators)
+        except IndicatorError as e:
+            logger.error(str(e))
+            return
+
+    resample = None
+    if args.resample:
+        try:
+            from clikraken.resample import parse_interval, resample_ohlc
+        except ImportError:
+            logger.error('The numpy package is required for resampling (pip install numpy)')
+            return
+        try:
+            resample = [(label.strip(), parse_interval(label)) for label in args.resample.split(',') if label.strip()]
+        except ValueError as e:
+            logger.error(str(e))
+            return
+        base = int(interval) * 60
+        for label, seconds in resample:
+            if seconds % base:
+                logger.error('Can not resample candles of {}m to {}'.format(interval, label))
+                return
+
+    # add columns to identify the asset pair and the interval when there are several of them
+    prefix = []
+    if len(pairs) > 1:
+        prefix.append("Pair")
+    if resample and len(resample) > 1:
+        prefix.append("Interval")
+
+    def identify(pair, label):
+        return tuple({"Pair": asset_pair_short(pair), "Interval": label}[column] for column in prefix)
+
+    writer = None
+    if args.output:
+        # the values of the indicators are appended to the candles
+        labels = indicator_labels(indicators) if indicators else []
+        writer = record_writer(args.output, Candle, prefix=prefix, suffix=labels)
+        if writer is None:
+            return
+
+    results = query_api_concurrently('public', 'OHLC', api_params_list, args)
+
+    # the series of candles to output, as (asset pair, interval, results)
+    if resample:
+        # all the intervals are built locally from the same candles
+        series = [(pair, label, {pair: resample_ohlc(get_pair_result(res, pair), base, seconds), 'last': res['last']})
+                  for pair, res in zip(pairs, results) if res
+                  for label, seconds in resample]
+    else:
+        series = [(pair, str(interval) + 'm', res) for pair, res in zip(pairs, results) if res]
+
+    if writer is not None:
+        with writer:
+            # one batch per series
+            for pair, label, res in series:
+                _, rows = ohlc_rows(pair, res, args.count, indicators, typed=True)
+                ident = identify(pair, label)
+                writer.write([ident + tuple(row) for row in rows])
         return
 
-    # Reverse trade list to have the most recent interval at the top
-    ohlclist = ohlclist[::-1]
-
     if args.csv:
-        print(csv(ohlclist[:args.count], headers="keys"))
-    else:
-        print('Asset pair: ' + asset_pair_short(args.pair))
-        print('Interval: ' + str(interval) + 'm\n')
+        output = []
+        headers = None
+        for pair, label, res in series:
+            headers, rows = ohlc_rows(pair, res, args.count, indicators)
+            ident = identify(pair, label)
+            output.extend(ident + tuple(row) for row in rows)
+        if output:
+            write_csv(output, headers=prefix + headers)
+        return
+
+    first = True
+    for pair, label, res in series:
+        headers, rows = ohlc_rows(pair, res, args.count, indicators)
+        if not rows:
+            continue
+
+        if not first:
+            print('')
+        first = False
+
+        print('Asset pair: ' + asset_pair_short(pair))
+        print('Interval: ' + label + '\n')
 
-        print(tabulate(ohlclist[:args.count], headers="keys") + '\n')
+        print(tabulate(rows, headers=headers) + '\n')
 
-        print('Last ID = {}'.format(last_id))
+        print('Last ID = {}'.format(res['last']))
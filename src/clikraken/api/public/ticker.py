@@ -13,14 +13,70 @@ from collections import OrderedDict
 from decimal import Decimal
 
 from clikraken.api.api_utils import query_api
-from clikraken.clikraken_utils import asset_pair_short
+from clikraken.api.websocket_client import stream_channel, ws_pair_names
+from clikraken.clikraken_utils import base_quote_short_from_asset_pair, format_timestamp
 from clikraken.clikraken_utils import _tabulate as tabulate
-from clikraken.clikraken_utils import csv
+from clikraken.clikraken_utils import write_csv
+from clikraken.order_book import TerminalRenderer
+
+
+def parse_ticker(pair, pair_res):
+    """Parse the ticker information of an asset pair (from the REST or the WebSocket API)."""
+
+    # Initialize an OrderedDict to garantee the column order
+    # for later use with the tabulate function
+    pticker = OrderedDict()
+
+    base, quote = base_quote_short_from_asset_pair(pair)
+    pticker['pair'] = base + quote
+    pticker['last'] = pair_res['c'][0]  # price only
+    pticker['high'] = pair_res['h'][1]  # last 24h
+    pticker['low'] = pair_res['l'][1]   # last 24h
+    pticker['vol'] = pair_res['v'][1]   # last 24h
+    pticker['wavg'] = pair_res['p'][1]  # last 24h
+
+    # calculate an estimate of the traded volume in quoted currency
+    # for the last 24h: Volume x Average price
+    quote_val = Decimal(pticker['vol']) * Decimal(pticker['wavg'])
+
+    unit_prefix = ''
+    if quote_val >= 10e6:
+        quote_val = quote_val / Decimal(1e6)
+        unit_prefix = 'M'
+    elif quote_val >= 10e3:
+        quote_val = quote_val / Decimal(1e3)
+        unit_prefix = 'k'
+
+    pticker['vol value'] = str(round(quote_val)) + ' ' + unit_prefix + quote
+
+    # get the price only
+    pticker['ask'] = pair_res['a'][0]
+    pticker['bid'] = pair_res['b'][0]
+
+    return pticker
+
+
+def parse_spread(pair, spread):
+    """Parse a message of the spread channel of the WebSocket API: [bid, ask, timestamp, bid volume, ask volume]"""
+
+    pspread = OrderedDict()
+    base, quote = base_quote_short_from_asset_pair(pair)
+    pspread['pair'] = base + quote
+    pspread['time'] = format_timestamp(spread[2])
+    pspread['bid'] = spread[0]
+    pspread['bid volume'] = spread[3]
+    pspread['ask'] = spread[1]
+    pspread['ask volume'] = spread[4]
+    return pspread
 
 
 def ticker(args):
     """Get currency ticker information."""
 
+    if args.stream:
+        stream_ticker([pair.strip() for pair in args.pair.split(',') if pair.strip()], args)
+        return
+
     # Parameters to pass to the API
     api_params = {
         'pair': args.pair,
@@ -30,42 +86,7 @@ def ticker(args):
 
     # the list will contain one OrderedDict containing
     # the parser ticker info per asset pair
-    ticker_list = []
-
-    for pair in res:
-        # extract the results for the current pair
-        pair_res = res[pair]
-
-        # Initialize an OrderedDict to garantee the column order
-        # for later use with the tabulate function
-        pticker = OrderedDict()
-
-        pticker['pair'] = asset_pair_short(pair)
-        pticker['last'] = pair_res['c'][0]  # price only
-        pticker['high'] = pair_res['h'][1]  # last 24h
-        pticker['low'] = pair_res['l'][1]   # last 24h
-        pticker['vol'] = pair_res['v'][1]   # last 24h
-        pticker['wavg'] = pair_res['p'][1]  # last 24h
-
-        # calculate an estimate of the traded volume in quoted currency
-        # for the last 24h: Volume x Average price
-        quote_val = Decimal(pticker['vol']) * Decimal(pticker['wavg'])
-
-        unit_prefix = ''
-        if quote_val >= 10e6:
-            quote_val = quote_val / Decimal(1e6)
-            unit_prefix = 'M'
-        elif quote_val >= 10e3:
-            quote_val = quote_val / Decimal(1e3)
-            unit_prefix = 'k'
-
-        pticker['vol value'] = str(round(quote_val)) + ' ' + unit_prefix + pticker['pair'][-3:]
-
-        # get the price only
-        pticker['ask'] = pair_res['a'][0]
-        pticker['bid'] = pair_res['b'][0]
-
-        ticker_list.append(pticker)
+    ticker_list = [parse_ticker(pair, pair_res) for pair, pair_res in res.items()]
 
     if not ticker_list:
         return
@@ -73,6 +94,34 @@ def ticker(args):
     ticker_list = sorted(ticker_list, key=lambda pticker: pticker['pair'])
 
     if args.csv:
-        print(csv(ticker_list, headers="keys"))
+        write_csv(ticker_list, headers="keys")
     else:
         print(tabulate(ticker_list, headers="keys"))
+
+
+def stream_ticker(pairs, args):
+    """
+    Stream the ticker (or with args.spread, the best bid and ask) of asset pairs from the
+    WebSocket API, as a table updated in place or as CSV rows.
+    """
+
+    ws_pairs = ws_pair_names(pairs)
+    channel = 'spread' if args.spread else 'ticker'
+    parse = parse_spread if args.spread else parse_ticker
+
+    rows = OrderedDict((pair, None) for pair in pairs)
+    renderer = TerminalRenderer()
+    headers = "keys"
+
+    def handle(client, ws_pair, payloads):
+        nonlocal headers
+        pair = ws_pairs.get(ws_pair, ws_pair)
+        row = parse(pair, payloads[0])
+        if args.csv:
+            if write_csv([row], headers=headers):
+                headers = None
+        else:
+            rows[pair] = row
+            renderer.render(tabulate([r for r in rows.values() if r], headers="keys").splitlines())
+
+    stream_channel(ws_pairs, channel, handle, raw=args.raw)
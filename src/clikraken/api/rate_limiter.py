@@ -0,0 +1,163 @@
+# -*- coding: utf8 -*-
+
+"""
+clikraken.api.rate_limiter
+
+This module implements a client-side model of the call counters that
+Kraken uses to rate limit the API, so that queries are delayed instead
+of being rejected with "EAPI:Rate limit exceeded".
+
+Each query increases a counter by the cost of the method, and the counter
+decreases over time at a rate depending on the verification tier of the
+account. When a query would make the counter exceed its maximum, the caller
+is blocked until enough of the counter has decayed. Callers are served in
+the order they asked (the cost is reserved before waiting).
+
+The counters can optionally be stored in a file (protected by a lock),
+so that all clikraken processes of the same host share the same budget.
+
+See https://docs.kraken.com/rest/#section/Rate-Limits
+
+Licensed under the Apache License, Version 2.0. See the LICENSE file.
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+from clikraken.log_utils import logger
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+# (maximum counter, decay rate per second) of the private API counter for each verification tier
+TIERS = {
+    'starter': (15, 0.33),
+    'intermediate': (20, 0.5),
+    'pro': (20, 1.0),
+}
+
+# The public API is limited per IP address, roughly to one call per second.
+PUBLIC_LIMITS = (15, 1.0)
+
+# Cost of the private methods, when different from 1.
+# Orders placement and cancellation are limited separately by the trading engine,
+# so they don't count for the API call counter.
+METHOD_COSTS = {
+    'Ledgers': 2,
+    'QueryLedgers': 2,
+    'TradesHistory': 2,
+    'QueryTrades': 2,
+    'AddOrder': 0,
+    'AddOrderBatch': 0,
+    'CancelOrder': 0,
+    'CancelOrderBatch': 0,
+    'CancelAll': 0,
+}
+
+
+class RateLimiter(object):
+    """Client-side model of Kraken's API call counters"""
+
+    def __init__(self, tier='starter', state_file=None, clock=time.time, sleep=time.sleep):
+        if tier not in TIERS:
+            raise ValueError('Unknown API tier "{}" (expected one of: {})'.format(tier, ', '.join(TIERS)))
+        self.limits = {
+            'public': PUBLIC_LIMITS,
+            'private': TIERS[tier],
+        }
+        if state_file and fcntl is None:
+            logger.warning('Sharing the rate limit between processes is not supported on this platform.')
+            state_file = None
+        self.state_file = state_file
+        self.clock = clock
+        self.sleep = sleep
+        # counters of this process when not shared: {api_type: [counter, timestamp]}
+        self._state = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def cost(api_type, api_method):
+        """Return how much a query increases the counter"""
+        if api_type == 'public':
+            return 1
+        return METHOD_COSTS.get(api_method, 1)
+
+    @contextlib.contextmanager
+    def _locked_state(self):
+        """Give exclusive access to the counters, stored in the state file if any"""
+        with self._lock:
+            if not self.state_file:
+                yield self._state
+                return
+
+            with open(self.state_file, 'a+') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    try:
+                        state = json.loads(f.read() or '{}')
+                    except ValueError:
+                        logger.warning('Invalid rate limit state file {}, resetting it.'.format(self.state_file))
+                        state = {}
+                    yield state
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(state))
+                    f.flush()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _decayed_counter(self, state, api_type, now):
+        """Return the current value of a counter"""
+        _, decay_rate = self.limits[api_type]
+        counter, timestamp = state.get(api_type, (0.0, now))
+        return max(0.0, counter - decay_rate * (now - timestamp))
+
+    def reserve(self, api_type, api_method):
+        """
+        Add the cost of a query to the counter and return how long
+        the caller must wait (in seconds) before sending it.
+        """
+
+        cost = self.cost(api_type, api_method)
+        if not cost:
+            return 0.0
+
+        max_counter, decay_rate = self.limits[api_type]
+
+        with self._locked_state() as state:
+            now = self.clock()
+            # the counter can exceed its maximum, which represents the queries waiting for their turn
+            counter = self._decayed_counter(state, api_type, now) + cost
+            state[api_type] = [counter, now]
+
+        return max(0.0, (counter - max_counter) / decay_rate)
+
+    def acquire(self, api_type, api_method):
+        """Block until a query can be sent without exceeding the rate limit."""
+        wait = self.reserve(api_type, api_method)
+        if wait > 0:
+            logger.debug('Rate limit: waiting {:.2f}s before querying {}'.format(wait, api_method))
+            self.sleep(wait)
+        return wait
+
+    def penalize(self, api_type):
+        """Set a counter to its maximum, e.g. after Kraken reported that the rate limit was exceeded"""
+        max_counter, _ = self.limits[api_type]
+        with self._locked_state() as state:
+            now = self.clock()
+            state[api_type] = [max(max_counter, self._decayed_counter(state, api_type, now)), now]
+
+
+def setup_rate_limiter(tier, state_file=None):
+    """Return the rate limiter corresponding to the settings (None if disabled)"""
+    if not tier or tier == 'none':
+        return None
+    if state_file:
+        state_file = os.path.normpath(os.path.expanduser(state_file))
+    return RateLimiter(tier, state_file)
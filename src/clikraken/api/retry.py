@@ -0,0 +1,253 @@
+# -*- coding: utf8 -*-
+
+"""
+clikraken.api.retry
+
+This module decides when a failed query to Kraken's API can be sent
+again, and how long to wait before (exponential backoff with jitter).
+
+The failures are of two kinds: the queries rejected by Kraken without
+being processed (e.g. invalid nonce, rate limit exceeded), which can
+always be sent again, and the ones of which the outcome is unknown
+(network errors, invalid responses, service unavailable), which Kraken
+may have processed anyway.
+
+The public methods and the read-only private methods are retried in both
+cases. A mutating query of unknown outcome is only sent again when doing
+so can't have an unwanted effect:
+
+- the cancellation of all orders or of a batch of orders: cancelling them
+  again has no further effect;
+- the cancellation of an order: its status is checked with QueryOrders;
+- the placement of an order with a user reference id: the open and closed
+  orders with this user reference, opened since the query was sent, are
+  checked for the order (ignoring the orders already known to be placed
+  by other queries of this process, e.g. identical legs of a ladder).
+
+Any other mutating query (e.g. AddOrder without userref, AddOrderBatch) is
+not sent again, and the error is reported.
+
+Licensed under the Apache License, Version 2.0. See the LICENSE file.
+"""
+
+import random
+import threading
+import time
+from decimal import Decimal
+
+from clikraken.log_utils import logger
+
+# private methods without side effects
+READ_ONLY_METHODS = frozenset([
+    'Balance', 'BalanceEx', 'TradeBalance', 'OpenOrders', 'ClosedOrders', 'QueryOrders',
+    'TradesHistory', 'QueryTrades', 'OpenPositions', 'Ledgers', 'QueryLedgers', 'TradeVolume',
+    'DepositMethods', 'DepositAddresses', 'DepositStatus', 'GetWebSocketsToken',
+])
+
+# mutating methods which have no further effect when sent again after being processed
+IDEMPOTENT_METHODS = frozenset(['CancelAll', 'CancelOrderBatch'])
+
+# errors of the queries which Kraken didn't process
+REJECTED_ERRORS = frozenset([
+    'EAPI:Invalid nonce', 'EAPI:Rate limit exceeded', 'EOrder:Rate limit exceeded',
+    'EService:Busy', 'EService:Deadline elapsed',
+])
+
+# errors of the queries which Kraken may have processed
+TRANSIENT_ERRORS = frozenset(['EService:Unavailable', 'EGeneral:Internal error'])
+
+REJECTED = 'rejected'
+UNKNOWN = 'unknown'
+
+# txids of the orders placed by this process (returned by AddOrder, or found by reconcile)
+_placed_txids = set()
+_placed_lock = threading.Lock()
+
+
+class RetryPolicy(object):
+    """Number of retries and delays between them"""
+
+    def __init__(self, retries=3, backoff=0.5, max_delay=30.0, rand=random.random, sleep=time.sleep):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.rand = rand
+        self.sleep = sleep
+
+    def delay(self, attempt):
+        """
+        Return how long to wait before the retry number attempt (from 0): half of
+        the exponential backoff, plus a random part up to the other half so that
+        the processes which failed at the same time don't retry at the same time.
+        """
+        delay = min(self.max_delay, self.backoff * 2 ** attempt)
+        return delay / 2 + self.rand() * delay / 2
+
+
+def setup_retry_policy(retries, backoff):
+    """Return the retry policy corresponding to the settings (None if disabled)"""
+    if not retries or retries < 0:
+        return None
+    return RetryPolicy(retries, backoff)
+
+
+def classify_failure(res, exc, network_errors):
+    """
+    Return (REJECTED or UNKNOWN, reason) for a query which failed in a way worth
+    retrying, given its response (res) or the exception raised (exc); (None, None)
+    otherwise.
+    """
+
+    if exc is not None:
+        # HTTP errors of requests, or of aiohttp (see clikraken.api.async_client)
+        status = getattr(getattr(exc, 'response', None), 'status_code', None)
+        if status is None and isinstance(getattr(exc, 'status', None), int):
+            status = exc.status
+        if status is not None:
+            if status == 429:
+                return REJECTED, 'HTTP status {}'.format(status)
+            if status >= 500:
+                return UNKNOWN, 'HTTP status {}'.format(status)
+            return None, None
+        if isinstance(exc, network_errors) or isinstance(exc, ValueError):
+            return UNKNOWN, repr(exc)
+        return None, None
+
+    for error in res.get('error') or []:
+        if error in REJECTED_ERRORS:
+            return REJECTED, error
+        if error in TRANSIENT_ERRORS:
+            return UNKNOWN, error
+    return None, None
+
+
+def is_safe_to_repeat(api_type, api_method, api_params):
+    """Return True if a query can be sent again, even if Kraken already processed it"""
+    if api_type == 'public' or api_method in READ_ONLY_METHODS or api_method in IDEMPOTENT_METHODS:
+        return True
+    # orders which are only validated are not placed
+    return api_method in ('AddOrder', 'AddOrderBatch') and str(api_params.get('validate')).lower() == 'true'
+
+
+def should_retry(policy, retries, kind, api_type, api_method, api_params):
+    """
+    Decide whether a query which failed (kind, see classify_failure) after retries
+    retries is sent again. Return None if not, otherwise whether it is safe to send
+    it again right away (False if it must be checked with reconcile first).
+    """
+    if kind is None or policy is None or retries >= policy.retries:
+        return None
+    safe = kind == REJECTED or is_safe_to_repeat(api_type, api_method, api_params)
+    if not safe and not can_reconcile(api_method, api_params):
+        return None
+    return safe
+
+
+def log_retry(api_method, reason, retries, policy, delay):
+    """Log (in debug mode) that a query is sent again (retries is the number of the retry, from 1)"""
+    logger.debug('{} failed ({}), retry {}/{} in {:.2f} s'.format(api_method, reason, retries, policy.retries, delay))
+
+
+def can_reconcile(api_method, api_params):
+    """Return True if it is possible to know whether Kraken processed a query (see reconcile)"""
+    if api_method == 'CancelOrder':
+        return True
+    return api_method == 'AddOrder' and api_params.get('userref') not in (None, '')
+
+
+def _reconcile_cancel(api_params):
+    res = (yield ('private', 'QueryOrders', {'txid': api_params['txid']})).get('result')
+    order = (res or {}).get(api_params['txid'])
+    if order is None:
+        return False, None
+    if order['status'] == 'canceled':
+        return True, {'error': [], 'result': {'count': 1}}
+    if order['status'] in ('open', 'pending'):
+        return True, None
+    # closed or expired in the meantime: cancelling it fails anyway
+    return False, None
+
+
+def record_placed_orders(api_method, res):
+    """Remember the txids of the orders placed by a response, so that reconcile doesn't match them again"""
+    if api_method != 'AddOrder':
+        return
+    txids = (res.get('result') or {}).get('txid') or []
+    with _placed_lock:
+        _placed_txids.update(txids)
+
+
+def _matches(order, api_params, sent):
+    descr = order['descr']
+    if float(order['opentm']) < sent or descr['type'] != api_params['type']:
+        return False
+    if Decimal(order['vol']) != Decimal(str(api_params['volume'])):
+        return False
+    if api_params.get('price') is not None and Decimal(descr['price']) != Decimal(str(api_params['price'])):
+        return False
+    # imported here to avoid circular imports
+    from clikraken.clikraken_utils import same_asset_pair
+    return same_asset_pair(descr['pair'], api_params['pair'])
+
+
+def _reconcile_add(api_params, sent):
+    params = {'userref': api_params['userref']}
+    open_res = (yield ('private', 'OpenOrders', params)).get('result')
+    closed_res = (yield ('private', 'ClosedOrders', dict(params, start=int(sent) - 1))).get('result')
+    if open_res is None or closed_res is None:
+        return False, None
+
+    orders = dict(open_res.get('open') or {})
+    orders.update(closed_res.get('closed') or {})
+    with _placed_lock:
+        # the oldest order matching, which isn't the one of another query
+        for txid, order in sorted(orders.items(), key=lambda kv: float(kv[1]['opentm'])):
+            if txid not in _placed_txids and _matches(order, api_params, sent):
+                _placed_txids.add(txid)
+                return True, {'error': [], 'result': {'txid': [txid],
+                                                      'descr': {'order': order['descr'].get('order', '')}}}
+    return True, None
+
+
+def _reconcile_steps(api_method, api_params, sent):
+    """
+    Generator of the queries (api_type, api_method, api_params) needed by reconcile, which
+    receives their responses and returns the result of reconcile.
+    """
+    if api_method == 'CancelOrder':
+        return (yield from _reconcile_cancel(api_params))
+    return (yield from _reconcile_add(api_params, sent))
+
+
+def reconcile(api_method, api_params, sent, query):
+    """
+    Find out whether Kraken processed a mutating query sent at time sent (see can_reconcile),
+    using query(api_type, api_method, api_params) to query Kraken.
+
+    Return (known, response): known is False if the outcome is still unknown, and
+    response is the response that the query would have had if it was processed (None if not).
+    """
+    steps = _reconcile_steps(api_method, api_params, sent)
+    try:
+        request = next(steps)
+        while True:
+            request = steps.send(query(*request))
+    except StopIteration as e:
+        return e.value
+    except (KeyError, ValueError, ArithmeticError) as e:
+        logger.debug('Could not check the outcome of {}: {!r}'.format(api_method, e))
+        return False, None
+
+
+async def reconcile_async(api_method, api_params, sent, query):
+    """Same as reconcile, with a coroutine function query (see clikraken.api.async_client)"""
+    steps = _reconcile_steps(api_method, api_params, sent)
+    try:
+        request = next(steps)
+        while True:
+            request = steps.send(await query(*request))
+    except StopIteration as e:
+        return e.value
+    except (KeyError, ValueError, ArithmeticError) as e:
+        logger.debug('Could not check the outcome of {}: {!r}'.format(api_method, e))
+        return False, None
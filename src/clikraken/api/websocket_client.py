@@ -0,0 +1,254 @@
+# -*- coding: utf8 -*-
+
+"""
+clikraken.api.websocket_client
+
+This module implements a client of Kraken's public WebSocket API,
+which pushes market data (ticker, trades, spread and order book)
+instead of having to poll the REST API.
+
+It also maintains a local copy of the order book from the snapshot and
+the updates sent on the book channel, verified with the checksums sent
+by Kraken.
+
+The websocket-client package is required (pip install websocket-client),
+it is only imported when a connection is opened.
+
+See https://docs.kraken.com/websockets/
+
+Licensed under the Apache License, Version 2.0. See the LICENSE file.
+"""
+
+import bisect
+import json
+import sys
+import zlib
+from collections import OrderedDict
+from decimal import Decimal
+
+import clikraken.global_vars as gv
+from clikraken.clikraken_utils import base_quote_short_from_asset_pair
+from clikraken.log_utils import logger
+
+# depths of the order book supported by the book channel
+BOOK_DEPTHS = [10, 25, 100, 500, 1000]
+
+# number of levels of each side of the order book used for the checksum
+CHECKSUM_DEPTH = 10
+
+
+class WebSocketError(Exception):
+    """Raised when the WebSocket API can't be used"""
+
+
+class ChecksumError(WebSocketError):
+    """Raised when the local order book doesn't match the checksum sent by Kraken"""
+
+
+def ws_pair_names(pairs):
+    """Map the names of asset pairs used by the WebSocket API (e.g. XBT/EUR) to the given names"""
+    return OrderedDict(('/'.join(base_quote_short_from_asset_pair(pair)), pair) for pair in pairs)
+
+
+def book_depth(count):
+    """Return the smallest depth of the book channel showing at least count levels"""
+    return next((d for d in BOOK_DEPTHS if d >= count), BOOK_DEPTHS[-1])
+
+
+class KrakenWebSocket(object):
+    """Connection to Kraken's public WebSocket API"""
+
+    def __init__(self, url=None, timeout=30):
+        self.url = url or gv.WEBSOCKET_URL
+        self.timeout = timeout
+        self.ws = None
+
+    def connect(self):
+        try:
+            import websocket
+        except ImportError:
+            raise WebSocketError('The websocket-client package is required for streaming '
+                                 '(pip install websocket-client)')
+
+        logger.debug('Connecting to {}'.format(self.url))
+        try:
+            self.ws = websocket.create_connection(self.url, timeout=self.timeout)
+        except (OSError, websocket.WebSocketException) as e:
+            raise WebSocketError('Cannot connect to {}: {}'.format(self.url, e))
+        return self
+
+    def close(self):
+        if self.ws is not None:
+            self.ws.close()
+            self.ws = None
+
+    def send(self, message):
+        logger.debug('WebSocket send: {}'.format(message))
+        self.ws.send(json.dumps(message))
+
+    def subscribe(self, ws_pairs, name, **options):
+        """Subscribe to a channel (ticker, trade, spread, book) for a list of asset pairs (e.g. XBT/EUR)"""
+        self.send({'event': 'subscribe', 'pair': list(ws_pairs), 'subscription': dict(options, name=name)})
+
+    def unsubscribe(self, ws_pairs, name, **options):
+        self.send({'event': 'unsubscribe', 'pair': list(ws_pairs), 'subscription': dict(options, name=name)})
+
+    def messages(self):
+        """
+        Generate the data messages received as tuples (channel name, asset pair, payloads),
+        until the connection is closed. The event messages are only logged.
+        """
+
+        import websocket
+
+        while True:
+            try:
+                raw = self.ws.recv()
+            except websocket.WebSocketConnectionClosedException:
+                raw = ''
+            except (OSError, websocket.WebSocketException) as e:
+                raise WebSocketError('Connection to {} lost: {}'.format(self.url, e))
+
+            if not raw:
+                logger.info('Connection to {} closed.'.format(self.url))
+                return
+
+            msg = json.loads(raw)
+
+            if isinstance(msg, dict):
+                event = msg.get('event')
+                if event == 'subscriptionStatus' and msg.get('status') == 'error':
+                    logger.error('Subscription failed: {}'.format(msg.get('errorMessage')))
+                elif event != 'heartbeat':
+                    logger.debug('WebSocket event: {}'.format(raw))
+                continue
+
+            # [channelID, payload, (payload,) channelName, pair]
+            yield msg[-2], msg[-1], msg[1:-2]
+
+
+def stream_channel(ws_pairs, name, handle, raw=False, **options):
+    """
+    Subscribe to a channel for some asset pairs (names used by the WebSocket API)
+    and call handle(client, ws_pair, payloads) for each message received, until
+    the connection is closed or the user interrupts. In raw mode, the messages
+    are output as JSON lines instead.
+    """
+
+    client = KrakenWebSocket()
+    try:
+        client.connect()
+        client.subscribe(ws_pairs, name, **options)
+        for channel_name, ws_pair, payloads in client.messages():
+            if raw:
+                print(json.dumps([channel_name, ws_pair] + payloads))
+            elif channel_name.split('-')[0] == name:
+                handle(client, ws_pair, payloads)
+            sys.stdout.flush()
+    except WebSocketError as e:
+        logger.error(str(e))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.close()
+
+
+def _checksum_field(value):
+    """Format a price or volume for the checksum: without the decimal point and leading zeros"""
+    return value.replace('.', '').lstrip('0')
+
+
+class _BookSide(object):
+    """One side of the order book, with the prices kept sorted"""
+
+    def __init__(self, descending):
+        self.descending = descending
+        # Decimal price -> (price, volume) as sent by Kraken
+        self.levels = {}
+        # sorted Decimal prices, ascending
+        self.prices = []
+
+    def clear(self):
+        self.levels.clear()
+        del self.prices[:]
+
+    def update(self, price, volume):
+        key = Decimal(price)
+        if Decimal(volume) == 0:
+            if self.levels.pop(key, None) is not None:
+                del self.prices[bisect.bisect_left(self.prices, key)]
+        else:
+            if key not in self.levels:
+                bisect.insort(self.prices, key)
+            self.levels[key] = (price, volume)
+
+    def best(self, count):
+        """Return the count best levels as (price, volume)"""
+        prices = self.prices[::-1][:count] if self.descending else self.prices[:count]
+        return [self.levels[p] for p in prices]
+
+    def truncate(self, depth):
+        """Only keep the depth best levels"""
+        if len(self.prices) <= depth:
+            return
+        if self.descending:
+            removed, self.prices = self.prices[:-depth], self.prices[-depth:]
+        else:
+            removed, self.prices = self.prices[depth:], self.prices[:depth]
+        for p in removed:
+            del self.levels[p]
+
+
+class LocalOrderBook(object):
+    """Order book of an asset pair maintained from the messages of the book channel"""
+
+    def __init__(self, depth=10):
+        self.depth = depth
+        self.asks = _BookSide(descending=False)
+        self.bids = _BookSide(descending=True)
+        self.ready = False
+
+    def apply(self, payloads):
+        """
+        Apply the payloads of a message of the book channel (snapshot or updates).
+
+        Return False if the message was ignored (updates received before a snapshot).
+        Raise ChecksumError if the book doesn't match the checksum of the message.
+        """
+
+        checksum = None
+        for payload in payloads:
+            if 'as' in payload or 'bs' in payload:
+                self.asks.clear()
+                self.bids.clear()
+                self.ready = True
+            if not self.ready:
+                return False
+            for key, side in (('as', self.asks), ('a', self.asks), ('bs', self.bids), ('b', self.bids)):
+                for level in payload.get(key, []):
+                    side.update(level[0], level[1])
+            checksum = payload.get('c', checksum)
+
+        self.asks.truncate(self.depth)
+        self.bids.truncate(self.depth)
+
+        if checksum is not None and int(checksum) != self.checksum():
+            # wait for a new snapshot
+            self.ready = False
+            raise ChecksumError('Order book checksum mismatch')
+
+        return True
+
+    def checksum(self):
+        """CRC32 of the best asks (ascending) and the best bids (descending)"""
+        fields = []
+        for side in (self.asks, self.bids):
+            for price, volume in side.best(CHECKSUM_DEPTH):
+                fields.append(_checksum_field(price))
+                fields.append(_checksum_field(volume))
+        return zlib.crc32(''.join(fields).encode()) & 0xffffffff
+
+    def snapshot(self, count=None):
+        """Return the book as {side: OrderedDict(price: volume)}, best prices first (see clikraken.order_book)"""
+        count = count or self.depth
+        return {'asks': OrderedDict(self.asks.best(count)), 'bids': OrderedDict(self.bids.best(count))}
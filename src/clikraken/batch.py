@@ -0,0 +1,82 @@
+# -*- coding: utf8 -*-
+
+"""
+clikraken.batch
+
+This module implements the batch mode, which runs many subcommands
+sequentially in the same process.
+
+Since the configuration, the API key and the connection to Kraken's API
+(a keep-alive HTTP session) are shared by all the subcommands, this avoids
+paying the startup cost and a new TLS handshake for each of them.
+
+Licensed under the Apache License, Version 2.0. See the LICENSE file.
+"""
+
+import argparse
+import shlex
+import sys
+
+import clikraken.global_vars as gv
+from clikraken.log_utils import logger
+
+# global options which are inherited by each subcommand of the batch
+GLOBAL_OPTIONS = ['debug', 'raw', 'csv', 'csvseparator', 'cron', 'timings', 'no_daemon', 'record', 'replay']
+
+
+def parse_batch_line(line):
+    """
+    Split a line of the batch file into a list of arguments.
+
+    Empty lines and comments (starting with #) are ignored and return an
+    empty list. A leading "clikraken" is optional and discarded.
+    """
+
+    argv = shlex.split(line, comments=True)
+    if argv and argv[0] == 'clikraken':
+        argv = argv[1:]
+    return argv
+
+
+def batch(args):
+    """Run the subcommands listed in a file or on stdin."""
+
+    # imported here to avoid circular imports
+    from clikraken.clikraken import execute
+    from clikraken.clikraken_cmd import parse_args
+    from clikraken.timings import Timings
+
+    # the timings of the batch command itself, if enabled
+    timings = gv.TIMINGS
+
+    for lineno, line in enumerate(args.file, start=1):
+        try:
+            argv = parse_batch_line(line)
+        except ValueError as e:
+            logger.error('Line {}: cannot parse "{}" ({})'.format(lineno, line.strip(), e))
+            continue
+
+        if not argv:
+            continue
+
+        print(args.delimiter.format(cmd=' '.join(argv)))
+        sys.stdout.flush()
+
+        # global options given to the batch command are the defaults of each line
+        defaults = argparse.Namespace(**{opt: getattr(args, opt) for opt in GLOBAL_OPTIONS})
+
+        try:
+            cmd_args = parse_args(argv, namespace=defaults)
+            if getattr(cmd_args, 'subparser_name', None) == 'batch':
+                logger.error('Line {}: nested batch commands are not supported'.format(lineno))
+                continue
+            # each subcommand has its own timings (with --timings or the setting timings_file)
+            execute(cmd_args, Timings())
+        except SystemExit as e:
+            # Errors from the argument parsing or from the API queries
+            # terminate the current subcommand only, not the whole batch.
+            if e.code:
+                logger.debug('Line {}: subcommand exited with code {}'.format(lineno, e.code))
+        finally:
+            gv.TIMINGS = timings
+            sys.stdout.flush()
@@ -0,0 +1,181 @@
+# -*- coding: utf8 -*-
+
+"""
+clikraken.cassette
+
+This module records the queries to Kraken's API and their responses
+into cassettes (option --record), and replays them without any network
+access (option --replay), so that the subcommands can be tested and
+benchmarked offline.
+
+A cassette is a JSON lines file (gzip compressed if its name ends with
+.gz), with one query per line:
+
+    {"api_type": "private", "method": "Balance", "params": {}, "response": {...}}
+
+The parameters are recorded as strings and without the nonce. In replay,
+the responses to the same query are served in the order they were
+recorded, and the last one again once they are exhausted. A query which
+wasn't recorded gets an error response.
+
+Licensed under the Apache License, Version 2.0. See the LICENSE file.
+"""
+
+import atexit
+import copy
+import json
+import threading
+
+import clikraken.global_vars as gv
+from clikraken.timings import timed
+
+
+def open_cassette(path, mode='r'):
+    """Open a cassette file, compressed with gzip if its name ends with .gz"""
+    if path.endswith('.gz'):
+        import gzip
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def query_params(params):
+    """Return the parameters of a query as recorded in a cassette"""
+    return {k: str(v) for k, v in (params or {}).items() if k != 'nonce'}
+
+
+def _query_key(api_type, method, params):
+    return json.dumps([api_type, method, params], sort_keys=True)
+
+
+def cassette_entry(api_type, method, params, response):
+    """Return a line of a cassette (without line terminator)"""
+    return json.dumps({'api_type': api_type, 'method': method, 'params': query_params(params),
+                       'response': response})
+
+
+class CassetteAPI(object):
+    """Stand-in for clikraken's KrakenAPI serving the responses recorded in a cassette"""
+
+    uri = 'https://api.kraken.com'
+    key = ''
+    secret = ''
+
+    def __init__(self, path):
+        self.path = path
+        # query key -> responses, as JSON (decoded when served, like the real responses)
+        self.responses = {}
+        self.served = {}
+        self.response = None
+        self._session = None
+        self._lock = threading.Lock()
+
+        with open_cassette(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                key = _query_key(entry['api_type'], entry['method'], query_params(entry['params']))
+                self.responses.setdefault(key, []).append(json.dumps(entry['response']))
+
+    @property
+    def session(self):
+        # only needed by the concurrent queries, to size the (unused) pool of connections
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+        return self._session
+
+    def has_query(self, api_type, method, params=None):
+        """Return True if the cassette has responses to a query"""
+        return _query_key(api_type, method, query_params(params)) in self.responses
+
+    def _replay(self, api_type, method, data):
+        params = query_params(data)
+        key = _query_key(api_type, method, params)
+        with self._lock:
+            responses = self.responses.get(key)
+            if not responses:
+                return {'error': ['ECassette:No response recorded for {} {}'.format(
+                    method, json.dumps(params, sort_keys=True))]}
+            count = self.served.get(key, 0)
+            self.served[key] = count + 1
+        with timed('json'):
+            return json.loads(responses[min(count, len(responses) - 1)])
+
+    def query_public(self, method, data=None, timeout=None):
+        return self._replay('public', method, data)
+
+    def query_private(self, method, data=None, timeout=None):
+        return self._replay('private', method, data)
+
+    def query_private_json(self, method, data=None, timeout=None):
+        return self._replay('private', method, data)
+
+
+class RecordingAPI(object):
+    """Wrapper of clikraken's KrakenAPI writing the queries and their responses to a cassette"""
+
+    def __init__(self, api, path):
+        self.api = api
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open_cassette(path, 'w')
+        atexit.register(self.close)
+
+    def __getattr__(self, name):
+        # everything else (uri, session, key...) is the wrapped API's
+        if name == 'api':
+            raise AttributeError(name)
+        return getattr(self.api, name)
+
+    def __copy__(self):
+        # the API objects can't be shared between threads (see api_utils._query_in_thread)
+        clone = object.__new__(RecordingAPI)
+        clone.__dict__.update(self.__dict__)
+        clone.api = copy.copy(self.api)
+        return clone
+
+    def _record(self, api_type, method, data, query):
+        # the parameters are recorded before krakenex adds the nonce to them
+        params = query_params(data)
+        response = query(method, data)
+        with self._lock:
+            self._file.write(cassette_entry(api_type, method, params, response) + '\n')
+            self._file.flush()
+        return response
+
+    def query_public(self, method, data=None, timeout=None):
+        return self._record('public', method, data, lambda m, d: self.api.query_public(m, d, timeout))
+
+    def query_private(self, method, data=None, timeout=None):
+        return self._record('private', method, data, lambda m, d: self.api.query_private(m, d, timeout))
+
+    def query_private_json(self, method, data=None, timeout=None):
+        return self._record('private', method, data, lambda m, d: self.api.query_private_json(m, d, timeout))
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+def replay_cassette(path):
+    """Set the API up to replay a cassette instead of querying Kraken"""
+
+    gv.KRAKEN_API = CassetteAPI(path)
+    gv.API_KEY_LOADED = True
+
+    # the asset pairs come from the cassette too (not from the cache, which changes over time),
+    # otherwise the names of the asset pairs are compared as they are
+    gv.ASSET_PAIRS_CACHE_TTL = 0
+    if not gv.KRAKEN_API.has_query('public', 'AssetPairs'):
+        gv.ASSET_PAIRS_INDEX = {}
+
+
+def record_cassette(path):
+    """Record the queries to Kraken's API (once set up, see load_api_keyfile) to a cassette"""
+
+    gv.KRAKEN_API = RecordingAPI(gv.KRAKEN_API, path)
+
+    # record the asset pairs, so that they are the same in replay
+    gv.ASSET_PAIRS_CACHE_TTL = 0
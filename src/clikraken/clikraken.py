@@ -9,19 +9,20 @@ Command line client for the Kraken exchange
 Licensed under the Apache License, Version 2.0. See the LICENSE file.
 """
 
+import sys
+
+import clikraken
+import clikraken.global_vars as gv
 from clikraken.api.api_utils import load_api_keyfile
+from clikraken.cassette import record_cassette, replay_cassette
 from clikraken.clikraken_cmd import parse_args
 from clikraken.clikraken_utils import load_config
+from clikraken.daemon import forward
+from clikraken.timings import Timings, report_timings, timed
 
 
-def main():
-    """Entrypoint for clikraken"""
-
-    load_config()
-    load_api_keyfile()
-
-    # parse arguments
-    args = parse_args()
+def run_command(args):
+    """Call the function associated with the parsed arguments"""
 
     # args.sub_func contains the function to be called
     # depending on the chosen subcommand. If no subcomand
@@ -29,4 +30,52 @@ def main():
     func = args.sub_func if 'sub_func' in args else args.main_func
 
     if callable(func):
-        func(args)
+        # only set the API up for subcommands which actually query it
+        # (and only once, so that it can be reused by subsequent commands)
+        if getattr(func, 'uses_api', False) and gv.KRAKEN_API is None:
+            with timed('load_api_keyfile'):
+                if getattr(args, 'replay', None):
+                    # offline, from the responses recorded in a cassette
+                    replay_cassette(args.replay)
+                else:
+                    load_api_keyfile()
+                    if getattr(args, 'record', None):
+                        record_cassette(args.record)
+        with timed('command'):
+            func(args)
+
+
+def execute(args, timings):
+    """Run the command of the parsed arguments, measuring its phases if the timings are enabled"""
+
+    gv.TIMINGS = timings if args.timings or gv.TIMINGS_FILE else None
+
+    try:
+        run_command(args)
+    finally:
+        if gv.TIMINGS is not None:
+            command = getattr(args, 'subparser_name', None) or 'clikraken'
+            report_timings(timings, command, show=args.timings, path=gv.TIMINGS_FILE)
+            gv.TIMINGS = None
+
+
+def main():
+    """Entrypoint for clikraken"""
+
+    # the first phases are measured before knowing whether the timings are enabled
+    timings = Timings(clikraken._import_start)
+    timings.add('imports', *timings.totals())
+
+    with timings.phase('load_config'):
+        load_config()
+
+    # parse arguments
+    with timings.phase('parse_args'):
+        args = parse_args()
+
+    # run the subcommand in the daemon if one is running (see clikraken.daemon)
+    code = forward(args)
+    if code is not None:
+        sys.exit(code)
+
+    execute(args, timings)
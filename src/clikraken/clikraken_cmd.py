@@ -12,6 +12,7 @@ Licensed under the Apache License, Version 2.0. See the LICENSE file.
 
 import argparse
 import codecs
+import importlib
 import textwrap
 from decimal import Decimal
 import sys
@@ -19,28 +20,42 @@ import sys
 import clikraken.global_vars as gv
 import clikraken.clikraken_utils as ck_utils
 
-from clikraken.api.public.asset_pairs import asset_pairs
-from clikraken.api.public.depth import depth
-from clikraken.api.public.last_trades import last_trades
-from clikraken.api.public.ticker import ticker
-from clikraken.api.public.ohlc import ohlc
-
-from clikraken.api.private.cancel_order import cancel_order
-from clikraken.api.private.get_balance import get_balance
-from clikraken.api.private.get_deposit_addresses import get_deposit_addresses
-from clikraken.api.private.get_deposit_methods import get_deposit_methods
-from clikraken.api.private.get_ledgers import get_ledgers
-from clikraken.api.private.get_trade_balance import get_trade_balance
-from clikraken.api.private.list_closed_orders import list_closed_orders
-from clikraken.api.private.list_open_orders import list_open_orders
-from clikraken.api.private.list_open_positions import list_open_positions
-from clikraken.api.private.place_order import place_order
-from clikraken.api.private.trades import trades
-
-
-def parse_args():
+
+class LazyCommand(object):
     """
-    Argument parsing
+    Reference to a subcommand function by module and function name.
+
+    The module is only imported when the subcommand is actually called,
+    so that the (heavy) dependencies of the API modules are not loaded
+    for commands that don't need them (e.g. `clikraken -V`).
+    """
+
+    def __init__(self, module_name, func_name, uses_api=True):
+        self.module_name = module_name
+        self.func_name = func_name
+        # whether the Kraken API object must be set up before calling the function
+        self.uses_api = uses_api
+
+    def load(self):
+        """Import the module and return the subcommand function"""
+        module = importlib.import_module(self.module_name)
+        return getattr(module, self.func_name)
+
+    def __call__(self, args):
+        return self.load()(args)
+
+    def __repr__(self):
+        return 'LazyCommand({}.{})'.format(self.module_name, self.func_name)
+
+
+def api_command(api_type, name, func_name=None):
+    """Declare a subcommand implemented in the module clikraken.api.<api_type>.<name>"""
+    return LazyCommand('clikraken.api.{}.{}'.format(api_type, name), func_name or name)
+
+
+def build_parser():
+    """
+    Build the argument parser
 
     The client works by giving general options, a subcommand
     and then options specific to the subcommand.
@@ -57,6 +72,9 @@ def parse_args():
     # some help strings that are repeated many times
     pairs_help = "comma delimited list of asset pairs"
     pair_help = "asset pair"
+    output_help = ("write the results with typed columns to FILE in FORMAT: parquet|arrow "
+                   "(requires the pyarrow package)")
+    output_kwargs = dict(nargs=2, default=None, metavar=('FORMAT', 'FILE'), help=output_help)
 
     epilog_str = textwrap.dedent("""\
         To get help about a subcommand use: clikraken SUBCOMMAND --help
@@ -85,6 +103,16 @@ def parse_args():
     parser.add_argument('--csvseparator', default=';', help='separator character to use with CSV output')
     parser.add_argument('--cron', action='store_true',
                         help='activate cron mode (tone down errors due to timeouts or unavailable Kraken service)')
+    parser.add_argument('--timings', action='store_true',
+                        help='print the time spent in each phase of the command to stderr')
+    parser.add_argument('--no-daemon', action='store_true',
+                        help='run the command in this process even if the clikraken daemon is running')
+    cassette_group = parser.add_mutually_exclusive_group()
+    cassette_group.add_argument('--record', metavar='CASSETTE',
+                                help='record the queries to the API and their responses to a cassette file '
+                                     '(JSON lines, gzip compressed if the name ends with .gz)')
+    cassette_group.add_argument('--replay', metavar='CASSETTE',
+                                help='replay the responses recorded in a cassette file instead of querying the API')
     parser.set_defaults(main_func=None)
 
     subparsers = parser.add_subparsers(dest='subparser_name', help='available subcommands')
@@ -106,7 +134,9 @@ def parse_args():
         aliases=['ap'],
         help='[public] Get the list of available asset pairs',
         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-    parser_asset_pairs.set_defaults(sub_func=asset_pairs)
+    parser_asset_pairs.add_argument('-r', '--refresh', action='store_true',
+                                    help="query the API even if the list of asset pairs is cached")
+    parser_asset_pairs.set_defaults(sub_func=api_command('public', 'asset_pairs'))
 
     # Ticker
     parser_ticker = subparsers.add_parser(
@@ -116,7 +146,11 @@ def parse_args():
         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser_ticker.add_argument('-p', '--pair', default=gv.TICKER_PAIRS,
                                help=pairs_help + " to get info on. ")
-    parser_ticker.set_defaults(sub_func=ticker)
+    parser_ticker.add_argument('--stream', action='store_true',
+                               help="stream the ticker from the WebSocket API until interrupted")
+    parser_ticker.add_argument('--spread', action='store_true',
+                               help="with --stream, stream the best bid and ask instead")
+    parser_ticker.set_defaults(sub_func=api_command('public', 'ticker'))
 
     # Market depth (Order book)
     parser_depth = subparsers.add_parser(
@@ -124,9 +158,15 @@ def parse_args():
         aliases=['d'],
         help='[public] Get the current market depth data',
         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-    parser_depth.add_argument('-p', '--pair', default=gv.DEFAULT_PAIR, help=pair_help)
+    parser_depth.add_argument('-p', '--pair', default=gv.DEFAULT_PAIR, help=pairs_help + " (queried concurrently)")
     parser_depth.add_argument('-c', '--count', type=int, default=7, help="maximum number of asks/bids.")
-    parser_depth.set_defaults(sub_func=depth)
+    parser_depth.add_argument('-w', '--watch', type=float, metavar='INTERVAL', default=None,
+                              help="query the market depth every INTERVAL seconds and only redraw what changed")
+    parser_depth.add_argument('--stream', action='store_true',
+                              help="maintain the order book from the WebSocket API until interrupted")
+    parser_depth.add_argument('--changes-only', action='store_true',
+                              help="with --watch or --stream, output the changes of the order book levels instead")
+    parser_depth.set_defaults(sub_func=api_command('public', 'depth'))
 
     # List of last trades
     parser_last_trades = subparsers.add_parser(
@@ -134,11 +174,24 @@ def parse_args():
         aliases=['lt'],
         help='[public] Get the last trades',
         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-    parser_last_trades.add_argument('-p', '--pair', default=gv.DEFAULT_PAIR, help=pair_help)
+    parser_last_trades.add_argument('-p', '--pair', default=gv.DEFAULT_PAIR,
+                                    help=pairs_help + " (queried concurrently)")
     parser_last_trades.add_argument('-s', '--since', default=None,
                                     help="return trade data since given id")
     parser_last_trades.add_argument('-c', '--count', type=int, default=15, help="maximum number of trades.")
-    parser_last_trades.set_defaults(sub_func=last_trades)
+    parser_last_trades.add_argument('-f', '--follow', action='store_true',
+                                    help="keep polling for new trades and show rolling statistics")
+    parser_last_trades.add_argument('--stream', action='store_true',
+                                    help="stream the new trades from the WebSocket API until interrupted")
+    parser_last_trades.add_argument('--poll', type=float, default=5,
+                                    help="seconds between two queries in follow mode")
+    parser_last_trades.add_argument('-w', '--windows', default='1m,5m,15m',
+                                    help="comma delimited list of windows of the rolling statistics "
+                                         "in follow mode (e.g. 30s, 5m, 1h)")
+    parser_last_trades.add_argument('--buffer', type=int, default=1000,
+                                    help="number of recent trades kept in memory in follow mode, "
+                                         "at most (per asset pair and window)")
+    parser_last_trades.set_defaults(sub_func=api_command('public', 'last_trades'))
 
     # Open High Low Close data
     parser_ohlc = subparsers.add_parser(
@@ -147,15 +200,23 @@ def parse_args():
         help='[public] Get the ohlc data',
         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser_ohlc.add_argument(
-        '-p', '--pair', default=gv.DEFAULT_PAIR, help=pair_help)
+        '-p', '--pair', default=gv.DEFAULT_PAIR, help=pairs_help + " (queried concurrently)")
     parser_ohlc.add_argument(
         '-i', '--interval', default=1,
         help="return ohlc data for interval in minutes; 1, 5, 15, 30, 60, 240, 1440, 10800, 21600.")
     parser_ohlc.add_argument('-s', '--since', default=None,
                              help="return ohlc data since given id")
+    parser_ohlc.add_argument('-r', '--resample', default=None,
+                             help="comma delimited list of intervals (e.g. 3m,15m,2h,1d) built locally from the "
+                                  "candles of --interval (one query for all of them). Requires numpy.")
     parser_ohlc.add_argument('-c', '--count', type=int,
                              default=50, help="maximum number of intervals.")
-    parser_ohlc.set_defaults(sub_func=ohlc)
+    parser_ohlc.add_argument('--indicators', default=None,
+                             help="comma delimited list of indicators appended to the candles, given as "
+                                  "name:period[:parameter] with name in sma|ema|rsi|bb|atr "
+                                  "(e.g. sma:20,ema:12,rsi:14,bb:20:2,atr:14). Requires numpy.")
+    parser_ohlc.add_argument('--output', **output_kwargs)
+    parser_ohlc.set_defaults(sub_func=api_command('public', 'ohlc'))
 
     # -----------
     # Private API
@@ -167,7 +228,7 @@ def parse_args():
         aliases=['bal'],
         help='[private] Get your current balance',
         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-    parser_balance.set_defaults(sub_func=get_balance)
+    parser_balance.set_defaults(sub_func=api_command('private', 'get_balance'))
 
     # User trade balance
     parser_trade_balance = subparsers.add_parser(
@@ -175,7 +236,7 @@ def parse_args():
         aliases=['tbal'],
         help='[private] Get your current trade balance',
         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-    parser_trade_balance.set_defaults(sub_func=get_trade_balance)
+    parser_trade_balance.set_defaults(sub_func=api_command('private', 'get_trade_balance'))
 
     # Place an order
     parser_place = subparsers.add_parser(
@@ -197,7 +258,46 @@ def parse_args():
     parser_place.add_argument('-T', '--nopost', action='store_true',
                               help="disable 'post-only' option (for limit taker orders)")
     parser_place.add_argument('-v', '--validate', action='store_true', help="validate inputs only. do not submit order")
-    parser_place.set_defaults(sub_func=place_order)
+    parser_place.set_defaults(sub_func=api_command('private', 'place_order'))
+
+    # place many orders
+    parser_place_batch = subparsers.add_parser(
+        'place_batch',
+        aliases=['pb'],
+        help='[private] Place many orders from a file, or a ladder or grid of orders',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser_place_batch.add_argument('-f', '--file', default=None,
+                                    help="CSV or JSON file of orders (fields: pair, type, ordertype, volume, "
+                                    "price, leverage, userref), - for stdin")
+    parser_place_batch.add_argument('--ladder', choices=['sell', 'buy'], default=None,
+                                    help='generate a ladder of orders of this type from --start to --end')
+    parser_place_batch.add_argument('--grid', type=Decimal, default=None, metavar='CENTER',
+                                    help='generate a grid of orders from --start to --end, '
+                                    'buying below CENTER and selling above')
+    parser_place_batch.add_argument('--start', type=Decimal, default=None, help='first price of the ladder or grid')
+    parser_place_batch.add_argument('--end', type=Decimal, default=None, help='last price of the ladder or grid')
+    parser_place_batch.add_argument('--steps', type=int, default=None, help='number of prices of the ladder or grid')
+    parser_place_batch.add_argument('--volume', type=Decimal, default=None,
+                                    help='total volume of the ladder or grid')
+    parser_place_batch.add_argument('--distribution', choices=['flat', 'linear', 'geometric'], default='flat',
+                                    help='distribution of the volume from --start to --end')
+    parser_place_batch.add_argument('--factor', type=Decimal, default=Decimal(2),
+                                    help='ratio of the volumes at --end and --start (linear and geometric)')
+    parser_place_batch.add_argument('-p', '--pair', default=gv.DEFAULT_PAIR, help='default ' + pair_help)
+    parser_place_batch.add_argument('-t', '--ordertype', choices=['market', 'limit'], default='limit',
+                                    help="default order type")
+    parser_place_batch.add_argument('-l', '--leverage', default="none", help='default leverage for margin trading')
+    parser_place_batch.add_argument('-r', '--userref', help="default user reference id (e.g. to cancel all the "
+                                    "orders with cancel --userref)")
+    parser_place_batch.add_argument('-T', '--nopost', action='store_true',
+                                    help="disable 'post-only' option (for limit taker orders)")
+    parser_place_batch.add_argument('-v', '--validate', action='store_true',
+                                    help="validate the orders with Kraken only. do not submit them")
+    parser_place_batch.add_argument('-n', '--dry-run', action='store_true',
+                                    help="only check the orders locally and show them")
+    parser_place_batch.add_argument('--no-batch', action='store_true',
+                                    help='place the orders with concurrent AddOrder queries instead of AddOrderBatch')
+    parser_place_batch.set_defaults(sub_func=api_command('private', 'place_batch'))
 
     # cancel an order
     parser_cancel = subparsers.add_parser(
@@ -205,8 +305,14 @@ def parse_args():
         aliases=['x'],
         help='[private] Cancel orders',
         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-    parser_cancel.add_argument('order_ids', type=str, nargs='+', help="transaction ids")
-    parser_cancel.set_defaults(sub_func=cancel_order)
+    parser_cancel.add_argument('order_ids', type=str, nargs='*', help="transaction ids")
+    parser_cancel.add_argument('-a', '--all', action='store_true', help='cancel all the open orders (CancelAll)')
+    parser_cancel.add_argument('-p', '--pair', default=None, help='cancel the open orders of an asset pair')
+    parser_cancel.add_argument('-u', '--userref', type=int, default=None,
+                               help='cancel the open orders with a user reference id')
+    parser_cancel.add_argument('--no-batch', action='store_true',
+                               help='cancel the orders with concurrent CancelOrder queries instead of CancelOrderBatch')
+    parser_cancel.set_defaults(sub_func=api_command('private', 'cancel_order'))
 
     # List of open orders
     parser_olist = subparsers.add_parser(
@@ -217,7 +323,7 @@ def parse_args():
     parser_olist.add_argument('-p', '--pair', default=None, help=pair_help)
     parser_olist.add_argument('-i', '--txid', default=None,
                               help='comma delimited list of transaction ids to query info about (20 maximum)')
-    parser_olist.set_defaults(sub_func=list_open_orders)
+    parser_olist.set_defaults(sub_func=api_command('private', 'list_open_orders'))
 
     # List of open positions
     parser_oplist = subparsers.add_parser(
@@ -225,7 +331,7 @@ def parse_args():
         aliases=['pos'],
         help='[private] Get a list of your open positions',
         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-    parser_oplist.set_defaults(sub_func=list_open_positions)
+    parser_oplist.set_defaults(sub_func=api_command('private', 'list_open_positions'))
 
     # List of closed orders
     parser_clist = subparsers.add_parser(
@@ -236,7 +342,10 @@ def parse_args():
     parser_clist.add_argument('-p', '--pair', default=None, help=pair_help)
     parser_clist.add_argument('-i', '--txid', default=None,
                               help='comma delimited list of transaction ids to query info about (20 maximum)')
-    parser_clist.set_defaults(sub_func=list_closed_orders)
+    parser_clist.add_argument('-l', '--local', action='store_true',
+                              help='query the local mirror of the history (see the sync command) instead of the API')
+    parser_clist.add_argument('--output', **output_kwargs)
+    parser_clist.set_defaults(sub_func=api_command('private', 'list_closed_orders'))
 
     # Get ledgers info
     parser_ledgers = subparsers.add_parser(
@@ -264,11 +373,20 @@ def parse_args():
         '-o', '--ofs',
         default=None,
         help='result offset')
+    parser_ledgers.add_argument(
+        '-l', '--local',
+        action='store_true',
+        help='query the local mirror of the history (see the sync command) instead of the API')
+    parser_ledgers.add_argument(
+        '-A', '--all',
+        action='store_true',
+        help='fetch all the pages of results (streamed in CSV and raw mode, most recent first)')
     parser_ledgers.add_argument(
         '-i', '--id',
         default=None,
         help='comma delimited list of ledger ids to query info about (20 maximum)')
-    parser_ledgers.set_defaults(sub_func=get_ledgers)
+    parser_ledgers.add_argument('--output', **output_kwargs)
+    parser_ledgers.set_defaults(sub_func=api_command('private', 'get_ledgers'))
 
     # Get trades info
     parser_trades = subparsers.add_parser(
@@ -293,12 +411,70 @@ def parse_args():
         '-o', '--ofs',
         default=None,
         help='result offset')
+    parser_trades.add_argument(
+        '-l', '--local',
+        action='store_true',
+        help='query the local mirror of the history (see the sync command) instead of the API')
+    parser_trades.add_argument(
+        '-A', '--all',
+        action='store_true',
+        help='fetch all the pages of results (streamed in CSV and raw mode, most recent first)')
     parser_trades.add_argument(
         '-i', '--id',
         default=None,
         help='comma delimited list of transaction ids to query info about (20 maximum)')
     parser_trades.add_argument('-p', '--pair', default=None, help=pair_help)
-    parser_trades.set_defaults(sub_func=trades)
+    parser_trades.add_argument('--output', **output_kwargs)
+    parser_trades.set_defaults(sub_func=api_command('private', 'trades'))
+
+    # Profit and loss
+    parser_pnl = subparsers.add_parser(
+        'pnl',
+        help='[private] Get the realized profit and loss and the cost basis of the holdings',
+        description='The lots are matched per asset pair, in its quote currency: the sells of an asset '
+                    'bought against another quote currency (e.g. bought with EUR, sold for USD) have no '
+                    'lots to match and are left out of the realized PnL.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser_pnl.add_argument(
+        '-m', '--method',
+        choices=['fifo', 'lifo', 'average'],
+        default='fifo',
+        help='how the sells are matched with the lots bought')
+    parser_pnl.add_argument(
+        '-P', '--period',
+        choices=['day', 'week', 'month', 'year', 'all'],
+        default='month',
+        help='period of the realized PnL (days in UTC)')
+    parser_pnl.add_argument(
+        '-H', '--holdings',
+        action='store_true',
+        help='output the cost basis and unrealized PnL of the holdings instead of the realized PnL')
+    parser_pnl.add_argument(
+        '-l', '--local',
+        action='store_true',
+        help='use the local mirror of the history (see the sync command) instead of the API, '
+             'only processing the trades added since the previous run')
+    parser_pnl.add_argument(
+        '--rebuild',
+        action='store_true',
+        help='with --local, process all the trades again')
+    parser_pnl.add_argument('-p', '--pair', default=None, help=pair_help)
+    parser_pnl.set_defaults(sub_func=api_command('private', 'pnl'))
+
+    # Synchronize the local mirror of the history
+    parser_sync = subparsers.add_parser(
+        'sync',
+        help='[private] Synchronize the local mirror of ledgers, trades and closed orders',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser_sync.add_argument(
+        '-t', '--tables',
+        default='all',
+        help='comma delimited list of histories to synchronize. Possible values: all|ledgers|trades|closed_orders')
+    parser_sync.add_argument(
+        '-f', '--full',
+        action='store_true',
+        help='fetch the whole history again instead of only the new entries')
+    parser_sync.set_defaults(sub_func=api_command('private', 'sync'))
 
     # User Funding
 
@@ -309,7 +485,7 @@ def parse_args():
         help='[private] Get deposit methods',
         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser_deposit_methods.add_argument('-a', '--asset', default=gv.DEFAULT_ASSET, help='asset being deposited')
-    parser_deposit_methods.set_defaults(sub_func=get_deposit_methods)
+    parser_deposit_methods.set_defaults(sub_func=api_command('private', 'get_deposit_methods'))
 
     # Deposit Addresses
     parser_deposit_addresses = subparsers.add_parser(
@@ -322,9 +498,51 @@ def parse_args():
     parser_deposit_addresses.add_argument('-n', '--new', action='store_true',
                                           help="whether or not to generate a new address")
     parser_deposit_addresses.add_argument('-1', '--one', action='store_true', help="return just one address")
-    parser_deposit_addresses.set_defaults(sub_func=get_deposit_addresses)
+    parser_deposit_addresses.set_defaults(sub_func=api_command('private', 'get_deposit_addresses'))
+
+    # Batch mode
+    parser_batch = subparsers.add_parser(
+        'batch',
+        help='[clikraken] Run many subcommands in one process',
+        description='Run the subcommands listed in a file (one per line, e.g. "ticker -p XXBTZEUR") '
+                    'sequentially in the same process, reusing the same connection to Kraken\'s API. '
+                    'Global options given before "batch" apply to every line.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser_batch.add_argument('file', nargs='?', type=argparse.FileType('r'), default='-',
+                              help="file containing the list of subcommands ('-' for stdin)")
+    parser_batch.add_argument('-d', '--delimiter', default='=== {cmd}',
+                              help="line printed before the result of each subcommand "
+                                   "('{cmd}' is replaced by the subcommand line)")
+    parser_batch.set_defaults(sub_func=LazyCommand('clikraken.batch', 'batch', uses_api=False))
+
+    # Daemon mode
+    parser_serve = subparsers.add_parser(
+        'serve',
+        help='[clikraken] Run the daemon running the subcommands of the clikraken command',
+        description='Run a long-lived process holding the API key, the connection to Kraken\'s API, '
+                    'the rate limiter and the caches. While it runs, the clikraken command forwards '
+                    'the subcommands querying the API to it through a Unix socket (setting daemon_socket).',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser_serve.add_argument('-k', '--keepalive', type=float, default=30,
+                              help="seconds of inactivity after which the API is queried to keep "
+                                   "the connection open (0 to disable)")
+    parser_serve.set_defaults(sub_func=LazyCommand('clikraken.daemon', 'serve'))
+
+    return parser
+
+
+def parse_args(argv=None, namespace=None):
+    """
+    Argument parsing
+
+    Parse the arguments given in argv (defaults to the command line arguments)
+    and set the related global variables. An optional namespace can be given
+    to provide default values for the global options.
+    """
+
+    parser = build_parser()
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv, namespace)
 
     # make sure that either sub_func or main_func is defined
     # otherwise just print usage and exit
@@ -335,6 +553,7 @@ def parse_args():
         sys.exit(0)
 
     gv.CRON = args.cron
+    gv.DEBUG = args.debug
 
     # Trick from https://stackoverflow.com/a/37059682/862188
     # in order to be able to parse things like "\t" or "\\" for example
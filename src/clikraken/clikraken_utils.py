@@ -9,20 +9,27 @@ clikraken's modules.
 Licensed under the Apache License, Version 2.0. See the LICENSE file.
 """
 
-import arrow
 import configparser
+import itertools
 import json
 import os
-from functools import partial
-
-from tabulate import tabulate
+import sys
 
 import clikraken.global_vars as gv
 from clikraken import __version__
 from clikraken.log_utils import logger
+from clikraken.timings import timed
+
 
+# Note: arrow (used by clikraken.timestamp_utils) and tabulate are rather slow to import, so they are
+# only imported when first needed in order to keep the startup fast.
 
-_tabulate = partial(tabulate, floatfmt='.12g')
+def _tabulate(*args, **kwargs):
+    """Wrapper around tabulate with a better default representation of floats"""
+    with timed('tabulate'):
+        from tabulate import tabulate
+        kwargs.setdefault('floatfmt', '.12g')
+        return tabulate(*args, **kwargs)
 
 
 def load_config():
@@ -48,6 +55,16 @@ def load_config():
 
     gv.TZ = conf.get('timezone')
     gv.TRADING_AGREEMENT = conf.get('trading_agreement')
+    gv.MAX_CONCURRENT_QUERIES = conf.getint('max_concurrent_queries')
+    gv.API_TIER = conf.get('api_tier')
+    gv.RATE_LIMIT_FILE = conf.get('rate_limit_file')
+    gv.NONCE_FILE = conf.get('nonce_file')
+    gv.MAX_RETRIES = conf.getint('max_retries')
+    gv.RETRY_BACKOFF = conf.getfloat('retry_backoff')
+    gv.TIMINGS_FILE = conf.get('timings_file')
+    gv.DAEMON_SOCKET = conf.get('daemon_socket')
+    gv.ASSET_PAIRS_CACHE_TTL = conf.getint('asset_pairs_cache_ttl')
+    gv.WEBSOCKET_URL = conf.get('websocket_url')
 
 
 def version(args=None):
@@ -55,14 +72,37 @@ def version(args=None):
     print('clikraken version: {}'.format(__version__))
 
 
+def _timestamp_formatter():
+    """Return the timestamp formatter for the configured timezone"""
+    formatter = _timestamp_formatters.get(gv.TZ)
+    if formatter is None:
+        from clikraken.timestamp_utils import TimestampFormatter
+        formatter = _timestamp_formatters[gv.TZ] = TimestampFormatter(gv.TZ)
+    return formatter
+
+
+_timestamp_formatters = {}
+
+
 def humanize_timestamp(ts):
     """Humanize a UNIX timestamp."""
-    return arrow.get(ts).humanize()
+    return humanize_timestamps([ts])[0]
+
+
+def humanize_timestamps(timestamps, now=None):
+    """Humanize a list of UNIX timestamps (relatively to the same current time)."""
+    from clikraken.timestamp_utils import humanize_many
+    return humanize_many(timestamps, now)
 
 
 def format_timestamp(ts):
     """Format a UNIX timestamp to truncated ISO8601 format."""
-    return arrow.get(ts).to(gv.TZ).replace(microsecond=0).format('YYYY-MM-DD HH:mm:ssZZ')
+    return _timestamp_formatter().format(ts)
+
+
+def format_timestamps(timestamps):
+    """Format a list of UNIX timestamps to truncated ISO8601 format."""
+    return _timestamp_formatter().format_many(timestamps)
 
 
 def print_results(res):
@@ -71,11 +111,31 @@ def print_results(res):
         print(json.dumps(res, indent=2))
 
 
+def _pair_index():
+    """
+    Return the index of asset pairs built from Kraken's asset pairs metadata.
+
+    The index is loaded on first use, and only if the API is available.
+    """
+    if gv.ASSET_PAIRS_INDEX is None and gv.KRAKEN_API is not None:
+        # imported here to avoid circular imports
+        from clikraken.api.asset_pairs_index import load_pair_index
+        gv.ASSET_PAIRS_INDEX = load_pair_index()
+    return gv.ASSET_PAIRS_INDEX or {}
+
+
 def base_quote_short_from_asset_pair(ap_str):
     """Try to identify the short version of the base and quote of the asset pair"""
 
     ap_str = ap_str.upper()
 
+    # use the asset pairs metadata if available
+    entry = _pair_index().get(ap_str)
+    if entry is not None:
+        _, base, quote = entry
+        return base, quote
+
+    # otherwise guess from the name of the asset pair
     if len(ap_str) == 8:
         # XABCZDEF
         base = ap_str[1:4] if ap_str[0] in ['Z', 'X'] else ap_str[:4]
@@ -98,6 +158,10 @@ def base_quote_short_from_asset_pair(ap_str):
             # assume EFG is the quote ¯\_(ツ)_/¯
             base = ap_str[:4]
             quote = ap_str[4:]
+    else:
+        # assume the quote is the last 3 characters
+        base = ap_str[:-3]
+        quote = ap_str[-3:]
 
     return base, quote
 
@@ -108,6 +172,16 @@ def asset_pair_short(ap_str):
     return base + quote
 
 
+def same_asset_pair(ap_str1, ap_str2):
+    """Check if two names (e.g. XETHZEUR and ETHEUR) refer to the same asset pair"""
+    index = _pair_index()
+    entry1 = index.get(ap_str1.upper())
+    entry2 = index.get(ap_str2.upper())
+    if entry1 is not None and entry2 is not None:
+        return entry1[0] == entry2[0]
+    return ap_str1 in [ap_str2, asset_pair_short(ap_str2)]
+
+
 def check_trading_agreement():
     if gv.TRADING_AGREEMENT != 'agree':
         logger.warn('Before being able to use the Kraken API for market orders, '
@@ -123,16 +197,60 @@ def output_default_settings_ini(args):
     print(gv.DEFAULT_SETTINGS_INI)
 
 
-def csv(items, headers=None):
-    output = []
-    # Headers
+def _csv_field(value, separator):
+    """Render a value as a CSV field, quoted if needed as per RFC 4180"""
+    field = str(value)
+    if separator in field or '"' in field or '\n' in field or '\r' in field:
+        field = '"{}"'.format(field.replace('"', '""'))
+    return field
+
+
+def csv_lines(items, headers=None, separator=None):
+    """
+    Generate the lines (without line terminator) of the CSV representation of items.
+
+    items is an iterable of rows, either mappings (their values are used)
+    or sequences, and is consumed lazily. headers is an optional list of
+    column names, or "keys" to use the keys of the first row (or its
+    field names for records, see clikraken.records).
+    """
+
+    separator = separator or gv.CSV_SEPARATOR
+    items = iter(items)
+
+    if headers == "keys":
+        first = next(items, None)
+        if first is None:
+            return
+        headers = list(first.keys() if hasattr(first, 'keys') else first._fields)
+        items = itertools.chain([first], items)
+
     if headers is not None:
-        if headers == "keys":
-            headers = items[0].keys()
-        output += [headers]
-    # Items
+        yield separator.join(_csv_field(h, separator) for h in headers)
+
     for item in items:
-        it = [val for val in item.values()]
-        output += [it]
-    # Render output as txt
-    return '\n'.join([(gv.CSV_SEPARATOR).join([str(i) for i in o]) for o in output])
+        values = item.values() if hasattr(item, 'values') else item
+        yield separator.join(_csv_field(v, separator) for v in values)
+
+
+def csv(items, headers=None):
+    """Return the CSV representation of items as a string (see csv_lines)"""
+    return '\n'.join(csv_lines(items, headers))
+
+
+def write_csv(items, headers=None, file=None):
+    """
+    Write the CSV representation of items (see csv_lines) to a file (stdout by default),
+    one row at a time so that the whole table is never held in memory.
+
+    Return the number of rows written (excluding the headers).
+    """
+
+    file = file or sys.stdout
+    count = -1 if headers is not None else 0
+    for line in csv_lines(items, headers):
+        file.write(line)
+        file.write('\n')
+        count += 1
+    file.flush()
+    return max(count, 0)
@@ -0,0 +1,180 @@
+# -*- coding: utf8 -*-
+
+"""
+clikraken.columnar
+
+This module writes records (see clikraken.records) to typed columnar
+files, Parquet or Arrow IPC, for the --output option.
+
+Unlike the CSV output, the columns keep their types: prices, volumes
+and amounts are decimals, times are UTC timestamps and counts are
+integers. The rows are written in batches (one row group of the Parquet
+file, or one record batch of the Arrow file, per batch), so big exports
+are streamed to the disk as the pages of results arrive.
+
+The pyarrow package is required (pip install pyarrow).
+
+Licensed under the Apache License, Version 2.0. See the LICENSE file.
+"""
+
+import itertools
+from decimal import Decimal
+
+from clikraken.log_utils import logger
+from clikraken.records import Candle, ClosedOrder, HistoryTrade, LedgerEntry
+
+FORMATS = ('parquet', 'arrow')
+
+# kinds of columns (the columns of the records are text unless listed in RECORD_TYPES)
+TEXT = 'text'
+DECIMAL = 'decimal'
+TIMESTAMP = 'timestamp'
+INTEGER = 'integer'
+BOOLEAN = 'boolean'
+# computed values (e.g. the indicators of ohlc), NaN when not available
+FLOAT = 'float'
+
+# Kraken's amounts have at most 10 decimals, and the integer part at most 20 digits
+DECIMAL_PRECISION = 38
+DECIMAL_SCALE = 18
+
+# number of rows per batch when the rows are not already split in pages
+BATCH_SIZE = 50000
+
+RECORD_TYPES = {
+    HistoryTrade: {
+        'time': TIMESTAMP, 'vol': DECIMAL, 'price': DECIMAL, 'cost': DECIMAL, 'fee': DECIMAL, 'margin': DECIMAL,
+    },
+    LedgerEntry: {
+        'time': TIMESTAMP, 'amount': DECIMAL, 'fee': DECIMAL, 'balance': DECIMAL,
+    },
+    ClosedOrder: {
+        'vol': DECIMAL, 'vol_exec': DECIMAL, 'price': DECIMAL, 'cost': DECIMAL, 'fee': DECIMAL, 'viqc': BOOLEAN,
+        'closing_date': TIMESTAMP,
+    },
+    Candle: {
+        'Time': TIMESTAMP, 'Open': DECIMAL, 'High': DECIMAL, 'Low': DECIMAL, 'Close': DECIMAL, 'VWAP': DECIMAL,
+        'Volume': DECIMAL, 'Count': INTEGER,
+    },
+}
+
+
+class OutputError(Exception):
+    """Raised when the columnar output can't be written"""
+
+
+def _arrow_type(kind):
+    import pyarrow as pa
+    return {
+        TEXT: pa.string(),
+        DECIMAL: pa.decimal128(DECIMAL_PRECISION, DECIMAL_SCALE),
+        TIMESTAMP: pa.timestamp('us', tz='UTC'),
+        INTEGER: pa.int64(),
+        BOOLEAN: pa.bool_(),
+        FLOAT: pa.float64(),
+    }[kind]
+
+
+def _convert(kind, values):
+    """Convert the values of a column as given by the API (strings, seconds) for pyarrow"""
+    if kind == DECIMAL:
+        return [None if v is None else Decimal(v) for v in values]
+    if kind == TIMESTAMP:
+        # microseconds since the epoch
+        return [None if v is None else round(float(v) * 1000000) for v in values]
+    if kind == INTEGER:
+        return [None if v is None else int(v) for v in values]
+    if kind == FLOAT:
+        return [None if v is None or v != v else float(v) for v in values]
+    return values
+
+
+class ColumnarWriter(object):
+    """
+    Write rows (sequences of values as given by the API) to a Parquet or Arrow IPC file.
+
+    The file is only created by the first batch written (or by close, for an empty result).
+    """
+
+    def __init__(self, fmt, path, fields, types=None):
+        if fmt not in FORMATS:
+            raise OutputError('Unknown output format "{}" (possible values: {})'.format(fmt, ', '.join(FORMATS)))
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise OutputError('The pyarrow package is required for the {} output (pip install pyarrow)'.format(fmt))
+
+        types = types or {}
+        self.fmt = fmt
+        self.path = path
+        self.kinds = [types.get(field, TEXT) for field in fields]
+        self.schema = pa.schema([(field, _arrow_type(kind)) for field, kind in zip(fields, self.kinds)])
+        self.writer = None
+        self.rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _open(self):
+        if self.fmt == 'parquet':
+            import pyarrow.parquet as pq
+            self.writer = pq.ParquetWriter(self.path, self.schema)
+        else:
+            import pyarrow as pa
+            self.writer = pa.ipc.new_file(self.path, self.schema)
+
+    def write(self, rows):
+        """Write a batch of rows (one row group). Return the number of rows written."""
+
+        import pyarrow as pa
+
+        rows = list(rows)
+        if not rows:
+            return 0
+
+        columns = zip(*rows)
+        arrays = [pa.array(_convert(kind, column), type=field.type)
+                  for kind, column, field in zip(self.kinds, columns, self.schema)]
+        batch = pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+        if self.writer is None:
+            self._open()
+        self.writer.write_batch(batch)
+
+        self.rows += len(rows)
+        return len(rows)
+
+    def write_all(self, rows, batch_size=BATCH_SIZE):
+        """Write an iterable of rows, consumed lazily, in batches of batch_size rows"""
+        rows = iter(rows)
+        while self.write(itertools.islice(rows, batch_size)):
+            pass
+        return self.rows
+
+    def close(self):
+        if self.writer is None:
+            # write the schema even if there was no result
+            self._open()
+        self.writer.close()
+        logger.info('{} rows written to {}'.format(self.rows, self.path))
+
+
+def record_writer(output, record_type, prefix=(), suffix=()):
+    """
+    Return a ColumnarWriter for the records of record_type (see RECORD_TYPES),
+    given the value of the --output option (format, path), or None after
+    logging the error if the output can't be written.
+
+    prefix is an optional list of additional text columns, before the fields of the records,
+    and suffix an optional list of additional float columns, after them.
+    """
+    fmt, path = output
+    types = dict(RECORD_TYPES[record_type], **{field: FLOAT for field in suffix})
+    try:
+        return ColumnarWriter(fmt, path, list(prefix) + list(record_type._fields) + list(suffix), types)
+    except OutputError as e:
+        logger.error(str(e))
+        return None
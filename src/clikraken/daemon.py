@@ -0,0 +1,380 @@
+# -*- coding: utf8 -*-
+
+"""
+clikraken.daemon
+
+This module implements the daemon mode (`clikraken serve`): a long-lived
+process holding the API key, the keep-alive connection to Kraken's API,
+the rate limiter and the caches (e.g. asset pairs), which runs the
+subcommands forwarded by the clikraken command over a Unix socket.
+
+The clikraken command forwards its arguments to the daemon if one is
+running (see the setting daemon_socket), then streams back the output
+and exits with the exit code of the subcommand. Otherwise, or for the
+subcommands which can't be forwarded, the subcommand runs in-process.
+
+The subcommands are run one at a time, since they share the process-wide
+state (global variables, standard output, current directory).
+
+The protocol is one JSON line from the client (the request), then frames
+from the daemon: one byte for the kind of frame (see below), the length
+of the data (4 bytes, big endian) and the data.
+
+Licensed under the Apache License, Version 2.0. See the LICENSE file.
+"""
+
+import json
+import logging
+import os
+import socket
+import struct
+import sys
+
+import clikraken.global_vars as gv
+from clikraken.log_utils import logger
+
+# kinds of frames sent by the daemon
+STDOUT = b'o'
+STDERR = b'e'
+# exit code of the subcommand (the last frame)
+EXIT = b'x'
+# the daemon can't run the subcommand, which must run in-process
+FALLBACK = b'f'
+
+_HEADER = struct.Struct('>cI')
+
+# the output is sent when this much of it is buffered (or when flushed)
+_BUFFER_SIZE = 65536
+
+# options of the subcommands which run until interrupted, holding the daemon
+_LONG_RUNNING_OPTIONS = ['follow', 'watch', 'stream']
+
+
+def socket_path(setting=None):
+    """Return the path of the socket of the daemon given the setting daemon_socket (None if disabled)"""
+    setting = gv.DAEMON_SOCKET if setting is None else setting
+    if setting == 'none':
+        return None
+    return os.path.expanduser(setting) if setting else os.path.join(gv.CACHE_DIR, 'daemon.sock')
+
+
+def _forwardable(args):
+    """Return True if the subcommand of the parsed arguments can be run by the daemon"""
+
+    func = args.sub_func if 'sub_func' in args else None
+    if getattr(args, 'no_daemon', False) or not getattr(func, 'uses_api', False):
+        return False
+    # the daemon has its own connection to the API
+    if getattr(args, 'record', None) or getattr(args, 'replay', None):
+        return False
+    if getattr(func, 'module_name', None) == __name__:
+        return False
+    if any(getattr(args, option, None) for option in _LONG_RUNNING_OPTIONS):
+        return False
+    # the standard input isn't forwarded
+    return not any(value is sys.stdin or value == '-' for value in vars(args).values())
+
+
+def _request(argv):
+    return {
+        'argv': list(argv),
+        'cwd': os.getcwd(),
+        # settings overridden by environment variables (see load_config)
+        'env': {k: v for k, v in os.environ.items() if k.startswith('CLIKRAKEN_')},
+        # the daemon only runs the subcommands of clients using the same key and settings
+        'keyfile': gv.KRAKEN_API_KEYFILE,
+        'settings': gv.USER_SETTINGS_PATH,
+    }
+
+
+def _recv_exactly(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError('Connection to the clikraken daemon closed')
+        data += chunk
+    return data
+
+
+def forward(args, argv=None):
+    """
+    Run the subcommand in the daemon if one is running, given the parsed
+    arguments and the command line arguments (defaults to sys.argv[1:]).
+
+    Return the exit code of the subcommand, or None if it must run in-process.
+    """
+
+    path = socket_path()
+    if path is None or not _forwardable(args) or not os.path.exists(path):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        # stale socket of a daemon which isn't running anymore
+        sock.close()
+        return None
+
+    with sock:
+        request = _request(sys.argv[1:] if argv is None else argv)
+        sock.sendall(json.dumps(request).encode() + b'\n')
+
+        streams = {STDOUT: sys.stdout, STDERR: sys.stderr}
+        try:
+            while True:
+                kind, size = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+                data = _recv_exactly(sock, size).decode('utf-8')
+                if kind == EXIT:
+                    return int(data)
+                if kind == FALLBACK:
+                    logger.debug('Running in-process: {}'.format(data))
+                    return None
+                streams[kind].write(data)
+                streams[kind].flush()
+        except (EOFError, OSError) as e:
+            logger.error('Lost the connection to the clikraken daemon: {}'.format(e))
+            return 1
+
+
+class _Output(object):
+    """Output of a subcommand sent to the client, buffered"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.kind = STDOUT
+        self.buffer = []
+        self.size = 0
+
+    def write(self, kind, text):
+        # keep the order of the output between stdout and stderr
+        if kind != self.kind:
+            self.flush()
+            self.kind = kind
+        data = text.encode('utf-8')
+        self.buffer.append(data)
+        self.size += len(data)
+        if self.size >= _BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            data = b''.join(self.buffer)
+            self.buffer, self.size = [], 0
+            self.send(self.kind, data)
+
+    def send(self, kind, data):
+        self.conn.sendall(_HEADER.pack(kind, len(data)) + data)
+
+
+class _Stream(object):
+    """File-like object writing to an _Output (replacing sys.stdout or sys.stderr)"""
+
+    encoding = 'utf-8'
+
+    def __init__(self, output, kind):
+        self.output = output
+        self.kind = kind
+
+    def write(self, text):
+        self.output.write(self.kind, text)
+        return len(text)
+
+    def flush(self):
+        self.output.flush()
+
+    def isatty(self):
+        return False
+
+
+def _set_stream(handler, stream):
+    """Set the stream of a logging handler (like StreamHandler.setStream, which needs Python 3.7)"""
+    handler.acquire()
+    try:
+        handler.flush()
+        handler.stream = stream
+    finally:
+        handler.release()
+
+
+class _Redirected(object):
+    """Context manager redirecting the output (and the logs) of the daemon to a client"""
+
+    def __init__(self, output):
+        self.stdout = _Stream(output, STDOUT)
+        self.stderr = _Stream(output, STDERR)
+
+    def __enter__(self):
+        self.saved = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = self.stdout, self.stderr
+        self.handlers = [(h, h.stream) for h in logger.handlers if isinstance(h, logging.StreamHandler)]
+        for handler, _ in self.handlers:
+            _set_stream(handler, self.stderr if handler.level >= logging.WARNING else self.stdout)
+        return self
+
+    def __exit__(self, *exc):
+        for handler, stream in self.handlers:
+            _set_stream(handler, stream)
+        sys.stdout, sys.stderr = self.saved
+        return False
+
+
+class _Environment(object):
+    """Context manager setting the clikraken environment variables of a client"""
+
+    def __init__(self, env):
+        self.env = env
+
+    def __enter__(self):
+        self.saved = {k: v for k, v in os.environ.items() if k.startswith('CLIKRAKEN_')}
+        self._set(self.env)
+        return self
+
+    def __exit__(self, *exc):
+        self._set(self.saved)
+        return False
+
+    @staticmethod
+    def _set(env):
+        for k in [k for k in os.environ if k.startswith('CLIKRAKEN_')]:
+            del os.environ[k]
+        os.environ.update(env)
+
+
+def _exit_code(e):
+    """Return the exit code of a SystemExit exception (printing its message if any)"""
+    if e.code is None or isinstance(e.code, int):
+        return e.code or 0
+    print(e.code, file=sys.stderr)
+    return 1
+
+
+def _run(request):
+    """Run a forwarded subcommand (the output is redirected to the client) and return its exit code"""
+
+    # imported here to avoid circular imports
+    from clikraken.clikraken import execute
+    from clikraken.clikraken_cmd import parse_args
+    from clikraken.clikraken_utils import load_config
+    from clikraken.timings import Timings
+
+    cwd = os.getcwd()
+    try:
+        os.chdir(request['cwd'])
+        with _Environment(request['env']):
+            timings = Timings()
+            with timings.phase('load_config'):
+                load_config()
+            with timings.phase('parse_args'):
+                args = parse_args(request['argv'])
+            execute(args, timings)
+    except SystemExit as e:
+        return _exit_code(e)
+    except Exception:
+        logger.exception('Exception while running the subcommand!')
+        return 1
+    finally:
+        os.chdir(cwd)
+    return 0
+
+
+def _peer_uid(conn):
+    """Return the user id of the client process (None if unknown)"""
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+    creds = struct.Struct('3i')
+    _, uid, _ = creds.unpack(conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, creds.size))
+    return uid
+
+
+def handle(conn):
+    """Run the subcommand forwarded by a client"""
+
+    request = json.loads(conn.makefile('rb').readline().decode('utf-8'))
+    output = _Output(conn)
+
+    uid = _peer_uid(conn)
+    if uid is not None and uid != os.getuid():
+        output.send(FALLBACK, b'the daemon belongs to another user')
+        return
+    if request['keyfile'] != gv.KRAKEN_API_KEYFILE or request['settings'] != gv.USER_SETTINGS_PATH:
+        output.send(FALLBACK, b'the daemon uses another API key or settings file')
+        return
+
+    with _Redirected(output):
+        code = _run(request)
+        output.flush()
+    output.send(EXIT, str(code).encode())
+
+
+def _keep_warm():
+    """Query the API so that the keep-alive connection isn't closed for inactivity"""
+    # imported here to avoid circular imports
+    from clikraken.api.api_utils import query_kraken
+    query_kraken('public', 'Time', {})
+
+
+def _listen(path):
+    """Return the socket listening at path (None if a daemon is already running)"""
+
+    if os.path.exists(path):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+        except OSError:
+            # stale socket of a daemon which isn't running anymore
+            os.unlink(path)
+        else:
+            return None
+        finally:
+            sock.close()
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # only the user can connect to the socket (the daemon can place orders)
+    umask = os.umask(0o177)
+    try:
+        server.bind(path)
+    finally:
+        os.umask(umask)
+    server.listen(16)
+    return server
+
+
+def serve(args):
+    """Run the daemon, until interrupted."""
+
+    path = socket_path()
+    if path is None:
+        logger.error('The daemon is disabled (setting daemon_socket)')
+        return
+
+    server = _listen(path)
+    if server is None:
+        logger.error('A clikraken daemon is already listening on {}'.format(path))
+        return
+
+    logger.info('Listening on {}'.format(path))
+    if args.keepalive:
+        _keep_warm()
+        server.settimeout(args.keepalive)
+
+    try:
+        while True:
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                _keep_warm()
+                continue
+            with conn:
+                conn.settimeout(None)
+                try:
+                    handle(conn)
+                except (OSError, ValueError, KeyError) as e:
+                    logger.warning('Lost the connection to a client: {!r}'.format(e))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        os.unlink(path)
@@ -22,6 +22,21 @@ DEFAULT_USER_SETTINGS_PATH = os.path.expanduser('~/.config/clikraken/settings.in
 USER_SETTINGS_PATH = os.getenv('CLIKRAKEN_USER_SETTINGS_PATH', DEFAULT_USER_SETTINGS_PATH)
 USER_SETTINGS_PATH = os.path.normpath(USER_SETTINGS_PATH)
 
+# Resolve userpath to an absolute path
+DEFAULT_CACHE_DIR = os.path.expanduser('~/.cache/clikraken')
+# If the environment variable is set, override the default value
+CACHE_DIR = os.getenv('CLIKRAKEN_CACHE_DIR', DEFAULT_CACHE_DIR)
+CACHE_DIR = os.path.normpath(CACHE_DIR)
+
+# Cache of the asset pairs metadata
+ASSET_PAIRS_CACHE_PATH = os.path.join(CACHE_DIR, 'asset_pairs.json')
+
+# Resolve userpath to an absolute path
+DEFAULT_HISTORY_DB_PATH = os.path.expanduser('~/.local/share/clikraken/history.sqlite')
+# If the environment variable is set, override the default value
+HISTORY_DB_PATH = os.getenv('CLIKRAKEN_HISTORY_DB_PATH', DEFAULT_HISTORY_DB_PATH)
+HISTORY_DB_PATH = os.path.normpath(HISTORY_DB_PATH)
+
 # Default settings
 DEFAULT_SETTINGS_INI = """[clikraken]
 # default currency pair when no option '-p' or '--pair' is given
@@ -40,6 +55,50 @@ ticker_currency_pairs = XBTUSD,XBTEUR,ETHUSD,ETHEUR
 # Timezone for displaying date and time infos
 timezone = Europe/Berlin
 
+# maximum number of queries sent concurrently to the API
+# (e.g. when querying several asset pairs with depth, ohlc or last_trades)
+max_concurrent_queries = 8
+
+# How long (in seconds) the list of asset pairs is cached in
+# CLIKRAKEN_CACHE_DIR (default ~/.cache/clikraken), 0 to disable the cache
+asset_pairs_cache_ttl = 86400
+
+# Verification tier of your Kraken account, used to avoid exceeding the
+# API rate limit: starter, intermediate or pro (or none to disable)
+api_tier = starter
+
+# Optional path to a file used to share the API rate limit counter
+# between all clikraken processes of this host (e.g. parallel cron jobs)
+rate_limit_file =
+
+# File shared by all the clikraken processes of this host to allocate
+# the nonces of the private queries, so that parallel processes (e.g.
+# cron jobs) don't reuse nonces. Empty for a file in CLIKRAKEN_CACHE_DIR
+# (default ~/.cache/clikraken), none to disable
+nonce_file =
+
+# How many times a failed query is sent again (0 to disable), waiting
+# about retry_backoff seconds before the first retry, twice as long
+# before the next one, etc. Orders are only placed again if Kraken
+# can be checked for them (i.e. with a user reference id)
+max_retries = 3
+retry_backoff = 0.5
+
+# Optional path to a file to which the time spent in each phase of the
+# commands is written (see the --timings option): in the format of the
+# textfile collector of Prometheus' node exporter if its extension is
+# .prom, otherwise appended as JSON lines
+timings_file =
+
+# Path of the Unix socket of the daemon (clikraken serve), to which the
+# clikraken command forwards the subcommands if the daemon is running.
+# Empty for a socket in CLIKRAKEN_CACHE_DIR (default ~/.cache/clikraken),
+# none to disable
+daemon_socket =
+
+# URL of Kraken's WebSocket API (used by the --stream options)
+websocket_url = wss://ws.kraken.com
+
 # API Trading Agreement
 # (change to "agree" after reading https://www.kraken.com/u/settings/api)
 trading_agreement = not_agree
@@ -53,5 +112,21 @@ DEFAULT_ASSET = None
 TZ = None
 TRADING_AGREEMENT = None
 CRON = None
+DEBUG = None
 API_KEY_LOADED = None
 CSV_SEPARATOR = None
+MAX_CONCURRENT_QUERIES = None
+API_TIER = None
+RATE_LIMIT_FILE = None
+RATE_LIMITER = None
+NONCE_FILE = None
+NONCE_ALLOCATOR = None
+MAX_RETRIES = None
+RETRY_BACKOFF = None
+RETRY_POLICY = None
+TIMINGS_FILE = None
+TIMINGS = None
+DAEMON_SOCKET = None
+ASSET_PAIRS_CACHE_TTL = None
+ASSET_PAIRS_INDEX = None
+WEBSOCKET_URL = None
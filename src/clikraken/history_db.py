@@ -0,0 +1,190 @@
+# -*- coding: utf8 -*-
+
+"""
+clikraken.history_db
+
+This module manages a local SQLite database mirroring the history
+of the account (ledger entries, trades and closed orders), so that
+it doesn't need to be downloaded from Kraken's API again and again.
+
+The entries are stored as returned by the API (JSON), along with a few
+indexed columns used for filtering, and are upserted by their id, so
+that storing the same entries several times is harmless.
+
+Licensed under the Apache License, Version 2.0. See the LICENSE file.
+"""
+
+import json
+import os
+import sqlite3
+
+import clikraken.global_vars as gv
+from clikraken.api.asset_pairs_index import asset_short
+
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ledgers (
+    id TEXT PRIMARY KEY,
+    refid TEXT,
+    time REAL,
+    type TEXT,
+    asset TEXT,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS ledgers_time ON ledgers (time);
+
+CREATE TABLE IF NOT EXISTS trades (
+    txid TEXT PRIMARY KEY,
+    ordertxid TEXT,
+    pair TEXT,
+    time REAL,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS trades_time ON trades (time);
+
+CREATE TABLE IF NOT EXISTS closed_orders (
+    txid TEXT PRIMARY KEY,
+    status TEXT,
+    pair TEXT,
+    time REAL,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS closed_orders_time ON closed_orders (time);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    name TEXT PRIMARY KEY,
+    last_time REAL
+);
+
+CREATE TABLE IF NOT EXISTS saved_state (
+    name TEXT PRIMARY KEY,
+    data TEXT
+);
+"""
+
+# name of the table -> (name of the id column, function extracting the indexed columns from an entry)
+TABLES = {
+    'ledgers': ('id', lambda e: [('refid', e['refid']), ('time', float(e['time'])),
+                                 ('type', e['type']), ('asset', asset_short(e['asset']))]),
+    'trades': ('txid', lambda e: [('ordertxid', e['ordertxid']), ('pair', e['pair']),
+                                  ('time', float(e['time']))]),
+    'closed_orders': ('txid', lambda e: [('status', e['status']), ('pair', e['descr']['pair']),
+                                         ('time', float(e['closetm']))]),
+}
+
+
+class HistoryDB(object):
+    """Local SQLite mirror of the account history"""
+
+    def __init__(self, path=None):
+        self.path = path or gv.HISTORY_DB_PATH
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript(SCHEMA)
+        self.conn.execute('PRAGMA user_version = {}'.format(SCHEMA_VERSION))
+
+    def close(self):
+        self.conn.close()
+
+    def upsert(self, table, entries):
+        """
+        Insert or update entries, given as a dict {id: entry} as returned by the API.
+
+        Return the number of entries stored.
+        """
+
+        id_column, indexed_columns = TABLES[table]
+        rows = []
+        columns = None
+        for entry_id, entry in entries.items():
+            indexed = indexed_columns(entry)
+            columns = [id_column] + [c for c, _ in indexed] + ['data']
+            rows.append([entry_id] + [v for _, v in indexed] + [json.dumps(entry)])
+
+        if rows:
+            with self.conn:
+                self.conn.executemany(
+                    'INSERT OR REPLACE INTO {} ({}) VALUES ({})'.format(
+                        table, ', '.join(columns), ', '.join('?' * len(columns))),
+                    rows)
+
+        return len(rows)
+
+    def count(self, table, until=None):
+        """Return the number of entries of a table (only until a given time if any, inclusive)"""
+        if until is None:
+            return self.conn.execute('SELECT COUNT(*) FROM {}'.format(table)).fetchone()[0]
+        return self.conn.execute('SELECT COUNT(*) FROM {} WHERE time <= ?'.format(table), (until,)).fetchone()[0]
+
+    def load_state(self, name):
+        """Return a state saved with save_state (None if there is none)"""
+        row = self.conn.execute('SELECT data FROM saved_state WHERE name = ?', (name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_state(self, name, state):
+        """Save a JSON serializable state (e.g. of a computation over the history, to resume it later)"""
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO saved_state (name, data) VALUES (?, ?)',
+                              (name, json.dumps(state)))
+
+    def high_water_mark(self, table):
+        """Return the time of the most recent entry known to be synchronized (None if never synchronized)"""
+        row = self.conn.execute('SELECT last_time FROM sync_state WHERE name = ?', (table,)).fetchone()
+        return row[0] if row else None
+
+    def set_high_water_mark(self, table, last_time):
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO sync_state (name, last_time) VALUES (?, ?)',
+                              (table, last_time))
+
+    def max_time(self, table):
+        """Return the time of the most recent entry of a table"""
+        return self.conn.execute('SELECT MAX(time) FROM {}'.format(table)).fetchone()[0]
+
+    def _resolve_time(self, table, value):
+        """Convert a start/end parameter (unix timestamp or id of an entry) into a timestamp"""
+        try:
+            return float(value)
+        except ValueError:
+            id_column, _ = TABLES[table]
+            row = self.conn.execute('SELECT time FROM {} WHERE {} = ?'.format(table, id_column),
+                                    (value,)).fetchone()
+            return row[0] if row else None
+
+    def query(self, table, ids=None, start=None, end=None, **filters):
+        """
+        Return the entries of a table as a dict {id: entry} like the API does.
+
+        ids is an optional list of ids, start and end (exclusive) are unix timestamps
+        or ids of entries, and filters are {column: list of accepted values}.
+        """
+        return dict(self.iter_query(table, ids, start, end, **filters))
+
+    def iter_query(self, table, ids=None, start=None, end=None, **filters):
+        """Same as query, but generate the (id, entry) pairs one by one, sorted by time"""
+
+        id_column, _ = TABLES[table]
+        conditions = []
+        params = []
+
+        if ids:
+            conditions.append('{} IN ({})'.format(id_column, ', '.join('?' * len(ids))))
+            params.extend(ids)
+        for op, value in (('>', start), ('<', end)):
+            if value:
+                conditions.append('time {} ?'.format(op))
+                params.append(self._resolve_time(table, value))
+        for column, values in filters.items():
+            if values:
+                conditions.append('{} IN ({})'.format(column, ', '.join('?' * len(values))))
+                params.extend(values)
+
+        sql = 'SELECT {}, data FROM {}'.format(id_column, table)
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY time, {}'.format(id_column)
+
+        for entry_id, data in self.conn.execute(sql, params):
+            yield entry_id, json.loads(data)
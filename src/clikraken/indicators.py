@@ -0,0 +1,239 @@
+# -*- coding: utf8 -*-
+
+"""
+clikraken.indicators
+
+This module computes technical indicators over OHLC candles with NumPy,
+for the --indicators option of the ohlc command.
+
+The candles are loaded once into arrays (oldest first), the moving
+windows are computed as differences of cumulative sums and the exponential smoothings (EMA, and Wilder's
+smoothing of RSI and ATR) are computed as a recursive filter evaluated
+in closed form block by block, so that tens of thousands of candles
+take a few milliseconds. The first values of each indicator, before
+its window is complete, are NaN.
+
+The numpy package is required (pip install numpy).
+
+Licensed under the Apache License, Version 2.0. See the LICENSE file.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+
+class IndicatorError(Exception):
+    """Raised for an invalid specification of indicators"""
+
+
+def _nans(n):
+    return np.full(n, np.nan)
+
+
+def _window_means(x, n):
+    """
+    Means of the windows of n consecutive values of x (len(x) - n + 1 values), from cumulative sums.
+
+    The values are centered on their mean first, so that the sums stay small
+    and the differences of the cumulative sums keep their precision.
+    """
+    center = x.mean()
+    sums = np.cumsum(np.concatenate(([0.0], x - center)))
+    return center + (sums[n:] - sums[:-n]) / n
+
+
+def recursive_filter(x, alpha, y0):
+    """
+    Compute y[i] = alpha * x[i] + (1 - alpha) * y[i - 1] with y[-1] = y0.
+
+    With b = 1 - alpha, y[k] = (b * y0 + alpha * sum(x[j] / b**j for j <= k)) * b**k,
+    which is evaluated with a cumulative sum over blocks short enough for b**-k
+    to stay far from overflowing.
+    """
+
+    x = np.asarray(x, dtype=float)
+    b = 1.0 - alpha
+    if b == 0:
+        return x.copy()
+
+    block = max(1, int(100 / -np.log10(b)))
+    powers = b ** -np.arange(min(block, len(x)))
+
+    y = np.empty_like(x)
+    prev = y0
+    for start in range(0, len(x), block):
+        chunk = x[start:start + block]
+        p = powers[:len(chunk)]
+        y[start:start + block] = (b * prev + alpha * np.cumsum(chunk * p)) / p
+        prev = y[start + len(chunk) - 1]
+    return y
+
+
+def _smoothed(x, n, alpha):
+    """Exponential smoothing of x seeded with the mean of its first n values (at index n - 1)"""
+    out = _nans(len(x))
+    if len(x) >= n:
+        seed = x[:n].mean()
+        out[n - 1] = seed
+        out[n:] = recursive_filter(x[n:], alpha, seed)
+    return out
+
+
+def sma(close, n):
+    """Simple moving average"""
+    out = _nans(len(close))
+    if len(close) >= n:
+        out[n - 1:] = _window_means(close, n)
+    return out
+
+
+def ema(close, n):
+    """Exponential moving average (smoothing factor 2 / (n + 1), seeded with the SMA)"""
+    return _smoothed(close, n, 2.0 / (n + 1))
+
+
+def rsi(close, n):
+    """Relative strength index with Wilder's smoothing (50 if the price didn't move at all)"""
+    out = _nans(len(close))
+    if len(close) <= n:
+        return out
+
+    deltas = np.diff(close)
+    avg_gain = _smoothed(np.maximum(deltas, 0), n, 1.0 / n)[n - 1:]
+    avg_loss = _smoothed(np.maximum(-deltas, 0), n, 1.0 / n)[n - 1:]
+
+    total = avg_gain + avg_loss
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out[n:] = np.where(total == 0, 50.0, 100.0 * avg_gain / total)
+    return out
+
+
+def bollinger(close, n, k=2.0):
+    """Bollinger bands: SMA and SMA +/- k standard deviations (population) over n candles"""
+    lower, upper = _nans(len(close)), _nans(len(close))
+    middle = sma(close, n)
+    if len(close) >= n:
+        # variance of each window as the mean of the squares minus the square of the mean
+        deviations = close - close.mean()
+        means = _window_means(deviations, n)
+        std = np.sqrt(np.maximum(_window_means(deviations ** 2, n) - means ** 2, 0))
+        lower[n - 1:] = middle[n - 1:] - k * std
+        upper[n - 1:] = middle[n - 1:] + k * std
+    return lower, middle, upper
+
+
+def atr(high, low, close, n):
+    """Average true range with Wilder's smoothing"""
+    true_range = high - low
+    if len(close) > 1:
+        prev_close = close[:-1]
+        true_range[1:] = np.maximum.reduce([
+            true_range[1:], np.abs(high[1:] - prev_close), np.abs(low[1:] - prev_close)])
+    return _smoothed(true_range, n, 1.0 / n)
+
+
+# name: (function, number of integer parameters, optional float parameters with their defaults)
+INDICATORS = OrderedDict([
+    ('sma', (sma, 1, ())),
+    ('ema', (ema, 1, ())),
+    ('rsi', (rsi, 1, ())),
+    ('bb', (bollinger, 1, (2.0,))),
+    ('atr', (atr, 1, ())),
+])
+
+
+def parse_indicators(spec):
+    """
+    Parse a comma delimited list of indicators, each one given as name:period[:parameter],
+    e.g. "sma:20,ema:12,rsi:14,bb:20:2.5,atr:14". Return a list of (name, parameters).
+    """
+
+    indicators = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, *params = item.lower().split(':')
+        if name not in INDICATORS:
+            raise IndicatorError('Unknown indicator "{}" (possible values: {})'.format(name, ', '.join(INDICATORS)))
+        _, nint, optional = INDICATORS[name]
+        if not nint <= len(params) <= nint + len(optional):
+            raise IndicatorError('Wrong number of parameters for the indicator "{}"'.format(item))
+        try:
+            values = [int(p) for p in params[:nint]] + [float(p) for p in params[nint:]]
+        except ValueError:
+            raise IndicatorError('Invalid parameter for the indicator "{}"'.format(item))
+        if values[0] < 1:
+            raise IndicatorError('The period of the indicator "{}" must be at least 1'.format(item))
+        indicators.append((name, values))
+    return indicators
+
+
+def _label(name, params):
+    return '{}({})'.format(name.upper(), ','.join('{:g}'.format(p) for p in params))
+
+
+def indicator_labels(indicators):
+    """Return the labels of the columns of values of indicators (see parse_indicators)"""
+    labels = []
+    for name, params in indicators:
+        label = _label(name, params)
+        if name == 'bb':
+            labels.extend([label + ' lower', label + ' middle', label + ' upper'])
+        else:
+            labels.append(label)
+    return labels
+
+
+def compute_indicators(indicators, high, low, close):
+    """
+    Compute indicators (see parse_indicators) over arrays of candles (oldest first),
+    and return an OrderedDict of the columns of values by label (e.g. "SMA(20)").
+    """
+
+    columns = OrderedDict()
+    for name, params in indicators:
+        label = _label(name, params)
+        if name == 'bb':
+            lower, middle, upper = bollinger(close, *params)
+            columns[label + ' lower'] = lower
+            columns[label + ' middle'] = middle
+            columns[label + ' upper'] = upper
+        elif name == 'atr':
+            columns[label] = atr(high, low, close, *params)
+        else:
+            columns[label] = INDICATORS[name][0](close, *params)
+    return columns
+
+
+def format_value(value):
+    """Format a value of an indicator for the output (empty if not available yet)"""
+    if np.isnan(value):
+        return ''
+    return '{:.8f}'.format(value).rstrip('0').rstrip('.')
+
+
+def append_indicators(candles, indicators, count=None, typed=False):
+    """
+    Compute indicators over Candle records (most recent first, as returned by parse_ohlc)
+    and return the labels of the indicators and the rows of the first count candles
+    with the formatted values of the indicators appended.
+
+    With typed, the values are floats (NaN when not available yet) rather than formatted.
+    """
+
+    # arrays of the candles, oldest first
+    chronological = candles[::-1]
+    high = np.array([c.High for c in chronological], dtype=float)
+    low = np.array([c.Low for c in chronological], dtype=float)
+    close = np.array([c.Close for c in chronological], dtype=float)
+
+    columns = compute_indicators(indicators, high, low, close)
+    # back to the most recent first, only keeping the rows which are output
+    values = [column[::-1][:count] for column in columns.values()]
+
+    convert = float if typed else format_value
+    rows = [tuple(candle) + tuple(convert(v[i]) for v in values)
+            for i, candle in enumerate(candles[:count])]
+    return list(columns), rows
@@ -0,0 +1,103 @@
+# -*- coding: utf8 -*-
+
+"""
+clikraken.order_book
+
+This module keeps snapshots of the order book of asset pairs, computes the
+differences between two snapshots level by level, and redraws only the lines
+of the terminal that changed between two renderings of the book.
+
+Licensed under the Apache License, Version 2.0. See the LICENSE file.
+"""
+
+import sys
+from collections import OrderedDict, namedtuple
+
+SIDES = ('asks', 'bids')
+
+# kind is 'added', 'removed' or 'changed' (volume), a volume is None when the level doesn't exist
+LevelChange = namedtuple('LevelChange', ['side', 'price', 'kind', 'old_volume', 'new_volume'])
+
+# width of the price and volume columns
+COLUMN_WIDTH = 18
+
+# ANSI escape sequences
+CLEAR_SCREEN = '\x1b[2J'
+CLEAR_LINE = '\x1b[2K'
+MOVE_CURSOR = '\x1b[{};1H'
+
+
+def book_from_depth(depth_result):
+    """
+    Build a snapshot of the order book from the results of the Depth method
+    for one asset pair: {side: OrderedDict(price: volume)}.
+
+    Prices and volumes are kept as the strings sent by Kraken, which formats
+    them consistently, and in the order of the results (best prices first).
+    """
+    return {side: OrderedDict((level[0], level[1]) for level in depth_result.get(side, []))
+            for side in SIDES}
+
+
+def diff_books(old, new):
+    """Return the list of LevelChange between two snapshots of the order book"""
+
+    changes = []
+    for side in SIDES:
+        old_levels = old.get(side, {}) if old else {}
+        new_levels = new.get(side, {})
+        for price, volume in new_levels.items():
+            old_volume = old_levels.get(price)
+            if old_volume is None:
+                changes.append(LevelChange(side, price, 'added', None, volume))
+            elif old_volume != volume:
+                changes.append(LevelChange(side, price, 'changed', old_volume, volume))
+        for price, old_volume in old_levels.items():
+            if price not in new_levels:
+                changes.append(LevelChange(side, price, 'removed', old_volume, None))
+    return changes
+
+
+def book_lines(title, book):
+    """
+    Render a snapshot of the order book as fixed-width lines: the asks
+    from the highest to the lowest price, then the bids from the highest price.
+    """
+
+    row = '{{:>{w}}} {{:>{w}}}'.format(w=COLUMN_WIDTH)
+    lines = [title, row.format('Ask', 'Volume')]
+    lines.extend(row.format(price, volume) for price, volume in reversed(list(book['asks'].items())))
+    lines.append(row.format('Bid', 'Volume'))
+    lines.extend(row.format(price, volume) for price, volume in book['bids'].items())
+    return lines
+
+
+class TerminalRenderer(object):
+    """Display lines on a terminal, only rewriting the lines which changed since the last rendering"""
+
+    def __init__(self, file=None):
+        self.file = file or sys.stdout
+        self.lines = None
+
+    def render(self, lines):
+        """Display lines and return the number of lines (re)written"""
+
+        previous = self.lines or []
+        out = [CLEAR_SCREEN] if self.lines is None else []
+
+        written = 0
+        for i, line in enumerate(lines):
+            if i >= len(previous) or previous[i] != line:
+                out.append(MOVE_CURSOR.format(i + 1) + CLEAR_LINE + line)
+                written += 1
+        # clear the lines left from a longer rendering
+        for i in range(len(lines), len(previous)):
+            out.append(MOVE_CURSOR.format(i + 1) + CLEAR_LINE)
+
+        # leave the cursor below the book
+        out.append(MOVE_CURSOR.format(len(lines) + 1))
+        self.file.write(''.join(out))
+        self.file.flush()
+
+        self.lines = list(lines)
+        return written
@@ -0,0 +1,251 @@
+# -*- coding: utf8 -*-
+
+"""
+clikraken.pnl
+
+This module computes the cost basis of the holdings and the realized
+profit and loss (PnL) of spot trades, for the pnl command.
+
+The trades are processed one by one in chronological order. The buys
+open lots (volume and cost basis, fees included) in the book of their
+asset pair, and the sells are matched against the lots FIFO, LIFO or at
+the average cost. The proceeds minus the matched cost basis are the
+realized PnL, aggregated by day (UTC) and asset pair in the quote
+currency.
+
+The lots are kept per asset pair rather than per asset, since the cost
+basis and the proceeds must be in the same currency and the trades
+give no exchange rate between the quote currencies. As a consequence,
+an asset sold against another quote currency than the one it was bought
+with (e.g. bought with EUR, sold for USD) finds no lots to match: the
+volume sold is reported as unmatched and left out of the realized PnL.
+
+The whole state of the engine (lots, realized PnL, last trade processed)
+can be saved and restored, so that new trades are processed without
+going through the whole history again. Decimal arithmetic is used, so
+the state never drifts.
+
+Licensed under the Apache License, Version 2.0. See the LICENSE file.
+"""
+
+import datetime
+import time
+from collections import deque
+from decimal import Decimal
+
+METHODS = ('fifo', 'lifo', 'average')
+PERIODS = ('day', 'week', 'month', 'year', 'all')
+
+ZERO = Decimal(0)
+# usual margin of spot trades, to avoid parsing it
+NO_MARGIN = frozenset(['0.00000', '0.00000000', '0'])
+
+# columns of the realized PnL by day and asset pair:
+# number of sells, volume sold, proceeds, cost basis, fees, realized PnL
+SELLS, VOLUME, PROCEEDS, BASIS, FEES, REALIZED = range(6)
+
+
+class LotBook(object):
+    """Lots of an asset pair, as [volume, cost basis] pairs (oldest first)"""
+
+    def __init__(self, method, lots=()):
+        if method not in METHODS:
+            raise ValueError('Unknown cost basis method "{}" (possible values: {})'.format(method, ', '.join(METHODS)))
+        self.method = method
+        self.lots = deque([Decimal(v), Decimal(c)] for v, c in lots)
+
+    def buy(self, volume, cost):
+        if self.method == 'average' and self.lots:
+            # a single lot at the average cost
+            lot = self.lots[0]
+            lot[0] += volume
+            lot[1] += cost
+        else:
+            self.lots.append([volume, cost])
+
+    def sell(self, volume):
+        """Remove volume from the lots, return the volume matched and its cost basis"""
+
+        matched = ZERO
+        basis = ZERO
+        while volume > matched and self.lots:
+            lot = self.lots[-1] if self.method == 'lifo' else self.lots[0]
+            take = min(volume - matched, lot[0])
+            if take == lot[0]:
+                cost = lot[1]
+                if self.method == 'lifo':
+                    self.lots.pop()
+                else:
+                    self.lots.popleft()
+            else:
+                cost = lot[1] * take / lot[0]
+                lot[0] -= take
+                lot[1] -= cost
+            matched += take
+            basis += cost
+        return matched, basis
+
+    def holdings(self):
+        """Return the volume held and its cost basis"""
+        return sum((lot[0] for lot in self.lots), ZERO), sum((lot[1] for lot in self.lots), ZERO)
+
+    def to_state(self):
+        return [[str(v), str(c)] for v, c in self.lots]
+
+
+def period_of(day, period):
+    """Convert a day (YYYY-MM-DD) to the key of its period"""
+    if period == 'day':
+        return day
+    if period == 'week':
+        year, week, _ = datetime.date(*map(int, day.split('-'))).isocalendar()
+        return '{}-W{:02d}'.format(year, week)
+    if period == 'month':
+        return day[:7]
+    if period == 'year':
+        return day[:4]
+    return 'all'
+
+
+class PnLEngine(object):
+    """Cost basis and realized PnL of trades, processed incrementally in chronological order"""
+
+    def __init__(self, method='fifo'):
+        self.method = method
+        self.books = {}
+        # (day, pair) -> [sells, volume, proceeds, basis, fees, realized]
+        self.realized = {}
+        # volume sold without lots to match (history incomplete, or short selling)
+        self.unmatched = {}
+        self.processed = 0
+        self.skipped = 0
+        self.last_time = None
+        # ids of the trades processed at last_time, in case more trades with the same time arrive later
+        self.last_ids = set()
+        self._days = {}
+
+    def _day(self, ts):
+        n = int(ts // 86400)
+        day = self._days.get(n)
+        if day is None:
+            day = self._days[n] = time.strftime('%Y-%m-%d', time.gmtime(n * 86400))
+        return day
+
+    def _book(self, pair):
+        book = self.books.get(pair)
+        if book is None:
+            book = self.books[pair] = LotBook(self.method)
+        return book
+
+    def add(self, txid, trade):
+        """
+        Process a trade (as returned by the API). Return False if it was ignored,
+        because it was already processed or because it is a margin trade.
+        """
+
+        ts = float(trade['time'])
+        if self.last_time is not None:
+            if ts < self.last_time or (ts == self.last_time and txid in self.last_ids):
+                return False
+        if ts != self.last_time:
+            self.last_time = ts
+            self.last_ids = {txid}
+        else:
+            self.last_ids.add(txid)
+        self.processed += 1
+
+        margin = trade.get('margin')
+        if margin and margin not in NO_MARGIN and Decimal(margin):
+            # margin trades open or close positions, they don't buy or sell the asset
+            self.skipped += 1
+            return False
+
+        pair = trade['pair']
+        volume = Decimal(trade['vol'])
+        cost = Decimal(trade['cost'])
+        fee = Decimal(trade['fee'])
+        book = self._book(pair)
+
+        key = (self._day(ts), pair)
+        stats = self.realized.get(key)
+        if stats is None:
+            stats = self.realized[key] = [0, ZERO, ZERO, ZERO, ZERO, ZERO]
+        stats[FEES] += fee
+
+        if trade['type'] == 'buy':
+            book.buy(volume, cost + fee)
+            return True
+
+        matched, basis = book.sell(volume)
+        proceeds = cost - fee
+        if matched < volume:
+            self.unmatched[pair] = self.unmatched.get(pair, ZERO) + volume - matched
+            # only the part of the proceeds (net of the fee) matched with lots is realized
+            proceeds = proceeds * matched / volume
+        stats[SELLS] += 1
+        stats[VOLUME] += matched
+        stats[PROCEEDS] += proceeds
+        stats[BASIS] += basis
+        stats[REALIZED] += proceeds - basis
+        return True
+
+    def add_many(self, trades):
+        """Process an iterable of (txid, trade) pairs in chronological order, return the number processed"""
+        count = 0
+        for txid, trade in trades:
+            if self.add(txid, trade):
+                count += 1
+        return count
+
+    def report(self, period='month'):
+        """
+        Aggregate the realized PnL by period and asset pair. Return a sorted list of
+        ((period, pair), [sells, volume, proceeds, basis, fees, realized]).
+        """
+
+        totals = {}
+        for (day, pair), stats in self.realized.items():
+            key = (period_of(day, period), pair)
+            total = totals.get(key)
+            if total is None:
+                totals[key] = list(stats)
+            else:
+                for i, value in enumerate(stats):
+                    total[i] += value
+        return sorted(totals.items())
+
+    def holdings(self):
+        """Return a sorted list of (pair, volume, cost basis) of the lots still held"""
+        rows = []
+        for pair in sorted(self.books):
+            volume, basis = self.books[pair].holdings()
+            if volume:
+                rows.append((pair, volume, basis))
+        return rows
+
+    def to_state(self):
+        """Return the state of the engine as a JSON serializable dict"""
+        return {
+            'method': self.method,
+            'books': {pair: book.to_state() for pair, book in self.books.items()},
+            'realized': [[day, pair] + [str(v) for v in stats] for (day, pair), stats in self.realized.items()],
+            'unmatched': {pair: str(v) for pair, v in self.unmatched.items()},
+            'processed': self.processed,
+            'skipped': self.skipped,
+            'last_time': self.last_time,
+            'last_ids': sorted(self.last_ids),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        """Restore an engine from the result of to_state"""
+        engine = cls(state['method'])
+        engine.books = {pair: LotBook(engine.method, lots) for pair, lots in state['books'].items()}
+        engine.realized = {(row[0], row[1]): [int(row[2])] + [Decimal(v) for v in row[3:]]
+                           for row in state['realized']}
+        engine.unmatched = {pair: Decimal(v) for pair, v in state['unmatched'].items()}
+        engine.processed = state['processed']
+        engine.skipped = state['skipped']
+        engine.last_time = state['last_time']
+        engine.last_ids = set(state['last_ids'])
+        return engine
@@ -0,0 +1,35 @@
+# -*- coding: utf8 -*-
+
+"""
+clikraken.records
+
+This module defines the compact record types used for the rows of
+the results (orders, trades, ledger entries, candles, book levels).
+
+They are namedtuples: tuples with named fields and no per-instance
+dict, which take a fraction of the memory of one OrderedDict per row
+and are accepted as is by tabulate and write_csv. The names of the
+fields are the names of the columns of the output.
+
+Licensed under the Apache License, Version 2.0. See the LICENSE file.
+"""
+
+from collections import namedtuple
+
+OpenOrder = namedtuple('OpenOrder', [
+    'orderid', 'status', 'type', 'vol', 'pair', 'ordertype', 'price', 'viqc', 'opening_date'])
+
+ClosedOrder = namedtuple('ClosedOrder', [
+    'orderid', 'status', 'type', 'vol', 'vol_exec', 'pair', 'ordertype', 'price', 'cost', 'fee', 'viqc',
+    'closing_date'])
+
+HistoryTrade = namedtuple('HistoryTrade', [
+    'txid', 'time', 'pair', 'type', 'ordertype', 'vol', 'price', 'cost', 'fee', 'margin', 'ordertxid', 'misc'])
+
+LedgerEntry = namedtuple('LedgerEntry', [
+    'id', 'refid', 'time', 'type', 'asset', 'aclass', 'amount', 'fee', 'balance'])
+
+Candle = namedtuple('Candle', ['Time', 'Open', 'High', 'Low', 'Close', 'VWAP', 'Volume', 'Count'])
+
+# the price column is labelled with the asset pair and the side of the book (e.g. "ETHEUR Ask")
+BookLevel = namedtuple('BookLevel', ['price', 'volume', 'age'])
@@ -0,0 +1,95 @@
+# -*- coding: utf8 -*-
+
+"""
+clikraken.resample
+
+This module aggregates OHLC candles into candles of a longer interval
+(e.g. 1 minute candles into 3 minutes, 2 hours or 1 day candles), for
+the --resample option of the ohlc command.
+
+The candles are grouped in a single vectorized pass with NumPy: the
+boundaries of the groups are found once, and each column is reduced
+with ufunc.reduceat (first open, highest high, lowest low, last close,
+total volume and count, volume weighted VWAP). Like Kraken's candles,
+the intervals are aligned on the UNIX epoch (so days start at 00:00 UTC).
+
+The numpy package is required (pip install numpy).
+
+Licensed under the Apache License, Version 2.0. See the LICENSE file.
+"""
+
+import numpy as np
+
+from clikraken.trade_stats import parse_duration
+
+
+def parse_interval(interval):
+    """Convert an interval like 3m, 2h or 1d (or a number of minutes, like --interval) to seconds"""
+    interval = interval.strip()
+    if interval.isdigit():
+        return int(interval) * 60
+    return int(parse_duration(interval))
+
+
+def _decimals(values):
+    """Number of decimals of the values given as strings by the API"""
+    return max((len(v.partition('.')[2]) for v in values), default=0)
+
+
+def _format(values, decimals):
+    return ['{:.{}f}'.format(v, decimals) for v in values]
+
+
+def resample_ohlc(candles, base, interval):
+    """
+    Aggregate candles as returned by the OHLC method ([time, open, high, low, close,
+    vwap, volume, count], oldest first) of base seconds into candles of interval
+    seconds, in the same format (the prices and volumes keep the decimals of the
+    input). The first group is dropped if it doesn't start at the beginning of
+    its interval, as it would only cover a part of it.
+    """
+
+    if interval % base:
+        raise ValueError('The interval to resample to ({}s) must be a multiple of the '
+                         'interval of the candles ({}s)'.format(interval, base))
+    if not candles:
+        return []
+
+    columns = list(zip(*candles))
+    times = np.array(columns[0], dtype=np.int64)
+    highs, lows, closes, vwaps, volumes = (np.array(c, dtype=float) for c in columns[2:7])
+    counts = np.array(columns[7], dtype=np.int64)
+
+    # index of the first candle of each group
+    buckets = times - times % interval
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+    if times[0] != buckets[0]:
+        starts = starts[1:]
+        if not len(starts):
+            return []
+    # index of the last candle of each group
+    ends = np.concatenate((starts[1:], [len(times)])) - 1
+
+    def reduce(ufunc, values):
+        # reduce each group: values[starts[i]:starts[i + 1]] (until the end for the last one)
+        return ufunc.reduceat(values, starts)
+
+    volume = reduce(np.add, volumes)
+    notional = reduce(np.add, vwaps * volumes)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # without any trade, the VWAP is the close price
+        vwap = np.where(volume > 0, notional / volume, closes[ends])
+
+    price_decimals = _decimals(columns[4])
+    volume_decimals = _decimals(columns[6])
+
+    return [list(row) for row in zip(
+        buckets[starts].tolist(),
+        [columns[1][i] for i in starts.tolist()],
+        _format(reduce(np.maximum, highs), price_decimals),
+        _format(reduce(np.minimum, lows), price_decimals),
+        [columns[4][i] for i in ends.tolist()],
+        _format(vwap, price_decimals),
+        _format(volume, volume_decimals),
+        reduce(np.add, counts).tolist(),
+    )]
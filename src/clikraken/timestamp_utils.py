@@ -0,0 +1,152 @@
+# -*- coding: utf8 -*-
+
+"""
+clikraken.timestamp_utils
+
+This module formats and humanizes UNIX timestamps in bulk.
+
+The output is identical to the one of arrow (which was used for every
+single timestamp before), but the timezone is only resolved once, the
+UTC offsets are cached per day and the current time is only read once
+per column of timestamps, which makes it much faster for big tables.
+
+Licensed under the Apache License, Version 2.0. See the LICENSE file.
+"""
+
+import math
+import time
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def to_seconds(ts):
+    """
+    Convert a UNIX timestamp (int, float or numeric string) to whole seconds.
+
+    Like datetime.utcfromtimestamp, the timestamp is first rounded to the
+    microsecond (round half to even), then truncated to the second.
+    """
+    if isinstance(ts, int):
+        return ts
+    frac, whole = math.modf(float(ts))
+    return (int(whole) * 1000000 + int(round(frac * 1e6))) // 1000000
+
+
+def _utc_datetime(ts):
+    """Convert a UNIX timestamp to a naive UTC datetime, with microseconds"""
+    return datetime.fromtimestamp(float(ts), timezone.utc).replace(tzinfo=None)
+
+
+class TimestampFormatter(object):
+    """Format UNIX timestamps in a timezone as YYYY-MM-DD HH:mm:ss+HH:MM"""
+
+    def __init__(self, tz_expr):
+        # arrow's parser is used in order to support the same timezone expressions
+        from arrow.parser import TzinfoParser
+        self.tz = TzinfoParser.parse(tz_expr)
+        # day since epoch -> (offset in seconds, formatted offset)
+        self._offsets = {}
+
+    def _exact_offset(self, seconds):
+        """Return the UTC offset of the timezone (in seconds) and its formatted version at a given time"""
+
+        local = (_EPOCH + timedelta(seconds=seconds)).astimezone(self.tz)
+        offset = int(local.utcoffset().total_seconds())
+
+        # To get the same output as arrow, the displayed offset ignores the "fold"
+        # attribute of the local time. (In the repeated hour when switching back from
+        # daylight saving time, arrow shows the offset of the first occurrence.)
+        # (datetime.replace(fold=0) would need Python 3.6.)
+        shown = self.tz.utcoffset(datetime(*local.timetuple()[:6]))
+        total_minutes = int(shown.total_seconds() / 60)
+        sign = '+' if total_minutes >= 0 else '-'
+        hour, minute = divmod(abs(total_minutes), 60)
+
+        return offset, '{}{:02d}:{:02d}'.format(sign, hour, minute)
+
+    def _offset(self, seconds):
+        """Same as _exact_offset, but cached for every day without offset change"""
+
+        day = seconds // 86400
+        cached = self._offsets.get(day)
+        if cached is None:
+            start = self._exact_offset(day * 86400)
+            end = self._exact_offset(day * 86400 + 86399)
+            # False means that the offset changes during this day
+            cached = self._offsets[day] = start if start == end else False
+
+        return cached or self._exact_offset(seconds)
+
+    @lru_cache(maxsize=4096)
+    def format_seconds(self, seconds):
+        """Format a UNIX timestamp in whole seconds"""
+        offset, offset_str = self._offset(seconds)
+        t = time.gmtime(seconds + offset)
+        return '{:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}{}'.format(
+            t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec, offset_str)
+
+    def format(self, ts):
+        """Format a UNIX timestamp"""
+        return self.format_seconds(to_seconds(ts))
+
+    def format_many(self, timestamps):
+        """Format an iterable of UNIX timestamps, returning a list"""
+        format_seconds = self.format_seconds
+        return [format_seconds(to_seconds(ts)) for ts in timestamps]
+
+
+@lru_cache(maxsize=1024)
+def _describe(timeframe, delta):
+    from arrow.locales import get_locale
+    return get_locale('en_us').describe(timeframe, delta)
+
+
+def _humanize_delta(delta, dt, now):
+    """Humanize a time difference in seconds, like arrow.Arrow.humanize does"""
+
+    sign = -1 if delta < 0 else 1
+    diff = abs(delta)
+
+    if diff < 10:
+        return _describe('now', 0)
+    if diff < 45:
+        return _describe('seconds', sign * diff)
+    elif diff < 90:
+        return _describe('minute', sign)
+    elif diff < 2700:
+        return _describe('minutes', sign * int(max(diff / 60, 2)))
+    elif diff < 5400:
+        return _describe('hour', sign)
+    elif diff < 79200:
+        return _describe('hours', sign * int(max(diff / 3600, 2)))
+    elif diff < 129600:
+        return _describe('day', sign)
+    elif diff < 2160000:
+        return _describe('days', sign * int(max(diff / 86400, 2)))
+    elif diff < 3888000:
+        return _describe('month', sign)
+    elif diff < 29808000:
+        self_months = dt.year * 12 + dt.month
+        other_months = now.year * 12 + now.month
+        return _describe('months', sign * int(max(abs(other_months - self_months), 2)))
+    elif diff < 47260800:
+        return _describe('year', sign)
+    else:
+        return _describe('years', sign * int(max(diff / 31536000, 2)))
+
+
+def humanize_many(timestamps, now=None):
+    """
+    Humanize an iterable of UNIX timestamps relatively to now (a UNIX timestamp,
+    defaults to the current time, read only once), returning a list.
+    """
+
+    now = _utc_datetime(time.time() if now is None else now)
+    humanized = []
+    for ts in timestamps:
+        dt = _utc_datetime(ts)
+        delta = int(round((dt - now).total_seconds()))
+        humanized.append(_humanize_delta(delta, dt, now))
+    return humanized
@@ -0,0 +1,253 @@
+# -*- coding: utf8 -*-
+
+"""
+clikraken.timings
+
+This module measures the time spent in each phase of a clikraken command
+(option --timings and setting timings_file): the imports, loading the
+settings, parsing the arguments, setting the API up, waiting for the rate
+limiter, the HTTP round trips, decoding the JSON responses, the subcommand
+itself (parsing the results into rows) and rendering the tables.
+
+The phases can be nested: the time of a phase excludes the time of the
+phases run inside it (e.g. the time of the subcommand excludes its HTTP
+queries), so that the phases add up to the total time of the command.
+
+Licensed under the Apache License, Version 2.0. See the LICENSE file.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+
+import clikraken
+import clikraken.global_vars as gv
+from clikraken.log_utils import logger
+
+# CPU time of the current thread (the phases can run in worker threads)
+_cpu_time = getattr(time, 'thread_time', time.process_time)
+
+# Prometheus metrics: name -> help
+METRICS = [
+    ('clikraken_phase_wall_seconds', 'Wall time spent in each phase of the last run of the command'),
+    ('clikraken_phase_cpu_seconds', 'CPU time spent in each phase of the last run of the command'),
+    ('clikraken_requests', 'Number of queries to the API in the last run of the command'),
+    ('clikraken_request_bytes', 'Bytes sent to and received from the API in the last run of the command'),
+    ('clikraken_wall_seconds', 'Total wall time of the last run of the command'),
+    ('clikraken_cpu_seconds', 'Total CPU time of the last run of the command'),
+    ('clikraken_last_run_timestamp_seconds', 'Time of the last run of the command'),
+]
+
+
+class _NoTiming(object):
+    """Context manager doing nothing, used when the timings are disabled"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_TIMING = _NoTiming()
+
+
+class _Phase(object):
+    """Context manager measuring a phase (see Timings.phase)"""
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.stack = self.timings._stack()
+        # time spent in the nested phases
+        self.nested = [0.0, 0.0]
+        self.stack.append(self.nested)
+        self.wall = time.perf_counter()
+        self.cpu = _cpu_time()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.wall
+        cpu = _cpu_time() - self.cpu
+        self.stack.pop()
+        if self.stack:
+            self.stack[-1][0] += wall
+            self.stack[-1][1] += cpu
+        self.timings.add(self.name, wall - self.nested[0], cpu - self.nested[1])
+        return False
+
+
+class Timings(object):
+    """Time spent in each phase and size of the queries to the API"""
+
+    def __init__(self, start=None):
+        # (wall, CPU) times of the start of the command
+        self.start = start or (time.perf_counter(), time.process_time())
+        # phase name -> [count, wall time, CPU time]
+        self.phases = {}
+        # API method -> [count, bytes sent, bytes received]
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def phase(self, name):
+        """Return a context manager measuring the phase name"""
+        return _Phase(self, name)
+
+    def add(self, name, wall, cpu, count=1):
+        """Add time spent in the phase name"""
+        with self._lock:
+            entry = self.phases.setdefault(name, [0, 0.0, 0.0])
+            entry[0] += count
+            entry[1] += wall
+            entry[2] += cpu
+
+    def add_request(self, method, sent, received):
+        """Count a query to the API method"""
+        with self._lock:
+            entry = self.requests.setdefault(method, [0, 0, 0])
+            entry[0] += 1
+            entry[1] += sent
+            entry[2] += received
+
+    def totals(self):
+        """Return the total wall and CPU time since the start"""
+        return time.perf_counter() - self.start[0], time.process_time() - self.start[1]
+
+    def summary(self):
+        """Return the summary of the timings as a list of lines"""
+        lines = ['{:<18} {:>6} {:>11} {:>11}'.format('phase', 'calls', 'wall (ms)', 'cpu (ms)')]
+        for name, (count, wall, cpu) in self.phases.items():
+            lines.append('{:<18} {:>6} {:>11.1f} {:>11.1f}'.format(name, count, wall * 1000, cpu * 1000))
+        wall, cpu = self.totals()
+        lines.append('{:<18} {:>6} {:>11.1f} {:>11.1f}'.format('total', '', wall * 1000, cpu * 1000))
+        for method, (count, sent, received) in self.requests.items():
+            lines.append('{}: {} queries, {} bytes sent, {} bytes received'.format(method, count, sent, received))
+        return lines
+
+    def record(self, command):
+        """Return the timings as a dict (one line of the JSON lines file)"""
+        wall, cpu = self.totals()
+        return {
+            'time': time.time(),
+            'command': command,
+            'version': clikraken.__version__,
+            'wall': wall,
+            'cpu': cpu,
+            'phases': {name: {'calls': count, 'wall': w, 'cpu': c}
+                       for name, (count, w, c) in self.phases.items()},
+            'requests': {method: {'calls': count, 'sent': sent, 'received': received}
+                         for method, (count, sent, received) in self.requests.items()},
+        }
+
+    def samples(self, command):
+        """Return the timings as Prometheus samples: (metric name, labels, value)"""
+        wall, cpu = self.totals()
+        samples = []
+        for name, (count, w, c) in self.phases.items():
+            samples.append(('clikraken_phase_wall_seconds', {'command': command, 'phase': name}, w))
+            samples.append(('clikraken_phase_cpu_seconds', {'command': command, 'phase': name}, c))
+        for method, (count, sent, received) in self.requests.items():
+            samples.append(('clikraken_requests', {'command': command, 'method': method}, count))
+            for direction, size in [('sent', sent), ('received', received)]:
+                samples.append(('clikraken_request_bytes',
+                                {'command': command, 'method': method, 'direction': direction}, size))
+        samples.append(('clikraken_wall_seconds', {'command': command}, wall))
+        samples.append(('clikraken_cpu_seconds', {'command': command}, cpu))
+        samples.append(('clikraken_last_run_timestamp_seconds', {'command': command}, time.time()))
+        return samples
+
+
+def timed(name):
+    """Return a context manager measuring the phase name if the timings are enabled"""
+    if gv.TIMINGS is None:
+        return _NO_TIMING
+    return gv.TIMINGS.phase(name)
+
+
+def record_request(method, response):
+    """Count a query to the API method given its requests.Response (if the timings are enabled)"""
+    if gv.TIMINGS is None:
+        return
+    request = response.request
+    body = request.body or b''
+    if not isinstance(body, bytes):
+        body = body.encode()
+    gv.TIMINGS.add_request(method, len(request.url) + len(body), len(response.content))
+
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_sample(name, labels, value):
+    """Format a Prometheus sample"""
+    labels = ','.join('{}="{}"'.format(k, _label_value(v)) for k, v in sorted(labels.items()))
+    return '{}{{{}}} {!r}'.format(name, labels, value)
+
+
+def write_prometheus(timings, command, path):
+    """
+    Write the timings to a file read by the textfile collector of Prometheus'
+    node exporter. Such files are read as a whole, so the samples of the previous
+    run of the same command are replaced, and the ones of other commands are kept.
+    """
+
+    samples = {name: [] for name, _ in METRICS}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                line = line.rstrip('\n')
+                name = line.split('{', 1)[0]
+                if line.startswith('#') or name not in samples:
+                    continue
+                if 'command="{}"'.format(_label_value(command)) not in line:
+                    samples[name].append(line)
+    for name, labels, value in timings.samples(command):
+        samples[name].append(format_sample(name, labels, value))
+
+    # written to another file first, so that the collector never reads a partial file
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        for name, help in METRICS:
+            f.write('# HELP {} {}\n# TYPE {} gauge\n'.format(name, help, name))
+            for line in samples[name]:
+                f.write(line + '\n')
+    os.replace(tmp_path, path)
+
+
+def append_json_line(timings, command, path):
+    """Append the timings to a JSON lines file"""
+    with open(path, 'a') as f:
+        f.write(json.dumps(timings.record(command)) + '\n')
+
+
+def report_timings(timings, command, show=False, path=None):
+    """
+    Print the summary of the timings to stderr (with show) and export
+    them to path: in the Prometheus textfile format if its extension
+    is .prom, or else appended as JSON lines.
+    """
+
+    if show:
+        print('\n'.join(timings.summary()), file=sys.stderr)
+
+    if path:
+        path = os.path.expanduser(path)
+        try:
+            if path.endswith('.prom'):
+                write_prometheus(timings, command, path)
+            else:
+                append_json_line(timings, command, path)
+        except (IOError, OSError) as e:
+            logger.warning('Could not write the timings to {}: {}'.format(path, e))
@@ -0,0 +1,157 @@
+# -*- coding: utf8 -*-
+
+"""
+clikraken.trade_stats
+
+This module maintains rolling statistics (VWAP, buy and sell volume,
+trade rate) over the public trades of an asset pair, as they arrive.
+
+The statistics are updated incrementally: each window keeps the trades
+it covers in a queue along with running sums, adding the new trades and
+subtracting the expired ones, instead of recomputing everything on each
+update. Decimal arithmetic is used, so the running sums never drift.
+
+The queues are bounded: when the trades arrive faster than a window
+expires them, the oldest ones are evicted so that the window keeps at
+most the size of the buffer of recent trades, and its statistics only
+cover these trades.
+
+Licensed under the Apache License, Version 2.0. See the LICENSE file.
+"""
+
+from collections import OrderedDict, deque, namedtuple
+from decimal import Decimal
+
+# unit suffix -> number of seconds
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+Trade = namedtuple('Trade', ['time', 'price', 'volume', 'side', 'ordertype'])
+
+
+def parse_duration(duration):
+    """Convert a duration like 30s, 5m, 1h or 1d (or a number of seconds) to seconds"""
+    duration = duration.strip()
+    unit = DURATION_UNITS.get(duration[-1:].lower())
+    value = duration[:-1] if unit else duration
+    try:
+        seconds = float(value) * (unit or 1)
+    except ValueError:
+        raise ValueError('Invalid duration "{}" (expected e.g. 30s, 5m, 1h or 1d)'.format(duration))
+    if seconds <= 0:
+        raise ValueError('Invalid duration "{}" (must be positive)'.format(duration))
+    return seconds
+
+
+def parse_trade(trade):
+    """Convert a trade from the results of the Trades method to a Trade"""
+    side = {'b': 'buy', 's': 'sell'}.get(trade[3], 'unknown')
+    ordertype = {'l': 'limit', 'm': 'market'}.get(trade[4], 'unknown')
+    return Trade(float(trade[2]), Decimal(trade[0]), Decimal(trade[1]), side, ordertype)
+
+
+class RollingWindow(object):
+    """Running sums over the trades of the last `seconds` seconds (at most max_trades of them)"""
+
+    def __init__(self, name, seconds, max_trades=None):
+        self.name = name
+        self.seconds = seconds
+        self.max_trades = max_trades
+        self._trades = deque()
+        # time of the last trade evicted because of max_trades
+        self.evicted = None
+        self.volume = Decimal(0)
+        self.notional = Decimal(0)
+        self.buy_volume = Decimal(0)
+        self.sell_volume = Decimal(0)
+
+    def _update(self, trade, sign):
+        self.volume += sign * trade.volume
+        self.notional += sign * trade.price * trade.volume
+        if trade.side == 'buy':
+            self.buy_volume += sign * trade.volume
+        elif trade.side == 'sell':
+            self.sell_volume += sign * trade.volume
+
+    def add(self, trade):
+        """Add a trade (trades must be added in chronological order)"""
+        if self.max_trades is not None and len(self._trades) >= self.max_trades:
+            oldest = self._trades.popleft()
+            self._update(oldest, -1)
+            self.evicted = oldest.time
+        self._trades.append(trade)
+        self._update(trade, 1)
+
+    def expire(self, now):
+        """Remove the trades older than the window at time now"""
+        horizon = now - self.seconds
+        while self._trades and self._trades[0].time <= horizon:
+            self._update(self._trades.popleft(), -1)
+
+    @property
+    def count(self):
+        return len(self._trades)
+
+    @property
+    def vwap(self):
+        """Volume weighted average price (None without any volume)"""
+        return self.notional / self.volume if self.volume else None
+
+
+class TradeStats(object):
+    """
+    Rolling statistics over several windows, along with a ring buffer
+    of the `buffer_size` most recent trades. Each window keeps at most
+    `buffer_size` trades as well.
+    """
+
+    def __init__(self, windows, buffer_size=1000):
+        """windows is a list of durations (see parse_duration)"""
+        self.windows = [RollingWindow(w, parse_duration(w), buffer_size) for w in windows]
+        self.recent = deque(maxlen=buffer_size)
+        # time of the first trade seen, to compute rates before a window is full
+        self.start = None
+
+    def add(self, trades):
+        """Add Trade objects, in chronological order"""
+        for trade in trades:
+            if self.start is None:
+                self.start = trade.time
+            self.recent.append(trade)
+            for window in self.windows:
+                window.add(trade)
+
+    def expire(self, now):
+        for window in self.windows:
+            window.expire(now)
+
+    def rate(self, window, now):
+        """Number of trades per minute over a window (None if unknown)"""
+        if self.start is None:
+            return None
+        # the trades counted are the ones since the first trade, or since the last one evicted
+        first = self.start if window.evicted is None else max(self.start, window.evicted)
+        elapsed = min(window.seconds, now - first)
+        if elapsed <= 0:
+            return None
+        return window.count * 60 / elapsed
+
+    def summary(self, now):
+        """Expire the old trades and return the statistics of each window as a list of rows"""
+
+        self.expire(now)
+        last_price = self.recent[-1].price if self.recent else None
+
+        rows = []
+        for window in self.windows:
+            row = OrderedDict()
+            row['Window'] = window.name
+            row['Last price'] = last_price
+            row['VWAP'] = round(window.vwap, 8) if window.vwap is not None else None
+            row['Volume'] = window.volume
+            row['Buy volume'] = window.buy_volume
+            row['Sell volume'] = window.sell_volume
+            row['Trades'] = window.count
+            rate = self.rate(window, now)
+            row['Trades/min'] = round(rate, 2) if rate is not None else None
+            rows.append(row)
+        return rows
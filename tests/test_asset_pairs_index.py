@@ -0,0 +1,73 @@
+import argparse
+import os
+import time
+
+import pytest
+
+import clikraken.global_vars as gv
+from clikraken import clikraken_utils
+from clikraken.api import asset_pairs_index
+from clikraken.api.public.asset_pairs import asset_pairs
+
+ASSET_PAIRS = {
+    'XETHZEUR': {'altname': 'ETHEUR', 'wsname': 'ETH/EUR', 'base': 'XETH', 'quote': 'ZEUR'},
+    'XETHZEUR.d': {'altname': 'ETHEUR.d', 'base': 'XETH', 'quote': 'ZEUR'},
+    'XXBTZUSD': {'altname': 'XBTUSD', 'wsname': 'XBT/USD', 'base': 'XXBT', 'quote': 'ZUSD'},
+    'DOTUSDT': {'altname': 'DOTUSDT', 'wsname': 'DOT/USDT', 'base': 'DOT', 'quote': 'USDT'},
+    'USDCUSDT': {'altname': 'USDCUSDT', 'base': 'USDC', 'quote': 'USDT'},
+}
+
+
+def test_build_pair_index():
+    index = asset_pairs_index.build_pair_index(ASSET_PAIRS)
+    assert index['XETHZEUR'] == ('XETHZEUR', 'ETH', 'EUR')
+    assert index['ETHEUR'] == ('XETHZEUR', 'ETH', 'EUR')
+    assert index['ETH/EUR'] == ('XETHZEUR', 'ETH', 'EUR')
+    assert index['XBTUSD'] == ('XXBTZUSD', 'XBT', 'USD')
+    assert index['USDCUSDT'] == ('USDCUSDT', 'USDC', 'USDT')
+    assert 'XETHZEUR.D' not in index
+
+
+@pytest.fixture
+def pair_index(monkeypatch):
+    monkeypatch.setattr(gv, 'ASSET_PAIRS_INDEX', asset_pairs_index.build_pair_index(ASSET_PAIRS))
+
+
+def test_base_quote_short_uses_index(pair_index):
+    # guessing from the name alone would give ('DOTU', 'SDT')
+    assert clikraken_utils.base_quote_short_from_asset_pair('DOTUSDT') == ('DOT', 'USDT')
+    assert clikraken_utils.base_quote_short_from_asset_pair('usdcusdt') == ('USDC', 'USDT')
+    assert clikraken_utils.asset_pair_short('XXBTZUSD') == 'XBTUSD'
+
+
+def test_same_asset_pair(pair_index):
+    assert clikraken_utils.same_asset_pair('ETHEUR', 'XETHZEUR')
+    assert clikraken_utils.same_asset_pair('XETHZEUR', 'ETH/EUR')
+    assert not clikraken_utils.same_asset_pair('XBTUSD', 'XETHZEUR')
+
+
+def test_cache_ttl(tmpdir, monkeypatch):
+    monkeypatch.setattr(gv, 'ASSET_PAIRS_CACHE_PATH', str(tmpdir.join('sub', 'asset_pairs.json')))
+    assert asset_pairs_index.read_cache() is None
+
+    asset_pairs_index.write_cache(ASSET_PAIRS)
+    assert asset_pairs_index.read_cache(max_age=60) == ASSET_PAIRS
+
+    monkeypatch.setattr(time, 'time', lambda: 1e12)
+    assert asset_pairs_index.read_cache(max_age=60) is None
+    assert asset_pairs_index.read_cache() == ASSET_PAIRS
+
+
+def test_cache_disabled(tmpdir, monkeypatch, capsys):
+    path = str(tmpdir.join('asset_pairs.json'))
+    monkeypatch.setattr(gv, 'ASSET_PAIRS_CACHE_PATH', path)
+    monkeypatch.setattr(gv, 'ASSET_PAIRS_CACHE_TTL', 0)
+    monkeypatch.setattr('clikraken.api.public.asset_pairs.query_api', lambda *args: ASSET_PAIRS)
+
+    asset_pairs(argparse.Namespace(raw=False, refresh=True, csv=False))
+    assert 'Total: 4 pairs' in capsys.readouterr().out
+    assert not os.path.exists(path)
+
+    monkeypatch.setattr(gv, 'ASSET_PAIRS_CACHE_TTL', 3600)
+    asset_pairs(argparse.Namespace(raw=False, refresh=True, csv=False))
+    assert asset_pairs_index.read_cache() == ASSET_PAIRS
@@ -0,0 +1,147 @@
+import asyncio
+import base64
+import logging
+import time
+
+import pytest
+
+import clikraken.global_vars as gv
+from clikraken.api.public.depth import parse_depth
+
+aiohttp = pytest.importorskip('aiohttp')
+from aiohttp import web  # noqa: E402
+from aiohttp.test_utils import TestServer  # noqa: E402
+
+from clikraken.api.async_client import AsyncKrakenAPI, sign  # noqa: E402
+from clikraken.api.retry import RetryPolicy  # noqa: E402
+
+KEY = 'key'
+SECRET = base64.b64encode(b'secret').decode()
+
+
+def test_sign_like_krakenex():
+    krakenex = pytest.importorskip('krakenex')
+    api = krakenex.API(KEY, SECRET)
+    data = {'nonce': 1500000000000, 'pair': 'XETHZEUR', 'volume': '1.5'}
+    assert sign(SECRET, '/0/private/AddOrder', data) == api._sign(data, '/0/private/AddOrder')
+
+
+def _app(state):
+    async def depth(request):
+        state['in_flight'] += 1
+        state['max_in_flight'] = max(state['max_in_flight'], state['in_flight'])
+        await asyncio.sleep(0.2)
+        state['in_flight'] -= 1
+        pair = request.query['pair']
+        return web.json_response({'error': [], 'result': {pair: {
+            'asks': [['101.0', '1.0', 1500000000]], 'bids': [['100.0', '2.0', 1500000000]]}}})
+
+    async def balance(request):
+        data = dict(await request.post())
+        state['nonces'].append(int(data['nonce']))
+        if state.get('invalid_nonces'):
+            state['invalid_nonces'] -= 1
+            return web.json_response({'error': ['EAPI:Invalid nonce']})
+        if request.headers['API-Sign'] != sign(SECRET, request.path, data):
+            return web.json_response({'error': ['EAPI:Invalid signature']})
+        return web.json_response({'error': [], 'result': {'ZEUR': '10.0'}})
+
+    async def unavailable(request):
+        return web.Response(status=503)
+
+    async def garbage(request):
+        return web.Response(text='<html>overloaded</html>')
+
+    async def error(request):
+        return web.json_response({'error': ['EService:Unavailable']})
+
+    app = web.Application()
+    app.router.add_get('/0/public/Depth', depth)
+    app.router.add_post('/0/private/Balance', balance)
+    app.router.add_get('/0/public/Unavailable', unavailable)
+    app.router.add_get('/0/public/Garbage', garbage)
+    app.router.add_get('/0/public/Error', error)
+    return app
+
+
+def run(coro_func, state):
+    async def main():
+        server = TestServer(_app(state))
+        await server.start_server()
+        try:
+            uri = str(server.make_url('')).rstrip('/')
+            async with AsyncKrakenAPI(KEY, SECRET, uri=uri, max_connections=10) as api:
+                return await coro_func(api)
+        finally:
+            await server.close()
+
+    return asyncio.run(main())
+
+
+@pytest.fixture
+def state(monkeypatch):
+    monkeypatch.setattr(gv, 'RATE_LIMITER', None)
+    monkeypatch.setattr(gv, 'RETRY_POLICY', None)
+    monkeypatch.setattr(gv, 'CRON', False)
+    monkeypatch.setattr(gv, 'ASSET_PAIRS_INDEX', {})
+    monkeypatch.setattr(gv, 'TZ', 'UTC')
+    return {'in_flight': 0, 'max_in_flight': 0, 'nonces': []}
+
+
+def test_concurrent_queries(state):
+    pairs = ['PAIR{}'.format(i) for i in range(10)]
+
+    async def queries(api):
+        return await api.query_many('public', 'Depth', [{'pair': p} for p in pairs])
+
+    t0 = time.perf_counter()
+    responses = run(queries, state)
+    assert time.perf_counter() - t0 < 1.5
+    assert state['max_in_flight'] == 10
+    assert [list(res['result']) for res in responses] == [[p] for p in pairs]
+
+    # the parsing functions of the subcommands work on the results
+    depth = parse_depth('PAIR0', responses[0]['result'])
+    assert depth['asks'][0].volume == '1.0'
+
+
+def test_private_queries(state):
+    async def queries(api):
+        return await api.query_many('private', 'Balance', [{}] * 5)
+
+    responses = run(queries, state)
+    assert all(res['result'] == {'ZEUR': '10.0'} for res in responses)
+    # different nonces even if sent during the same millisecond
+    assert len(set(state['nonces'])) == 5
+
+
+@pytest.mark.parametrize('method, message', [
+    ('Unavailable', 'Network error while querying Kraken API!'),
+    ('Garbage', 'Invalid response from Kraken API!'),
+    ('Error', 'EService:Unavailable'),
+])
+def test_errors_are_logged(state, caplog, method, message):
+    async def query(api):
+        return await api.query('public', method)
+
+    with caplog.at_level(logging.ERROR):
+        res = run(query, state)
+
+    assert 'result' not in res
+    assert any(r.getMessage().startswith(message) for r in caplog.records)
+
+
+def test_retried_like_query_kraken(state, monkeypatch, caplog):
+    monkeypatch.setattr(gv, 'RETRY_POLICY', RetryPolicy(3, 0.01))
+    state['invalid_nonces'] = 1
+
+    async def query(api):
+        return await api.query('private', 'Balance')
+
+    with caplog.at_level(logging.ERROR):
+        res = run(query, state)
+
+    # rejected, then sent again with a new nonce
+    assert res == {'error': [], 'result': {'ZEUR': '10.0'}}
+    assert len(state['nonces']) == 2 and state['nonces'][0] < state['nonces'][1]
+    assert not caplog.records
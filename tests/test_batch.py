@@ -0,0 +1,41 @@
+import os
+import sys
+from subprocess import STDOUT, check_output
+
+from clikraken.batch import GLOBAL_OPTIONS, parse_batch_line
+from clikraken.clikraken_cmd import build_parser
+
+ACCOUNT = os.path.join(os.path.dirname(__file__), 'fixtures', 'cassettes', 'account.jsonl')
+
+
+def test_parse_batch_line():
+    assert parse_batch_line('ticker -p XXBTZEUR') == ['ticker', '-p', 'XXBTZEUR']
+    assert parse_batch_line('clikraken --csv balance') == ['--csv', 'balance']
+    assert parse_batch_line('  # just a comment') == []
+    assert parse_batch_line('') == []
+
+
+def test_batch_from_stdin():
+    env = dict(os.environ, CLIKRAKEN_USER_SETTINGS_PATH=os.devnull)
+    lines = '\n'.join(['-V', '# comment', '', 'generate_settings', 'batch', 'nosuchcommand', '-V'])
+    out = check_output([sys.executable, '-m', 'clikraken', 'batch', '-d', '>>> {cmd}'],
+                       input=lines, universal_newlines=True, env=env, stderr=open(os.devnull, 'w'))
+    blocks = out.split('>>> ')[1:]
+    assert [b.splitlines()[0] for b in blocks] == ['-V', 'generate_settings', 'batch', 'nosuchcommand', '-V']
+    assert 'clikraken version:' in blocks[0]
+    assert '[clikraken]' in blocks[1]
+    assert 'clikraken version:' in blocks[4]
+
+
+def test_global_options_inherited():
+    # every global option of the command line is inherited by the lines of the batch
+    options = [action.dest for action in build_parser()._actions
+               if action.option_strings and action.dest not in ('help', 'main_func')]
+    assert sorted(options) == sorted(GLOBAL_OPTIONS)
+
+    env = dict(os.environ, CLIKRAKEN_USER_SETTINGS_PATH=os.devnull)
+    out = check_output([sys.executable, '-m', 'clikraken', '--replay', ACCOUNT, '--csv', '--timings', 'batch'],
+                       input='balance\n', universal_newlines=True, env=env, stderr=STDOUT)
+    # the balance is replayed from the cassette, and its timings are reported
+    assert 'EUR;1520.341' in out
+    assert out.count('command') == 2
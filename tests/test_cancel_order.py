@@ -0,0 +1,190 @@
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+
+import pytest
+import requests
+
+import clikraken.global_vars as gv
+from clikraken.api.kraken_api import KrakenAPI
+from clikraken.api.private.cancel_order import cancel_order
+
+
+def _order(i, pair):
+    return {'status': 'open', 'opentm': 1500000000 + i, 'userref': i % 2,
+            'descr': {'pair': pair, 'type': 'buy', 'ordertype': 'limit', 'price': '100'}}
+
+
+class FakeAPI(object):
+    """Stand-in for clikraken's KrakenAPI cancelling orders after a delay"""
+
+    uri = 'https://api.kraken.com'
+
+    def __init__(self, count=120, delay=0.05, batch_error=None, batch_ignores=(), cancel_all_error=None):
+        self.orders = {'O{:03d}'.format(i): _order(i, 'ETHEUR' if i % 3 else 'XBTEUR') for i in range(count)}
+        self.delay = delay
+        self.batch_error = batch_error
+        self.batch_ignores = set(batch_ignores)
+        self.cancel_all_error = cancel_all_error
+        self.session = requests.Session()
+        self.response = None
+        self.lock = threading.Lock()
+        self.queries = []
+
+    def _cancel(self, txid):
+        order = self.orders.get(txid)
+        if order is None or order['status'] != 'open':
+            return 0
+        order['status'] = 'canceled'
+        return 1
+
+    def query_private(self, method, data):
+        with self.lock:
+            self.queries.append((method, dict(data)))
+        time.sleep(self.delay)
+        with self.lock:
+            if method == 'OpenOrders':
+                return {'error': [], 'result': {'open': {
+                    txid: o for txid, o in self.orders.items()
+                    if o['status'] == 'open' and ('userref' not in data or o['userref'] == data['userref'])}}}
+            if method == 'CancelOrder':
+                if data['txid'] not in self.orders:
+                    return {'error': ['EOrder:Unknown order']}
+                return {'error': [], 'result': {'count': self._cancel(data['txid'])}}
+            if method == 'CancelAll':
+                if self.cancel_all_error:
+                    return {'error': [self.cancel_all_error]}
+                return {'error': [], 'result': {'count': sum(self._cancel(txid) for txid in list(self.orders))}}
+            if method == 'QueryOrders':
+                return {'error': [], 'result': {txid: self.orders[txid] for txid in data['txid'].split(',')
+                                                if txid in self.orders}}
+        raise NotImplementedError(method)
+
+    def query_private_json(self, method, data):
+        assert method == 'CancelOrderBatch'
+        with self.lock:
+            self.queries.append((method, dict(data)))
+        time.sleep(self.delay)
+        if self.batch_error:
+            return {'error': [self.batch_error]}
+        with self.lock:
+            count = sum(self._cancel(txid) for txid in data['orders'] if txid not in self.batch_ignores)
+        return {'error': [], 'result': {'count': count}}
+
+
+@pytest.fixture
+def make_api(monkeypatch):
+    monkeypatch.setattr(gv, 'API_KEY_LOADED', True)
+    monkeypatch.setattr(gv, 'MAX_CONCURRENT_QUERIES', 8)
+    monkeypatch.setattr(gv, 'CSV_SEPARATOR', ',')
+    monkeypatch.setattr(gv, 'ASSET_PAIRS_INDEX', {})
+
+    def make(**kwargs):
+        api = FakeAPI(**kwargs)
+        monkeypatch.setattr(gv, 'KRAKEN_API', api)
+        return api
+    return make
+
+
+def _args(*order_ids, **kwargs):
+    defaults = dict(raw=False, debug=False, csv=True, all=False, pair=None, userref=None, no_batch=False)
+    defaults.update(kwargs)
+    return argparse.Namespace(order_ids=list(order_ids), **defaults)
+
+
+def _results(capsys):
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == 'txid,result'
+    return [line.split(',') for line in lines[1:]]
+
+
+def test_cancel_batches(make_api, capsys):
+    api = make_api()
+    txids = sorted(api.orders)
+    cancel_order(_args(*txids))
+
+    assert _results(capsys) == [[txid, 'cancelled'] for txid in txids]
+    assert [m for m, _ in api.queries] == ['CancelOrderBatch'] * 3
+    assert [len(d['orders']) for _, d in api.queries] == [50, 50, 20]
+
+
+def test_cancel_batch_fallback(make_api, capsys):
+    api = make_api(batch_error='EGeneral:Unknown method')
+    t0 = time.perf_counter()
+    cancel_order(_args('O001', 'O002', 'O999', 'O003', 'O001'))
+    elapsed = time.perf_counter() - t0
+
+    assert _results(capsys) == [['O001', 'cancelled'], ['O002', 'cancelled'],
+                                ['O999', 'EOrder:Unknown order'], ['O003', 'cancelled']]
+    assert sorted(m for m, _ in api.queries) == ['CancelOrder'] * 4 + ['CancelOrderBatch']
+    # the CancelOrder queries are concurrent
+    assert elapsed < 4 * api.delay
+
+
+def test_cancel_batch_partial_checked(make_api, capsys):
+    api = make_api(count=5, batch_ignores=['O002'])
+    api.orders['O004']['status'] = 'closed'
+    cancel_order(_args(*sorted(api.orders)))
+
+    assert _results(capsys) == [['O000', 'cancelled'], ['O001', 'cancelled'], ['O002', 'not cancelled'],
+                                ['O003', 'cancelled'], ['O004', 'already closed']]
+    assert [m for m, _ in api.queries] == ['CancelOrderBatch', 'QueryOrders']
+
+
+def test_cancel_by_pair_and_userref(make_api, capsys):
+    api = make_api(count=12)
+    cancel_order(_args(pair='XBTEUR', userref=0, no_batch=True))
+
+    # orders 0, 6 are XBTEUR with userref 0
+    assert _results(capsys) == [['O000', 'cancelled'], ['O006', 'cancelled']]
+    assert api.queries[0] == ('OpenOrders', {'userref': 0})
+    assert sorted(d['txid'] for m, d in api.queries[1:]) == ['O000', 'O006']
+
+
+def test_cancel_all(make_api, capsys):
+    api = make_api(count=30)
+    cancel_order(_args(all=True, csv=False))
+
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[-1].startswith('30 of 30 orders cancelled in ')
+    assert [m for m, _ in api.queries] == ['OpenOrders', 'CancelAll']
+
+    cancel_order(_args('O001', all=True))
+    assert 'O001' not in capsys.readouterr().out
+
+
+def test_cancel_all_error(make_api, capsys):
+    make_api(count=2, cancel_all_error='EGeneral:Permission denied')
+    cancel_order(_args(all=True))
+    assert _results(capsys) == [['O000', 'EGeneral:Permission denied'], ['O001', 'EGeneral:Permission denied']]
+
+
+def test_query_private_json_signature(monkeypatch):
+    secret = base64.b64encode(b'secret').decode()
+    api = KrakenAPI('key', secret)
+    posted = {}
+
+    class Response(object):
+        status_code = 200
+
+        def json(self):
+            return {'error': [], 'result': {'count': 2}}
+
+    def post(url, data, headers, timeout):
+        posted.update(url=url, data=data, headers=headers)
+        return Response()
+
+    monkeypatch.setattr(api.session, 'post', post)
+    assert api.query_private_json('CancelOrderBatch', {'orders': ['A', 'B']})['result'] == {'count': 2}
+
+    body = json.loads(posted['data'])
+    assert posted['url'] == 'https://api.kraken.com/0/private/CancelOrderBatch'
+    assert body['orders'] == ['A', 'B']
+    message = b'/0/private/CancelOrderBatch' + hashlib.sha256((str(body['nonce']) + posted['data']).encode()).digest()
+    expected = base64.b64encode(hmac.new(b'secret', message, hashlib.sha512).digest()).decode()
+    assert posted['headers']['API-Sign'] == expected
+    assert posted['headers']['Content-Type'] == 'application/json'
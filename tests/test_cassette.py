@@ -0,0 +1,104 @@
+import json
+import os
+
+import pytest
+
+import clikraken.global_vars as gv
+from clikraken.cassette import CassetteAPI, RecordingAPI
+from clikraken.clikraken import run_command
+from clikraken.clikraken_cmd import parse_args
+
+ACCOUNT = os.path.join(os.path.dirname(__file__), 'fixtures', 'cassettes', 'account.jsonl')
+
+
+class FakeAPI(object):
+    """Stand-in for clikraken's KrakenAPI adding the nonce to the parameters like krakenex"""
+
+    def __init__(self):
+        self.count = 0
+
+    def query_public(self, method, data=None, timeout=None):
+        self.count += 1
+        return {'error': [], 'result': {'count': self.count}}
+
+    def query_private(self, method, data=None, timeout=None):
+        data['nonce'] = 123
+        return self.query_public(method, data, timeout)
+
+
+@pytest.mark.parametrize('name', ['cassette.jsonl', 'cassette.jsonl.gz'])
+def test_record_and_replay(tmpdir, name):
+    path = str(tmpdir.join(name))
+    api = RecordingAPI(FakeAPI(), path)
+    api.query_private('Balance', {})
+    api.query_private('Balance', {})
+    api.query_public('Ticker', {'pair': 'XETHZEUR'})
+    api.close()
+
+    replay = CassetteAPI(path)
+    # recorded without the nonce, served in order, then the last one again
+    assert [replay.query_private('Balance', {'nonce': 456})['result']['count'] for _ in range(3)] == [1, 2, 2]
+    assert replay.query_public('Ticker', {'pair': 'XETHZEUR'})['result'] == {'count': 3}
+    assert replay.query_public('Ticker', {'pair': 'XXBTZEUR'})['error'] == [
+        'ECassette:No response recorded for Ticker {"pair": "XXBTZEUR"}']
+
+
+def test_replayed_responses_are_copies(tmpdir):
+    replay = CassetteAPI(ACCOUNT)
+    replay.query_private('Balance')['result'].clear()
+    assert replay.query_private('Balance')['result']['ZEUR'] == '1520.3410'
+
+
+@pytest.fixture
+def replay(monkeypatch, capsys):
+    for name in ['KRAKEN_API', 'API_KEY_LOADED', 'ASSET_PAIRS_INDEX', 'ASSET_PAIRS_CACHE_TTL',
+                 'CRON', 'DEBUG', 'CSV_SEPARATOR']:
+        monkeypatch.setattr(gv, name, getattr(gv, name))
+    monkeypatch.setattr(gv, 'KRAKEN_API', None)
+    monkeypatch.setattr(gv, 'TZ', 'UTC')
+    monkeypatch.setattr(gv, 'RATE_LIMITER', None)
+    monkeypatch.setattr(gv, 'RETRY_POLICY', None)
+
+    def run(*argv):
+        run_command(parse_args(['--replay', ACCOUNT] + list(argv)))
+        return capsys.readouterr()[0].splitlines()
+    return run
+
+
+def test_balance_offline(replay):
+    assert replay('balance')[2:] == ['ETH          2.5', 'EUR       1520.341', 'XBT          0.05']
+
+
+def test_open_orders_offline(replay):
+    lines = replay('--csv', 'olist', '-p', 'all')
+    assert lines[0] == 'orderid;status;type;vol;pair;ordertype;price;viqc;opening_date'
+    assert lines[1] == 'O000000-ABCDE-FGHIJK;open;buy;0.51758736;XBTEUR;limit;8047.2;False;2017-07-14 02:40:00+00:00'
+    assert len(lines) == 4
+
+
+def test_ledgers_and_trades_offline(replay):
+    lines = replay('ledgers', '--all')
+    assert len(lines) == 5
+    assert lines[2].startswith('L000000-ABCDE-FGHIJK  T000000-ABCDE-FGHIJK  2017-07-14 02:40:00+00:00  trade   ETH')
+
+    lines = replay('--csv', 'trades')
+    assert [line.split(';')[0] for line in lines[1:]] == [
+        'T000000-ABCDE-FGHIJK', 'T000001-ABCDE-FGHIJK', 'T000002-ABCDE-FGHIJK']
+
+
+def test_record_from_the_cli(replay, tmpdir, monkeypatch):
+    # record the queries made while replaying another cassette
+    path = str(tmpdir.join('balance.jsonl'))
+
+    def load_api_keyfile():
+        gv.KRAKEN_API = CassetteAPI(ACCOUNT)
+        gv.API_KEY_LOADED = True
+
+    monkeypatch.setattr('clikraken.clikraken.load_api_keyfile', load_api_keyfile)
+    run_command(parse_args(['--record', path, 'balance']))
+    gv.KRAKEN_API.close()
+
+    with open(path) as f:
+        entries = [json.loads(line) for line in f]
+    assert [(e['api_type'], e['method'], e['params']) for e in entries] == [('private', 'Balance', {})]
+    assert entries[0]['response']['result']['XETH'] == '2.5000000000'
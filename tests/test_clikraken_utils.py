@@ -1,3 +1,5 @@
+import io
+
 from clikraken import clikraken_utils
 
 
@@ -13,3 +15,29 @@ def test_base_quote_short_from_asset_pair():
     assert 'BCH', 'USD' == clikraken_utils.base_quote_short_from_asset_pair('BCHUSD')
     assert 'DASH', 'EUR' == clikraken_utils.base_quote_short_from_asset_pair('DASHEUR')
     assert 'DASH', 'XBT' == clikraken_utils.base_quote_short_from_asset_pair('DASHXBT')
+
+
+def test_csv_quoting(monkeypatch):
+    monkeypatch.setattr(clikraken_utils.gv, 'CSV_SEPARATOR', ';')
+    rows = [{'a': 1, 'b': 'x;y'}, {'a': 'say "hi"', 'b': 'two\nlines'}]
+    assert clikraken_utils.csv(rows, headers="keys") == 'a;b\n1;"x;y"\n"say ""hi""";"two\nlines"'
+    # multi-character separator, rows given as sequences
+    lines = list(clikraken_utils.csv_lines([[1, 'a::b', 'c:d']], headers=['x', 'y', 'z'], separator='::'))
+    assert lines == ['x::y::z', '1::"a::b"::c:d']
+
+
+def test_write_csv_streams(monkeypatch):
+    monkeypatch.setattr(clikraken_utils.gv, 'CSV_SEPARATOR', ',')
+    out = io.StringIO()
+
+    def rows():
+        for i in range(3):
+            yield {'n': i}
+            # each row is written before the next one is produced
+            assert out.getvalue().endswith('{}\n'.format(i))
+
+    assert clikraken_utils.write_csv(rows(), headers="keys", file=out) == 3
+    assert out.getvalue() == 'n\n0\n1\n2\n'
+    # nothing at all is output for an empty table
+    assert clikraken_utils.write_csv(iter([]), headers="keys", file=out) == 0
+    assert out.getvalue() == 'n\n0\n1\n2\n'
@@ -0,0 +1,66 @@
+import logging
+from decimal import Decimal
+
+import pytest
+
+import clikraken.global_vars as gv
+from clikraken.api.private.get_ledgers import get_ledgers
+from clikraken.columnar import ColumnarWriter, record_writer
+from clikraken.records import Candle
+from test_pagination import FakeAPI, LEDGERS, _args
+
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+
+
+@pytest.fixture
+def fake_api(monkeypatch):
+    api = FakeAPI()
+    monkeypatch.setattr(gv, 'KRAKEN_API', api)
+    monkeypatch.setattr(gv, 'API_KEY_LOADED', True)
+    monkeypatch.setattr(gv, 'TZ', 'UTC')
+    return api
+
+
+def test_ledgers_all_parquet(fake_api, tmp_path, capsys):
+    path = str(tmp_path / 'ledgers.parquet')
+    get_ledgers(_args(output=['parquet', path]))
+
+    assert capsys.readouterr().out == ''
+    parquet = pq.ParquetFile(path)
+    # one row group per page (without the oldest entry of the previous page, repeated by Kraken)
+    assert [parquet.metadata.row_group(i).num_rows for i in range(parquet.num_row_groups)] == [50, 49, 21]
+
+    table = parquet.read()
+    assert table.schema.field('time').type == pa.timestamp('us', tz='UTC')
+    assert table.schema.field('balance').type == pa.decimal128(38, 18)
+    rows = table.to_pylist()
+    assert [row['id'] for row in rows] == sorted(LEDGERS, reverse=True)
+    assert rows[0]['balance'] == Decimal('119')
+    assert rows[0]['time'].timestamp() == LEDGERS['L0119']['time']
+
+
+def test_arrow_batches(tmp_path):
+    path = str(tmp_path / 'ohlc.arrow')
+    candles = [Candle(1500000000 + 60 * i, '1.5', '2', '0.5', '1.25', '1.2', '0.00000001', i) for i in range(5)]
+    with record_writer(['arrow', path], Candle, prefix=['Pair']) as writer:
+        assert writer.write_all((('ETHEUR',) + c for c in candles), batch_size=2) == 5
+
+    with pa.ipc.open_file(path) as reader:
+        assert reader.num_record_batches == 3
+        table = reader.read_all()
+    assert table.column_names == ['Pair'] + list(Candle._fields)
+    assert table.column('Volume')[0].as_py() == Decimal('0.00000001')
+    assert table.column('Count').type == pa.int64()
+
+
+def test_empty_output_has_schema(tmp_path):
+    path = str(tmp_path / 'empty.parquet')
+    ColumnarWriter('parquet', path, ['a', 'b'], {'b': 'decimal'}).close()
+    assert pq.read_table(path).schema.names == ['a', 'b']
+
+
+def test_unknown_format(tmp_path, caplog):
+    with caplog.at_level(logging.ERROR):
+        assert record_writer(['xlsx', str(tmp_path / 'x')], Candle) is None
+    assert 'Unknown output format' in caplog.text
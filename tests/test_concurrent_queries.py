@@ -0,0 +1,70 @@
+import argparse
+import threading
+import time
+
+import pytest
+import requests
+
+import clikraken.global_vars as gv
+from clikraken.api.api_utils import query_api_concurrently
+from clikraken.api.public.depth import depth
+
+
+class FakeAPI(object):
+    """Stand-in for krakenex.API answering Depth queries after a delay"""
+
+    uri = 'https://api.kraken.com'
+
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.session = requests.Session()
+        self.threads = set()
+        self.response = None
+
+    def query_public(self, method, data):
+        self.threads.add(threading.current_thread().name)
+        time.sleep(self.delay)
+        # answer later for the first pairs to make sure that the order is restored
+        pair = data['pair']
+        return {'error': [], 'result': {pair: {
+            'asks': [['{}.5'.format(len(pair)), '1.0', 1500000000]],
+            'bids': [['{}.4'.format(len(pair)), '2.0', 1500000000]],
+        }}}
+
+    def query_private(self, method, data):
+        raise NotImplementedError
+
+
+@pytest.fixture
+def fake_api(monkeypatch):
+    api = FakeAPI()
+    monkeypatch.setattr(gv, 'KRAKEN_API', api)
+    monkeypatch.setattr(gv, 'MAX_CONCURRENT_QUERIES', 8)
+    return api
+
+
+def _args(**kwargs):
+    defaults = dict(raw=False, debug=False, csv=False, count=7, watch=None, stream=False)
+    defaults.update(kwargs)
+    return argparse.Namespace(**defaults)
+
+
+def test_query_api_concurrently_keeps_order(fake_api):
+    pairs = ['PAIR{}'.format(i) for i in range(8)]
+    t0 = time.perf_counter()
+    results = query_api_concurrently('public', 'Depth', [{'pair': p} for p in pairs], _args())
+    elapsed = time.perf_counter() - t0
+
+    assert [list(res.keys()) for res in results] == [[p] for p in pairs]
+    # about one round trip instead of 8
+    assert elapsed < 4 * fake_api.delay
+    assert len(fake_api.threads) > 1
+
+
+def test_depth_multiple_pairs_csv(fake_api, monkeypatch, capsys):
+    monkeypatch.setattr(gv, 'CSV_SEPARATOR', ';')
+    depth(_args(pair='XETHZEUR,XXBTZEUR', csv=True))
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == 'dtype;pair;price;Volume;Age'
+    assert [line.split(';')[:2] for line in lines[1:]] == [
+        ['asks', 'ETHEUR'], ['bids', 'ETHEUR'], ['asks', 'XBTEUR'], ['bids', 'XBTEUR']]
@@ -0,0 +1,100 @@
+import os
+import socket
+import sys
+import time
+from subprocess import Popen
+
+import pytest
+
+import clikraken.global_vars as gv
+from clikraken.clikraken_cmd import parse_args
+from clikraken.daemon import forward, socket_path
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason='Unix sockets not available')
+
+SCRIPT = """
+import argparse
+import os
+import socket
+import sys
+
+import clikraken.global_vars as gv
+from clikraken.clikraken_utils import load_config
+from clikraken.daemon import serve
+
+
+class FakeAPI(object):
+    queries = 0
+
+    def query_private(self, method, data):
+        FakeAPI.queries += 1
+        if os.getenv('CLIKRAKEN_TEST_INVALID'):
+            # environment variable forwarded by the client
+            return {'error': [], 'result': ['invalid']}
+        return {'error': [], 'result': {'ZEUR': '100.5', 'XXBT': '0.25', 'queries': str(FakeAPI.queries)}}
+
+
+load_config()
+gv.KRAKEN_API = FakeAPI()
+gv.API_KEY_LOADED = True
+gv.DAEMON_SOCKET = sys.argv[1]
+serve(argparse.Namespace(keepalive=0))
+"""
+
+
+@pytest.fixture
+def daemon(tmpdir, monkeypatch):
+    path = str(tmpdir.join('daemon.sock'))
+    proc = Popen([sys.executable, '-c', SCRIPT, path])
+    for _ in range(200):
+        if os.path.exists(path):
+            break
+        time.sleep(0.05)
+    monkeypatch.setattr(gv, 'DAEMON_SOCKET', path)
+    yield path
+    proc.terminate()
+    proc.wait()
+
+
+def _forward(argv):
+    return forward(parse_args(argv), argv)
+
+
+def test_forwarded(daemon, capsys):
+    assert _forward(['balance']) == 0
+    out = capsys.readouterr()[0]
+    assert '100.5' in out
+    assert 'queries' in out
+
+    # the same process answers the next subcommands
+    assert _forward(['--csv', 'balance']) == 0
+    out = capsys.readouterr()[0]
+    assert 'EUR;100.5' in out
+    assert 'queries;2' in out
+
+
+def test_exception(daemon, capsys, monkeypatch):
+    monkeypatch.setenv('CLIKRAKEN_TEST_INVALID', '1')
+    assert _forward(['balance']) == 1
+    assert 'TypeError' in capsys.readouterr()[1]
+    monkeypatch.delenv('CLIKRAKEN_TEST_INVALID')
+    # the daemon is still running
+    assert _forward(['balance']) == 0
+
+
+def test_not_forwarded(daemon, monkeypatch):
+    assert _forward(['generate_settings']) is None
+    assert _forward(['--no-daemon', 'balance']) is None
+    assert _forward(['last_trades', '--follow']) is None
+    assert _forward(['place_batch', '-f', '-']) is None
+
+    # the daemon uses another API key
+    monkeypatch.setattr(gv, 'KRAKEN_API_KEYFILE', '/other/kraken.key')
+    assert _forward(['balance']) is None
+
+
+def test_no_daemon(tmpdir, monkeypatch):
+    monkeypatch.setattr(gv, 'DAEMON_SOCKET', str(tmpdir.join('daemon.sock')))
+    assert _forward(['balance']) is None
+    monkeypatch.setattr(gv, 'DAEMON_SOCKET', 'none')
+    assert socket_path() is None
@@ -0,0 +1,119 @@
+import argparse
+
+import pytest
+
+import clikraken.global_vars as gv
+from clikraken.api.private.get_ledgers import get_ledgers
+from clikraken.api.private.sync import sync
+from clikraken.history_db import HistoryDB
+
+
+def _ledger(i, asset='XETH'):
+    return {'refid': 'R{:04d}'.format(i), 'time': 1500000000.0 + 60 * i, 'type': 'trade',
+            'asset': asset, 'aclass': 'currency', 'amount': '1.0', 'fee': '0.0', 'balance': str(i)}
+
+
+LEDGERS = {'L{:04d}'.format(i): _ledger(i, 'XETH' if i % 2 else 'ZEUR') for i in range(80)}
+
+
+def test_upsert_is_idempotent():
+    db = HistoryDB(':memory:')
+    assert db.upsert('ledgers', LEDGERS) == 80
+    assert db.upsert('ledgers', LEDGERS) == 80
+    assert db.count('ledgers') == 80
+
+
+def test_query_filters():
+    db = HistoryDB(':memory:')
+    db.upsert('ledgers', LEDGERS)
+
+    assert set(db.query('ledgers', ids=['L0001', 'L0002'])) == {'L0001', 'L0002'}
+    assert len(db.query('ledgers', asset=['ETH'])) == 40
+    # start and end are exclusive, and can be given as ids
+    assert list(db.query('ledgers', start=LEDGERS['L0010']['time'], end='L0013')) == ['L0011', 'L0012']
+
+
+class FakeAPI(object):
+    """Stand-in for krakenex.API serving the Ledgers method"""
+
+    def __init__(self):
+        self.ledgers = dict(LEDGERS)
+        self.queries = []
+        self.failing = ()
+
+    def query_private(self, method, data):
+        self.queries.append((method, dict(data)))
+        if method in self.failing:
+            return {'error': ['EService:Unavailable']}
+        if method != 'Ledgers':
+            return {'error': [], 'result': {'trades': {}, 'closed': {}, 'count': 0}}
+        entries = sorted(self.ledgers.items(), key=lambda kv: kv[1]['time'], reverse=True)
+        if 'start' in data:
+            entries = [kv for kv in entries if kv[1]['time'] > float(data['start'])]
+        if 'end' in data:
+            entries = [kv for kv in entries if kv[1]['time'] <= self.ledgers[data['end']]['time']]
+        return {'error': [], 'result': {'ledger': dict(entries[:50]), 'count': len(entries)}}
+
+    def query_public(self, method, data):
+        raise NotImplementedError
+
+
+@pytest.fixture
+def fake_env(monkeypatch, tmpdir):
+    api = FakeAPI()
+    monkeypatch.setattr(gv, 'KRAKEN_API', api)
+    monkeypatch.setattr(gv, 'API_KEY_LOADED', True)
+    monkeypatch.setattr(gv, 'TZ', 'UTC')
+    monkeypatch.setattr(gv, 'HISTORY_DB_PATH', str(tmpdir.join('history.sqlite')))
+    return api
+
+
+def test_incremental_sync(fake_env, capsys):
+    args = argparse.Namespace(raw=False, debug=False, csv=False, tables='ledgers', full=False)
+
+    sync(args)
+    assert len(fake_env.queries) == 2
+
+    # only the new entries are fetched on the next run
+    fake_env.ledgers['L0100'] = _ledger(100)
+    fake_env.queries = []
+    sync(args)
+    assert fake_env.queries == [('Ledgers', {'start': int(LEDGERS['L0079']['time']) - 1})]
+    capsys.readouterr()
+
+    ledgers_args = argparse.Namespace(raw=False, debug=False, csv=False, local=True, id=None, asset='ETH',
+                                      type='all', start=None, end=None, ofs=None, all=False, output=None)
+    get_ledgers(ledgers_args)
+    assert len(capsys.readouterr().out.splitlines()) == 2 + 41
+
+
+def test_sync_failed_history(fake_env, monkeypatch, capsys):
+    monkeypatch.setattr(gv, 'RETRY_POLICY', None)
+    monkeypatch.setattr(gv, 'CSV_SEPARATOR', ';')
+    fake_env.failing = ('TradesHistory',)
+    args = argparse.Namespace(raw=False, debug=False, csv=True, tables='all', full=False)
+
+    with pytest.raises(SystemExit) as e:
+        sync(args)
+    assert e.value.code == 1
+
+    # the other histories are synchronized, and the failure is reported
+    assert [m for m, _ in fake_env.queries] == ['Ledgers', 'Ledgers', 'TradesHistory', 'ClosedOrders']
+    lines = capsys.readouterr().out.splitlines()
+    assert [line.split(';')[:3] for line in lines[1:]] == [
+        ['ledgers', '80', '80'], ['trades', 'failed', '0'], ['closed_orders', '0', '0']]
+
+
+def test_local_ledgers_csv(fake_env, monkeypatch, capsys):
+    monkeypatch.setattr(gv, 'CSV_SEPARATOR', ';')
+    db = HistoryDB()
+    db.upsert('ledgers', LEDGERS)
+    db.close()
+
+    args = argparse.Namespace(raw=False, debug=False, csv=True, local=True, all=False, id=None,
+                              asset='all', type='all', start=None, end=None, ofs=None, output=None)
+    get_ledgers(args)
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == 'id;refid;time;type;asset;aclass;amount;fee;balance'
+    assert len(lines) == 81
+    assert lines[1].startswith('L0000;R0000;2017-07-14 02:40:00+00:00;trade;EUR;')
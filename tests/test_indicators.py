@@ -0,0 +1,131 @@
+import argparse
+import random
+
+import pytest
+
+import clikraken.global_vars as gv
+from clikraken.api.public import ohlc as ohlc_module
+
+np = pytest.importorskip('numpy')
+
+from clikraken.indicators import IndicatorError, atr, bollinger, ema, parse_indicators, recursive_filter, rsi, sma  # noqa
+
+
+def _prices(n, seed=1):
+    rnd = random.Random(seed)
+    close = [100.0]
+    for _ in range(n - 1):
+        close.append(max(1.0, close[-1] + rnd.gauss(0, 1)))
+    high = [c + rnd.random() for c in close]
+    low = [c - rnd.random() for c in close]
+    return np.array(high), np.array(low), np.array(close)
+
+
+def _wilder(values, n):
+    """Naive Wilder smoothing seeded with the mean of the first n values"""
+    out = [None] * len(values)
+    out[n - 1] = avg = sum(values[:n]) / n
+    for i in range(n, len(values)):
+        avg = (avg * (n - 1) + values[i]) / n
+        out[i] = avg
+    return out
+
+
+def test_recursive_filter_long_series():
+    x = np.linspace(1, 2, 10000)
+    for alpha in (0.01, 2 / 3, 0.999):
+        y = recursive_filter(x, alpha, 5.0)
+        prev, expected = 5.0, []
+        for v in x:
+            prev = alpha * v + (1 - alpha) * prev
+            expected.append(prev)
+        assert np.allclose(y, expected, rtol=1e-12)
+
+
+def test_moving_averages():
+    _, _, close = _prices(500)
+    assert np.isnan(sma(close, 20)[:19]).all()
+    assert sma(close, 20)[19] == pytest.approx(close[:20].mean())
+    assert sma(close, 20)[-1] == pytest.approx(close[-20:].mean())
+
+    alpha = 2 / 13
+    expected = close[:12].mean()
+    for v in close[12:]:
+        expected = alpha * v + (1 - alpha) * expected
+    assert ema(close, 12)[-1] == pytest.approx(expected)
+
+    lower, middle, upper = bollinger(close, 20, 2.5)
+    assert upper[-1] - middle[-1] == pytest.approx(2.5 * close[-20:].std())
+    assert middle[-1] - lower[-1] == pytest.approx(2.5 * close[-20:].std())
+
+
+def test_moving_windows_long_series():
+    # prices far from 0 trending over a long series, compared with each window computed separately
+    _, _, close = _prices(20000)
+    close = close + np.linspace(50000, 60000, len(close))
+    means = sma(close, 50)
+    lower, middle, upper = bollinger(close, 50, 2.0)
+    for i in range(49, len(close), 997):
+        window = close[i - 49:i + 1]
+        assert means[i] == pytest.approx(window.mean(), rel=1e-12)
+        assert upper[i] - middle[i] == pytest.approx(2.0 * window.std(), rel=1e-6)
+
+
+def test_rsi_and_atr():
+    high, low, close = _prices(300)
+    deltas = [b - a for a, b in zip(close[:-1], close[1:])]
+    gains = _wilder([max(d, 0) for d in deltas], 14)
+    losses = _wilder([max(-d, 0) for d in deltas], 14)
+    assert np.isnan(rsi(close, 14)[:14]).all()
+    assert rsi(close, 14)[-1] == pytest.approx(100 - 100 / (1 + gains[-1] / losses[-1]))
+    assert rsi(np.full(30, 5.0), 14)[-1] == 50
+
+    true_ranges = [high[0] - low[0]] + [max(h - lo, abs(h - c), abs(lo - c))
+                                        for h, lo, c in zip(high[1:], low[1:], close[:-1])]
+    assert atr(high, low, close, 14)[-1] == pytest.approx(_wilder(true_ranges, 14)[-1])
+
+
+def test_parse_indicators():
+    assert parse_indicators('sma:20, bb:20:2.5,RSI:14') == [('sma', [20]), ('bb', [20, 2.5]), ('rsi', [14])]
+    for spec in ('macd:12', 'sma', 'sma:x', 'sma:0', 'ema:1:2'):
+        with pytest.raises(IndicatorError):
+            parse_indicators(spec)
+
+
+def test_ohlc_indicators_csv(monkeypatch, capsys):
+    monkeypatch.setattr(gv, 'TZ', 'UTC')
+    monkeypatch.setattr(gv, 'CSV_SEPARATOR', ',')
+    monkeypatch.setattr(gv, 'ASSET_PAIRS_INDEX', {})
+    closes = [1, 2, 3, 4, 5, 6]
+    candles = [[1500000000 + 60 * i, str(c), str(c), str(c), str(c), str(c), '1.0', 1] for i, c in enumerate(closes)]
+    monkeypatch.setattr(ohlc_module, 'query_api_concurrently',
+                        lambda *args: [{'XETHZEUR': candles, 'last': 1500000300}])
+
+    args = argparse.Namespace(pair='XETHZEUR', since=None, interval=1, count=5, csv=True, output=None, resample=None,
+                              indicators='sma:3,bb:3')
+    ohlc_module.ohlc(args)
+
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == ('Time,Open,High,Low,Close,VWAP,Volume,Count,'
+                        'SMA(3),BB(3) lower,BB(3) middle,BB(3) upper')
+    # most recent first, no value before the window is complete
+    assert [line.split(',')[8] for line in lines[1:]] == ['5', '4', '3', '2', '']
+    assert lines[1].split(',')[9:] == ['3.36700684', '5', '6.63299316']
+
+
+def test_ohlc_indicators_output(monkeypatch, tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    closes = [1, 2, 3, 4, 5, 6]
+    candles = [[1500000000 + 60 * i, str(c), str(c), str(c), str(c), str(c), '1.0', 1] for i, c in enumerate(closes)]
+    monkeypatch.setattr(ohlc_module, 'query_api_concurrently',
+                        lambda *args: [{'XETHZEUR': candles, 'last': 1500000300}])
+
+    path = str(tmp_path / 'ohlc.parquet')
+    args = argparse.Namespace(pair='XETHZEUR', since=None, interval=1, count=5, csv=False, output=['parquet', path],
+                              resample=None, indicators='sma:3,bb:3')
+    ohlc_module.ohlc(args)
+
+    table = pq.read_table(path)
+    assert table.column_names[8:] == ['SMA(3)', 'BB(3) lower', 'BB(3) middle', 'BB(3) upper']
+    # most recent first, no value before the window is complete
+    assert table.column('SMA(3)').to_pylist() == [5.0, 4.0, 3.0, 2.0, None]
@@ -0,0 +1,42 @@
+import os
+import sys
+from subprocess import check_output
+
+import pytest
+
+HEAVY_MODULES = ['arrow', 'tabulate', 'krakenex', 'requests']
+
+SCRIPT = """
+import sys
+sys.argv = ['clikraken'] + sys.argv[1:]
+from clikraken.clikraken import main
+try:
+    main()
+except SystemExit:
+    pass
+print('LOADED:' + ','.join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+def _loaded_modules(*argv):
+    env = dict(os.environ, CLIKRAKEN_USER_SETTINGS_PATH=os.devnull)
+    out = check_output([sys.executable, '-c', SCRIPT.format(heavy=HEAVY_MODULES)] + list(argv),
+                       universal_newlines=True, env=env)
+    loaded = out.strip().splitlines()[-1][len('LOADED:'):]
+    return [m for m in loaded.split(',') if m]
+
+
+@pytest.mark.parametrize('argv', [
+    ['-V'],
+    ['generate_settings'],
+    ['ticker', '--help'],
+    ['ledgers', '--help'],
+])
+def test_no_heavy_imports_at_startup(argv):
+    assert _loaded_modules(*argv) == []
+
+
+def test_lazy_command_resolves_function():
+    from clikraken.clikraken_cmd import api_command
+    from clikraken.api.public.ticker import ticker
+    assert api_command('public', 'ticker').load() is ticker
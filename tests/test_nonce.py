@@ -0,0 +1,76 @@
+import sys
+import threading
+from subprocess import Popen, PIPE
+
+import pytest
+
+import clikraken.global_vars as gv
+from clikraken.api.nonce import NonceAllocator, fcntl, next_nonce, setup_nonce_allocator
+
+
+def test_nonces_increase_across_threads():
+    nonces = []
+
+    def take():
+        local = [next_nonce() for _ in range(1000)]
+        assert local == sorted(local)
+        nonces.extend(local)
+
+    threads = [threading.Thread(target=take) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(set(nonces)) == 8000
+
+
+def test_nonce_follows_the_clock():
+    now = [1000.0]
+    allocator = NonceAllocator(clock=lambda: now[0])
+    assert [allocator.next() for _ in range(3)] == [1000000, 1000001, 1000002]
+    now[0] = 2000.0
+    assert allocator.next() == 2000000
+    # never goes back, even if the clock does
+    now[0] = 1500.0
+    assert allocator.next() == 2000001
+
+
+@pytest.mark.skipif(fcntl is None, reason='fcntl not available')
+def test_shared_state_file(tmpdir):
+    state_file = str(tmpdir.join('nonce'))
+    allocator1 = NonceAllocator(state_file, clock=lambda: 1000.0)
+    allocator2 = NonceAllocator(state_file, clock=lambda: 1000.0)
+
+    assert allocator1.next() == 1000000
+    assert allocator2.next() == 1000001
+    assert allocator1.next() == 1000002
+
+
+SCRIPT = """
+import sys
+from clikraken.api.nonce import NonceAllocator
+allocator = NonceAllocator(sys.argv[1])
+print('\\n'.join(str(allocator.next()) for _ in range(500)))
+"""
+
+
+@pytest.mark.skipif(fcntl is None, reason='fcntl not available')
+def test_nonces_unique_across_processes(tmpdir):
+    state_file = str(tmpdir.join('nonce'))
+    procs = [Popen([sys.executable, '-c', SCRIPT, state_file], stdout=PIPE, universal_newlines=True)
+             for _ in range(4)]
+    nonces = []
+    for proc in procs:
+        out, _ = proc.communicate()
+        local = [int(n) for n in out.split()]
+        assert local == sorted(local)
+        nonces.extend(local)
+    assert len(nonces) == 2000
+    assert len(set(nonces)) == 2000
+
+
+def test_setup(monkeypatch, tmpdir):
+    monkeypatch.setattr(gv, 'CACHE_DIR', str(tmpdir.join('cache')))
+    assert setup_nonce_allocator('none').state_file is None
+    expected = str(tmpdir.join('cache', 'nonce')) if fcntl else None
+    assert setup_nonce_allocator('').state_file == expected
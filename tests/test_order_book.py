@@ -0,0 +1,115 @@
+import argparse
+import io
+
+import clikraken.global_vars as gv
+from clikraken.api.public.depth import watch_depth
+from clikraken.order_book import LevelChange, TerminalRenderer, book_from_depth, book_lines, diff_books
+
+
+def _depth(asks, bids):
+    return {'asks': [[p, v, 1500000000] for p, v in asks], 'bids': [[p, v, 1500000000] for p, v in bids]}
+
+
+OLD = book_from_depth(_depth([('101.0', '1.0'), ('102.0', '2.0')], [('100.0', '1.5'), ('99.0', '3.0')]))
+NEW = book_from_depth(_depth([('101.0', '1.0'), ('102.0', '2.5')], [('100.5', '0.1'), ('100.0', '1.5')]))
+
+
+def test_diff_books():
+    assert diff_books(OLD, OLD) == []
+    assert diff_books(OLD, NEW) == [
+        LevelChange('asks', '102.0', 'changed', '2.0', '2.5'),
+        LevelChange('bids', '100.5', 'added', None, '0.1'),
+        LevelChange('bids', '99.0', 'removed', '3.0', None),
+    ]
+    # the first snapshot is made of added levels only
+    assert [c.kind for c in diff_books(None, OLD)] == ['added'] * 4
+
+
+def test_book_lines():
+    lines = book_lines('ETHEUR', OLD)
+    assert [line.split() for line in lines] == [
+        ['ETHEUR'], ['Ask', 'Volume'], ['102.0', '2.0'], ['101.0', '1.0'],
+        ['Bid', 'Volume'], ['100.0', '1.5'], ['99.0', '3.0']]
+    # fixed width lines
+    assert len(set(len(line) for line in lines[1:])) == 1
+
+
+def test_renderer_only_redraws_changed_lines():
+    out = io.StringIO()
+    renderer = TerminalRenderer(out)
+    assert renderer.render(['a', 'b', 'c']) == 3
+    out.truncate(0)
+    out.seek(0)
+
+    assert renderer.render(['a', 'B']) == 1
+    written = out.getvalue()
+    assert '\x1b[2;1H\x1b[2KB' in written
+    # the third line is cleared, the first one untouched
+    assert '\x1b[3;1H\x1b[2K' in written
+    assert 'a' not in written
+
+
+class FakeAPI(object):
+    """Stand-in for krakenex.API serving successive snapshots of the order book"""
+
+    def __init__(self, snapshots):
+        self.snapshots = list(snapshots)
+
+    def query_public(self, method, data):
+        return {'error': [], 'result': {'XETHZEUR': self.snapshots.pop(0)}}
+
+    def query_private(self, method, data):
+        raise NotImplementedError
+
+
+def test_watch_changes_only(monkeypatch, capsys):
+    monkeypatch.setattr(gv, 'KRAKEN_API', FakeAPI([
+        _depth([('101.0', '1.0'), ('102.0', '2.0')], [('100.0', '1.5'), ('99.0', '3.0')]),
+        _depth([('101.0', '1.0'), ('102.0', '2.5')], [('100.5', '0.1'), ('100.0', '1.5')]),
+    ]))
+    monkeypatch.setattr(gv, 'MAX_CONCURRENT_QUERIES', 8)
+    monkeypatch.setattr(gv, 'ASSET_PAIRS_INDEX', {})
+    monkeypatch.setattr(gv, 'TZ', 'UTC')
+    monkeypatch.setattr(gv, 'CSV_SEPARATOR', ',')
+
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) == 2:
+            raise KeyboardInterrupt
+
+    args = argparse.Namespace(raw=False, csv=True, watch=2.0, changes_only=True)
+    watch_depth(['XETHZEUR'], [{'pair': 'XETHZEUR', 'count': 2}], args, clock=lambda: 1500000000, sleep=sleep)
+
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == 'time,pair,dtype,change,price,old_volume,new_volume'
+    assert len(lines) == 1 + 4 + 3
+    assert lines[-1] == '2017-07-14 02:40:00+00:00,ETHEUR,bids,removed,99.0,3.0,'
+
+
+def test_watch_redraws_changed_lines(monkeypatch):
+    monkeypatch.setattr(gv, 'KRAKEN_API', FakeAPI([
+        _depth([('101.0', '1.0'), ('102.0', '2.0')], [('100.0', '1.5'), ('99.0', '3.0')]),
+        _depth([('101.0', '1.0'), ('102.0', '2.5')], [('100.0', '1.5'), ('99.0', '3.0')]),
+    ]))
+    monkeypatch.setattr(gv, 'MAX_CONCURRENT_QUERIES', 8)
+    monkeypatch.setattr(gv, 'ASSET_PAIRS_INDEX', {})
+    monkeypatch.setattr(gv, 'TZ', 'UTC')
+
+    written = []
+
+    class Renderer(TerminalRenderer):
+        def render(self, lines):
+            written.append(super(Renderer, self).render(lines))
+
+    def sleep(seconds):
+        if len(written) == 2:
+            raise KeyboardInterrupt
+
+    args = argparse.Namespace(raw=False, csv=False, watch=1.0, changes_only=False)
+    watch_depth(['XETHZEUR'], [{'pair': 'XETHZEUR', 'count': 2}], args,
+                clock=lambda: 1500000000, sleep=sleep, renderer=Renderer(io.StringIO()))
+
+    # everything is drawn first, then only the line of the changed level
+    assert written == [7, 1]
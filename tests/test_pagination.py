@@ -0,0 +1,95 @@
+import argparse
+import json
+
+import pytest
+
+import clikraken.global_vars as gv
+from clikraken.api.private.get_ledgers import get_ledgers
+
+LEDGERS = {
+    'L{:04d}'.format(i): {
+        'refid': 'R{:04d}'.format(i), 'time': 1500000000 + 60 * i, 'type': 'trade',
+        'asset': 'XETH', 'aclass': 'currency', 'amount': '1.0', 'fee': '0.0', 'balance': str(i),
+    }
+    for i in range(120)
+}
+
+
+class FakeAPI(object):
+    """Stand-in for krakenex.API paginating the Ledgers method like Kraken"""
+
+    def __init__(self, ledgers=LEDGERS):
+        self.ledgers = ledgers
+        self.queries = []
+
+    def query_private(self, method, data):
+        self.queries.append(dict(data))
+        entries = sorted(self.ledgers.items(), key=lambda kv: kv[1]['time'], reverse=True)
+        if 'end' in data:
+            # end is inclusive
+            end_time = self.ledgers[data['end']]['time']
+            entries = [kv for kv in entries if kv[1]['time'] <= end_time]
+        ofs = int(data.get('ofs', 0))
+        return {'error': [], 'result': {'ledger': dict(entries[ofs:ofs + 50]), 'count': len(entries)}}
+
+    def query_public(self, method, data):
+        raise NotImplementedError
+
+
+@pytest.fixture
+def fake_api(monkeypatch):
+    api = FakeAPI()
+    monkeypatch.setattr(gv, 'KRAKEN_API', api)
+    monkeypatch.setattr(gv, 'API_KEY_LOADED', True)
+    monkeypatch.setattr(gv, 'CSV_SEPARATOR', ';')
+    monkeypatch.setattr(gv, 'TZ', 'UTC')
+    return api
+
+
+def _args(**kwargs):
+    defaults = dict(raw=False, debug=False, csv=False, id=None, asset='all', type='all',
+                    start=None, end=None, ofs=None, all=True, local=False, output=None)
+    defaults.update(kwargs)
+    return argparse.Namespace(**defaults)
+
+
+def test_ledgers_all_csv_streamed(fake_api, capsys):
+    get_ledgers(_args(csv=True))
+    lines = capsys.readouterr().out.splitlines()
+
+    assert len(fake_api.queries) == 3
+    assert lines[0].startswith('id;refid;time')
+    ids = [line.split(';')[0] for line in lines[1:]]
+    # all entries exactly once, most recent first
+    assert ids == sorted(LEDGERS, reverse=True)
+
+
+def test_ledgers_all_raw_json_lines(fake_api, capsys):
+    get_ledgers(_args(raw=True))
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == len(LEDGERS)
+    assert set(k for line in lines for k in json.loads(line)) == set(LEDGERS)
+
+
+def test_ledgers_all_table_sorted(fake_api, capsys):
+    get_ledgers(_args())
+    lines = capsys.readouterr().out.splitlines()
+    ids = [line.split()[0] for line in lines[2:]]
+    assert ids == sorted(LEDGERS)
+
+
+def test_ledgers_all_same_time_at_page_boundary(monkeypatch, capsys):
+    # 3 entries per timestamp: the 49th to 51st entries of the first query share the same time
+    ledgers = {'L{:04d}'.format(i): dict(entry, time=1500000000 + 60 * (i // 3))
+               for i, entry in enumerate(sorted(LEDGERS.values(), key=lambda e: e['time']))}
+    api = FakeAPI(ledgers)
+    monkeypatch.setattr(gv, 'KRAKEN_API', api)
+    monkeypatch.setattr(gv, 'API_KEY_LOADED', True)
+    monkeypatch.setattr(gv, 'CSV_SEPARATOR', ';')
+    monkeypatch.setattr(gv, 'TZ', 'UTC')
+
+    get_ledgers(_args(csv=True))
+    ids = [line.split(';')[0] for line in capsys.readouterr().out.splitlines()[1:]]
+    # no entry skipped, none output twice
+    assert sorted(ids) == sorted(ledgers)
+    assert len(ids) == len(set(ids))
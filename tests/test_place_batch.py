@@ -0,0 +1,178 @@
+import argparse
+import io
+import threading
+import time
+from decimal import Decimal
+
+import pytest
+import requests
+
+import clikraken.global_vars as gv
+from clikraken.api.private.place_batch import OrderError, distribute, ladder_prices, place_batch, read_orders
+
+ASSET_PAIRS = {
+    'XETHZEUR': {'altname': 'ETHEUR', 'wsname': 'ETH/EUR', 'base': 'XETH', 'quote': 'ZEUR',
+                 'pair_decimals': 2, 'lot_decimals': 8, 'ordermin': '0.01'},
+    'XXBTZEUR': {'altname': 'XBTEUR', 'wsname': 'XBT/EUR', 'base': 'XXBT', 'quote': 'ZEUR',
+                 'pair_decimals': 1, 'lot_decimals': 8, 'ordermin': '0.0001'},
+}
+
+
+class FakeAPI(object):
+    """Stand-in for clikraken's KrakenAPI placing orders after a delay"""
+
+    uri = 'https://api.kraken.com'
+
+    def __init__(self, delay=0.05, batch_error=None):
+        self.delay = delay
+        self.batch_error = batch_error
+        self.session = requests.Session()
+        self.response = None
+        self.lock = threading.Lock()
+        self.queries = []
+        self.placed = []
+
+    def _place(self, order):
+        with self.lock:
+            self.placed.append(order)
+            return 'TX{:03d}'.format(len(self.placed))
+
+    def query_public(self, method, data):
+        assert method == 'AssetPairs'
+        return {'error': [], 'result': ASSET_PAIRS}
+
+    def query_private(self, method, data):
+        assert method == 'AddOrder'
+        with self.lock:
+            self.queries.append((method, dict(data)))
+        time.sleep(self.delay)
+        if data['price'] == '999.00':
+            return {'error': ['EOrder:Insufficient funds']}
+        return {'error': [], 'result': {'descr': {'order': '...'}, 'txid': [self._place(data)]}}
+
+    def query_private_json(self, method, data):
+        assert method == 'AddOrderBatch'
+        with self.lock:
+            self.queries.append((method, dict(data)))
+        time.sleep(self.delay)
+        if self.batch_error:
+            return {'error': [self.batch_error]}
+        return {'error': [], 'result': {'orders': [
+            {'error': 'EOrder:Insufficient funds'} if o['price'] == '999.00' else {'txid': self._place(o)}
+            for o in data['orders']]}}
+
+
+@pytest.fixture
+def make_api(monkeypatch):
+    monkeypatch.setattr(gv, 'API_KEY_LOADED', True)
+    monkeypatch.setattr(gv, 'MAX_CONCURRENT_QUERIES', 8)
+    monkeypatch.setattr(gv, 'CSV_SEPARATOR', ',')
+    monkeypatch.setattr(gv, 'ASSET_PAIRS_CACHE_TTL', 0)
+    monkeypatch.setattr(gv, 'TRADING_AGREEMENT', 'not_agree')
+
+    def make(**kwargs):
+        api = FakeAPI(**kwargs)
+        monkeypatch.setattr(gv, 'KRAKEN_API', api)
+        return api
+    return make
+
+
+def _args(**kwargs):
+    defaults = dict(raw=False, debug=False, csv=True, file=None, ladder=None, grid=None, start=None, end=None,
+                    steps=None, volume=None, distribution='flat', factor=Decimal(2), pair='XETHZEUR',
+                    ordertype='limit', leverage='none', userref=None, nopost=False, validate=False,
+                    dry_run=False, no_batch=False)
+    defaults.update(kwargs)
+    return argparse.Namespace(**defaults)
+
+
+def _rows(capsys):
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == 'pair,type,ordertype,volume,price,result'
+    return [line.split(',') for line in lines[1:]]
+
+
+def test_ladder_and_distributions():
+    assert ladder_prices(Decimal(100), Decimal(90), 5) == [100, Decimal('97.5'), 95, Decimal('92.5'), 90]
+    assert distribute(Decimal(10), 4) == [Decimal('2.5')] * 4
+    volumes = distribute(Decimal(6), 3, 'linear', Decimal(2))
+    assert [v.quantize(Decimal('0.01')) for v in volumes] == [Decimal('1.33'), 2, Decimal('2.67')]
+    volumes = distribute(Decimal(7), 3, 'geometric', Decimal(4))
+    assert [v.quantize(Decimal('0.01')) for v in volumes] == [1, 2, 4]
+    with pytest.raises(OrderError):
+        distribute(Decimal(1), 3, 'exponential')
+
+
+def test_read_orders():
+    assert read_orders(io.StringIO('type;volume;price\nbuy;1;100\nsell;2;110\n')) == [
+        {'type': 'buy', 'volume': '1', 'price': '100'}, {'type': 'sell', 'volume': '2', 'price': '110'}]
+    assert read_orders(io.StringIO('{"orders": [{"type": "buy", "volume": 1, "price": 100}]}')) == [
+        {'type': 'buy', 'volume': 1, 'price': 100}]
+
+
+def test_grid_batches(make_api, capsys):
+    api = make_api()
+    place_batch(_args(grid=Decimal(100), start=Decimal(80), end=Decimal(120), steps=41, volume=Decimal(4),
+                      userref='7'))
+    rows = _rows(capsys)
+
+    # 20 buys and 20 sells, nothing at the center
+    assert len(rows) == 40
+    assert [r[1] for r in rows] == ['buy'] * 20 + ['sell'] * 20
+    assert [r[3:5] for r in rows[19:21]] == [['0.10000000', '99.00'], ['0.10000000', '101.00']]
+    assert all(r[5].startswith('TX') for r in rows)
+    assert sorted(len(d['orders']) for _, d in api.queries) == [10, 15, 15]
+    order = api.queries[0][1]['orders'][0]
+    assert order['userref'] == 7 and order['oflags'] == 'post' and 'pair' not in order
+
+
+def test_file_orders_validated_before_placing(make_api, tmp_path, caplog):
+    api = make_api()
+    path = tmp_path / 'orders.csv'
+    path.write_text('pair,type,volume,price\nETHEUR,buy,1,100.123\nDOGEEUR,sell,1,1\nETHEUR,buy,0.001,100\n'
+                    'XBTEUR,buy,1,\n')
+    place_batch(_args(file=str(path)))
+
+    assert api.queries == []
+    assert 'order 1: price: at most 2 decimals are allowed' in caplog.text
+    assert 'order 2: unknown asset pair "DOGEEUR"' in caplog.text
+    assert 'order 3: the volume 0.001 is below the minimum of 0.01' in caplog.text
+    assert 'order 4: the price is required for limit orders' in caplog.text
+
+
+def test_batch_fallback_and_errors(make_api, tmp_path, capsys):
+    api = make_api(batch_error='EGeneral:Invalid arguments:orders')
+    path = tmp_path / 'orders.json'
+    path.write_text('[{"type": "buy", "volume": "1", "price": "99.5"},'
+                    ' {"type": "buy", "volume": "1", "price": "999.00"},'
+                    ' {"pair": "XBTEUR", "type": "sell", "volume": "0.5", "price": "30000"}]')
+    t0 = time.perf_counter()
+    place_batch(_args(file=str(path)))
+    elapsed = time.perf_counter() - t0
+
+    rows = _rows(capsys)
+    assert [r[0] for r in rows] == ['XETHZEUR', 'XETHZEUR', 'XXBTZEUR']
+    assert rows[0][5].startswith('TX') and rows[2][5].startswith('TX')
+    assert rows[1][5] == 'EOrder:Insufficient funds'
+    assert sorted(m for m, _ in api.queries) == ['AddOrder'] * 3 + ['AddOrderBatch']
+    # one batch then concurrent AddOrder queries
+    assert elapsed < 4 * api.delay
+
+
+def test_batch_of_unknown_outcome(make_api, capsys):
+    # the batch may have been placed, its orders must not be sent again
+    api = make_api(batch_error='EService:Unavailable')
+    place_batch(_args(ladder='buy', start=Decimal(100), end=Decimal(90), steps=3, volume=Decimal(3)))
+    results = [line.split(',', 5)[5] for line in capsys.readouterr().out.splitlines()[1:]]
+    assert results == ['"unknown (EService:Unavailable), check the open orders"'] * 3
+    assert [m for m, _ in api.queries] == ['AddOrderBatch']
+
+
+def test_dry_run(make_api, capsys):
+    api = make_api()
+    place_batch(_args(ladder='sell', start=Decimal(100), end=Decimal(110), steps=3, volume=Decimal(1),
+                      dry_run=True))
+    assert [r[3:] for r in _rows(capsys)] == [['0.33333333', '100.00', 'not submitted'],
+                                              ['0.33333333', '105.00', 'not submitted'],
+                                              ['0.33333333', '110.00', 'not submitted']]
+    assert api.queries == []
@@ -0,0 +1,114 @@
+import argparse
+import json
+from decimal import Decimal
+
+import pytest
+
+import clikraken.global_vars as gv
+from clikraken.api.private.pnl import local_engine, pnl
+from clikraken.history_db import HistoryDB
+from clikraken.pnl import REALIZED, PnLEngine, period_of
+
+T0 = 1500000000.0
+
+
+def _trade(i, ttype, vol, price, fee, pair='XETHZEUR', margin='0.00000'):
+    return {'ordertxid': 'O{}'.format(i), 'pair': pair, 'time': T0 + 86400 * i, 'type': ttype,
+            'ordertype': 'limit', 'price': price, 'cost': str(Decimal(vol) * Decimal(price)), 'fee': fee,
+            'vol': vol, 'margin': margin, 'misc': ''}
+
+
+TRADES = [
+    ('T1', _trade(1, 'buy', '1', '100', '1')),
+    ('T2', _trade(2, 'buy', '1', '200', '2')),
+    ('T3', _trade(3, 'sell', '1.5', '300', '4.5')),
+]
+
+
+@pytest.mark.parametrize('method, realized, basis', [
+    ('fifo', '243.5', '101'),
+    ('lifo', '193', '50.5'),
+    ('average', '218.25', '75.75'),
+])
+def test_cost_basis_methods(method, realized, basis):
+    engine = PnLEngine(method)
+    assert engine.add_many(TRADES) == 3
+    [(key, stats)] = engine.report('all')
+    assert key == ('all', 'XETHZEUR')
+    assert stats[REALIZED] == Decimal(realized)
+    assert engine.holdings() == [('XETHZEUR', Decimal('0.5'), Decimal(basis))]
+
+
+def test_unmatched_and_margin_trades():
+    engine = PnLEngine()
+    engine.add_many([('T1', _trade(1, 'buy', '1', '100', '0')),
+                     ('T2', _trade(2, 'sell', '2', '150', '3')),
+                     ('T3', _trade(3, 'buy', '5', '100', '0', margin='100.0'))])
+    # only the half of the proceeds matched with the lot bought is realized
+    assert engine.report('all')[0][1][REALIZED] == Decimal('48.5')
+    assert engine.unmatched == {'XETHZEUR': Decimal('1')}
+    assert engine.skipped == 1
+    assert engine.holdings() == []
+
+
+def test_incremental_state():
+    trades = [('T{}{}'.format(i, pair), _trade(i, 'buy' if i % 3 else 'sell', '1', str(100 + i), '0.1', pair=pair))
+              for i in range(1, 60) for pair in ('XETHZEUR', 'XXBTZEUR')]
+
+    full = PnLEngine('lifo')
+    full.add_many(trades)
+
+    engine = PnLEngine('lifo')
+    engine.add_many(trades[:50])
+    engine = PnLEngine.from_state(json.loads(json.dumps(engine.to_state())))
+    # trades already processed are skipped
+    assert engine.add_many(trades[40:]) == len(trades) - 50
+
+    assert engine.report('month') == full.report('month')
+    assert engine.holdings() == full.holdings()
+
+
+def test_periods():
+    assert period_of('2017-07-14', 'week') == '2017-W28'
+    assert period_of('2017-01-01', 'week') == '2016-W52'
+    assert period_of('2017-07-14', 'month') == '2017-07'
+    assert period_of('2017-07-14', 'year') == '2017'
+
+
+@pytest.fixture
+def history(monkeypatch, tmp_path):
+    monkeypatch.setattr(gv, 'HISTORY_DB_PATH', str(tmp_path / 'history.sqlite'))
+    monkeypatch.setattr(gv, 'ASSET_PAIRS_INDEX', {})
+    monkeypatch.setattr(gv, 'CSV_SEPARATOR', ',')
+    db = HistoryDB()
+    yield db
+    db.close()
+
+
+def test_local_engine_resumes(history):
+    history.upsert('trades', dict(TRADES[:2]))
+    assert local_engine('fifo').processed == 2
+
+    history.upsert('trades', dict(TRADES[2:]))
+    engine = local_engine('fifo')
+    assert engine.processed == 3
+    assert engine.report('all')[0][1][REALIZED] == Decimal('243.5')
+
+    # a trade older than the last one processed: the state can't be resumed
+    history.upsert('trades', {'T0': _trade(0, 'buy', '1', '50', '0')})
+    engine = local_engine('fifo')
+    assert engine.processed == 4
+    assert engine.report('all')[0][1][REALIZED] == Decimal('345')
+
+
+def test_pnl_command(history, capsys):
+    history.upsert('trades', dict(TRADES))
+    args = argparse.Namespace(local=True, method='fifo', rebuild=False, holdings=False, period='day',
+                              pair=None, csv=True)
+    pnl(args)
+    assert capsys.readouterr().out.splitlines() == [
+        'period,pair,sells,volume,proceeds,cost basis,fees,realized',
+        '2017-07-15,ETHEUR,0,0E-8,0E-8,0E-8,1.00000000,0E-8',
+        '2017-07-16,ETHEUR,0,0E-8,0E-8,0E-8,2.00000000,0E-8',
+        '2017-07-17,ETHEUR,1,1.50000000,445.50000000,202.00000000,4.50000000,243.50000000',
+    ]
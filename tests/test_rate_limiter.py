@@ -0,0 +1,82 @@
+import pytest
+
+from clikraken.api.rate_limiter import RateLimiter, fcntl
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+
+
+def _limiter(clock, **kwargs):
+    return RateLimiter(clock=clock, sleep=clock.sleep, **kwargs)
+
+
+def test_method_costs():
+    assert RateLimiter.cost('private', 'Balance') == 1
+    assert RateLimiter.cost('private', 'Ledgers') == 2
+    assert RateLimiter.cost('private', 'AddOrder') == 0
+    assert RateLimiter.cost('public', 'Ticker') == 1
+
+
+def test_unknown_tier():
+    with pytest.raises(ValueError):
+        RateLimiter('gold')
+
+
+def test_burst_then_wait():
+    clock = FakeClock()
+    limiter = _limiter(clock, tier='pro')  # max 20, decays 1/s
+
+    for _ in range(10):
+        assert limiter.acquire('private', 'Ledgers') == 0
+    assert clock.sleeps == []
+
+    # the counter is full: the next callers are queued one after another
+    assert limiter.acquire('private', 'Balance') == pytest.approx(1.0)
+    assert limiter.acquire('private', 'Ledgers') == pytest.approx(3.0)
+
+    # orders don't count
+    assert limiter.acquire('private', 'AddOrder') == 0
+
+
+def test_decay():
+    clock = FakeClock()
+    limiter = _limiter(clock, tier='starter')  # max 15, decays 0.33/s
+
+    for _ in range(15):
+        limiter.acquire('private', 'Balance')
+    clock.now += 10  # 3.3 calls worth of decay
+    for _ in range(3):
+        assert limiter.acquire('private', 'Balance') == 0
+    assert limiter.acquire('private', 'Balance') > 0
+
+
+def test_penalize():
+    clock = FakeClock()
+    limiter = _limiter(clock, tier='pro')
+    limiter.penalize('public')
+    assert limiter.acquire('public', 'Ticker') == pytest.approx(1.0)
+    # the private counter is independent
+    assert limiter.acquire('private', 'Balance') == 0
+
+
+@pytest.mark.skipif(fcntl is None, reason='fcntl not available')
+def test_shared_state_file(tmpdir):
+    clock = FakeClock()
+    state_file = str(tmpdir.join('ratelimit.json'))
+    limiter1 = _limiter(clock, tier='pro', state_file=state_file)
+    limiter2 = _limiter(clock, tier='pro', state_file=state_file)
+
+    for _ in range(10):
+        limiter1.acquire('private', 'Balance')
+    for _ in range(10):
+        assert limiter2.acquire('private', 'Balance') == 0
+    assert limiter1.acquire('private', 'Balance') == pytest.approx(1.0)
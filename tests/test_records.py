@@ -0,0 +1,81 @@
+import copy
+import io
+
+import pytest
+
+import clikraken.global_vars as gv
+from clikraken.api.api_utils import parse_order_res
+from clikraken.api.private.get_ledgers import parse_ledgers
+from clikraken.api.private.trades import parse_trades
+from clikraken.api.public.ohlc import parse_ohlc
+from clikraken.clikraken_utils import _tabulate as tabulate
+from clikraken.clikraken_utils import write_csv
+from clikraken.records import ClosedOrder, OpenOrder
+
+
+@pytest.fixture(autouse=True)
+def env(monkeypatch):
+    monkeypatch.setattr(gv, 'TZ', 'UTC')
+    monkeypatch.setattr(gv, 'CSV_SEPARATOR', ',')
+    monkeypatch.setattr(gv, 'ASSET_PAIRS_INDEX', {})
+
+
+def _order(status, otype, pair='XETHZEUR', **kwargs):
+    order = {'status': status, 'vol': '1.0', 'oflags': 'fciq', 'opentm': 1500000000,
+             'descr': {'type': otype, 'pair': pair, 'ordertype': 'limit', 'price': '200.0'}}
+    order.update(kwargs)
+    return order
+
+
+ORDERS = {
+    'O1': _order('open', 'buy'),
+    'O2': _order('closed', 'sell', vol_exec='1.0', price='210.0', cost='210.0', fee='0.3', closetm=1500000060),
+    'O3': _order('canceled', 'buy', vol_exec='0.0', price='0.0', cost='0.0', fee='0.0', closetm=1500000120),
+}
+
+
+def test_parse_order_res():
+    ol = parse_order_res(ORDERS, ['open'])
+    assert ol == {'buy': [OpenOrder('O1', 'open', 'buy', '1.0', 'XETHZEUR', 'limit', '200.0', False,
+                                    '2017-07-14 02:40:00+00:00')], 'sell': []}
+
+    ol = parse_order_res(ORDERS, ['closed', 'canceled'])
+    assert [o.orderid for o in ol['buy'] + ol['sell']] == ['O3', 'O2']
+    assert ol['sell'][0] == ClosedOrder('O2', 'closed', 'sell', '1.0', '1.0', 'XETHZEUR', 'limit', '210.0', '210.0',
+                                        '0.3', False, '2017-07-14 02:41:00+00:00')
+
+
+def _trade(i, pair):
+    return {'ordertxid': 'O{}'.format(i), 'pair': pair, 'time': 1500000000.5 + i, 'type': 'buy',
+            'ordertype': 'limit', 'price': '200.0', 'cost': '200.0', 'fee': '0.3', 'vol': '1.0',
+            'margin': '0.0', 'misc': ''}
+
+
+def test_parse_trades_filters_without_mutating():
+    res = {'T1': _trade(1, 'XETHZEUR'), 'T2': _trade(2, 'XXBTZEUR'), 'T3': _trade(3, 'XETHZEUR')}
+    original = copy.deepcopy(res)
+
+    assert [t.txid for t in parse_trades(res, 'XETHZEUR')] == ['T1', 'T3']
+    assert len(parse_trades(res, 'all')) == len(parse_trades(res)) == 3
+    assert res == original
+
+
+def test_records_output():
+    """Tables and CSV have the same columns as with one dict per row"""
+    ledgers = {'L1': {'refid': 'R1', 'time': 1500000000.0, 'type': 'trade', 'asset': 'XETH',
+                      'aclass': 'currency', 'amount': '1.5', 'fee': '0.0', 'balance': '2.5'}}
+    rows = parse_ledgers(ledgers)
+
+    out = io.StringIO()
+    assert write_csv(rows, headers="keys", file=out) == 1
+    assert out.getvalue() == ('id,refid,time,type,asset,aclass,amount,fee,balance\n'
+                              'L1,R1,2017-07-14 02:40:00+00:00,trade,ETH,currency,1.5,0.0,2.5\n')
+
+    table = tabulate(rows, headers="keys").splitlines()
+    assert table[0].split() == ['id', 'refid', 'time', 'type', 'asset', 'aclass', 'amount', 'fee', 'balance']
+
+    candles = parse_ohlc('XETHZEUR', {'XETHZEUR': [[1500000000 + 60 * i, '1', '2', '0.5', '1.5', '1.2', '10', 5]
+                                                   for i in range(3)]})
+    assert [c.Time[11:16] for c in candles] == ['02:42', '02:41', '02:40']
+    assert tabulate(candles, headers="keys").splitlines()[0].split() == \
+        ['Time', 'Open', 'High', 'Low', 'Close', 'VWAP', 'Volume', 'Count']
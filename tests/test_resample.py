@@ -0,0 +1,94 @@
+import argparse
+import random
+from decimal import Decimal
+
+import pytest
+
+import clikraken.global_vars as gv
+from clikraken.api.public import ohlc as ohlc_module
+
+pytest.importorskip('numpy')
+
+from clikraken.resample import parse_interval, resample_ohlc  # noqa: E402
+
+T0 = 1500000000 - 1500000000 % 86400
+
+
+def _candles(n, start=T0, seed=1):
+    rnd = random.Random(seed)
+    candles = []
+    price = 100.0
+    for i in range(n):
+        o = price
+        c = price = max(1.0, price + rnd.gauss(0, 1))
+        h, lo = max(o, c) + rnd.random(), min(o, c) - rnd.random()
+        volume = 0.0 if i % 7 == 3 else rnd.random() * 10
+        vwap = (lo + h) / 2 if volume else c
+        candles.append([start + 60 * i, '{:.5f}'.format(o), '{:.5f}'.format(h), '{:.5f}'.format(lo),
+                        '{:.5f}'.format(c), '{:.5f}'.format(vwap), '{:.8f}'.format(volume), rnd.randint(0, 9)])
+    return candles
+
+
+def _naive(candles, interval):
+    groups = {}
+    for candle in candles:
+        groups.setdefault(candle[0] - candle[0] % interval, []).append(candle)
+    rows = []
+    for start, group in sorted(groups.items()):
+        volume = sum(Decimal(c[6]) for c in group)
+        notional = sum(Decimal(c[5]) * Decimal(c[6]) for c in group)
+        vwap = notional / volume if volume else Decimal(group[-1][4])
+        rows.append([start, group[0][1], max((c[2] for c in group), key=Decimal),
+                     min((c[3] for c in group), key=Decimal), group[-1][4],
+                     '{:.5f}'.format(vwap), '{:.8f}'.format(volume), sum(c[7] for c in group)])
+    return rows
+
+
+@pytest.mark.parametrize('interval', [180, 3600, 7200, 86400])
+def test_resample_like_naive_group_by(interval):
+    candles = _candles(3000)
+    assert resample_ohlc(candles, 60, interval) == _naive(candles, interval)
+
+
+def test_partial_first_interval_dropped():
+    # starts at 00:02, the first 5 minutes interval is incomplete
+    candles = _candles(13, start=T0 + 120)
+    rows = resample_ohlc(candles, 60, 300)
+    assert [r[0] for r in rows] == [T0 + 300, T0 + 600]
+    assert rows == _naive(candles[3:], 300)
+    assert resample_ohlc(candles[:2], 60, 300) == []
+
+
+def test_parse_interval():
+    assert parse_interval('3') == 180
+    assert parse_interval('3m') == 180
+    assert parse_interval('2h') == 7200
+    assert parse_interval('1d') == 86400
+    with pytest.raises(ValueError):
+        resample_ohlc(_candles(10), 300, 420)
+
+
+def test_ohlc_resample_csv(monkeypatch, capsys):
+    monkeypatch.setattr(gv, 'TZ', 'UTC')
+    monkeypatch.setattr(gv, 'CSV_SEPARATOR', ',')
+    monkeypatch.setattr(gv, 'ASSET_PAIRS_INDEX', {})
+    queries = []
+
+    def query(api_type, method, api_params_list, args):
+        queries.append(api_params_list)
+        return [{'XETHZEUR': _candles(720), 'last': T0 + 720 * 60}]
+
+    monkeypatch.setattr(ohlc_module, 'query_api_concurrently', query)
+    args = argparse.Namespace(pair='XETHZEUR', since=None, interval=1, count=3, csv=True, output=None,
+                              indicators=None, resample='15m,4h')
+    ohlc_module.ohlc(args)
+
+    assert len(queries) == 1
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == 'Interval,Time,Open,High,Low,Close,VWAP,Volume,Count'
+    assert [line.split(',')[:2] for line in lines[1:]] == [
+        ['15m', '2017-07-14 11:45:00+00:00'], ['15m', '2017-07-14 11:30:00+00:00'],
+        ['15m', '2017-07-14 11:15:00+00:00'],
+        ['4h', '2017-07-14 08:00:00+00:00'], ['4h', '2017-07-14 04:00:00+00:00'],
+        ['4h', '2017-07-14 00:00:00+00:00'],
+    ]
@@ -0,0 +1,210 @@
+import socket
+import time
+
+import pytest
+
+import clikraken.api.retry as retry
+import clikraken.global_vars as gv
+from clikraken.api.api_utils import query_kraken
+from clikraken.api.retry import RetryPolicy, setup_retry_policy
+
+TIMEOUT = socket.timeout('read timed out')
+
+
+class FakeAPI(object):
+    """Stand-in for clikraken's KrakenAPI failing as scripted, then processing the queries"""
+
+    def __init__(self, failures=(), process_failed=False):
+        # a failure is either an exception raised or a list of Kraken errors
+        self.failures = list(failures)
+        # whether the queries failing with an exception are processed anyway
+        self.process_failed = process_failed
+        self.queries = []
+        self.orders = {}
+
+    def _process(self, method, data):
+        if method == 'AddOrder':
+            txid = 'O{}'.format(len(self.orders))
+            self.orders[txid] = {'status': 'open', 'opentm': time.time(), 'vol': data['volume'],
+                                 'userref': data.get('userref'),
+                                 'descr': {'pair': data['pair'], 'type': data['type'], 'price': data['price'],
+                                           'order': 'buy {} @ {}'.format(data['volume'], data['price'])}}
+            return {'error': [], 'result': {'txid': [txid]}}
+        if method == 'CancelOrder':
+            self.orders[data['txid']]['status'] = 'canceled'
+            return {'error': [], 'result': {'count': 1}}
+        if method in ('OpenOrders', 'ClosedOrders'):
+            status = 'open' if method == 'OpenOrders' else 'closed'
+            return {'error': [], 'result': {status: {
+                txid: o for txid, o in self.orders.items()
+                if (o['status'] == 'open') == (status == 'open') and o['userref'] == data['userref']}}}
+        if method == 'QueryOrders':
+            return {'error': [], 'result': {data['txid']: self.orders[data['txid']]}}
+        return {'error': [], 'result': {'method': method}}
+
+    def query_public(self, method, data):
+        return self.query_private(method, data)
+
+    def query_private(self, method, data):
+        self.queries.append(method)
+        if method in ('AddOrder', 'CancelOrder', 'Ticker', 'Balance') and self.failures:
+            failure = self.failures.pop(0)
+            if isinstance(failure, list):
+                return {'error': failure}
+            if self.process_failed:
+                self._process(method, data)
+            raise failure
+        return self._process(method, data)
+
+
+@pytest.fixture
+def setup(monkeypatch):
+    delays = []
+    monkeypatch.setattr(gv, 'RATE_LIMITER', None)
+    monkeypatch.setattr(gv, 'CRON', False)
+    monkeypatch.setattr(gv, 'DEBUG', True)
+    # asset pairs compared by name
+    monkeypatch.setattr(gv, 'ASSET_PAIRS_INDEX', {})
+    monkeypatch.setattr(gv, 'RETRY_POLICY', RetryPolicy(3, 0.5, rand=lambda: 0.5, sleep=delays.append))
+
+    def make(*args, **kwargs):
+        api = FakeAPI(*args, **kwargs)
+        monkeypatch.setattr(gv, 'KRAKEN_API', api)
+        # the txids of the fake API are reused
+        monkeypatch.setattr(retry, '_placed_txids', set())
+        return api, delays
+    return make
+
+
+def test_backoff_with_jitter():
+    policy = RetryPolicy(5, 0.5, max_delay=3.0, rand=lambda: 1.0)
+    assert [policy.delay(i) for i in range(4)] == [0.5, 1.0, 2.0, 3.0]
+    policy.rand = lambda: 0.0
+    assert [policy.delay(i) for i in range(4)] == [0.25, 0.5, 1.0, 1.5]
+    assert setup_retry_policy(0, 0.5) is None
+
+
+def test_read_only_retried(setup, caplog):
+    api, delays = setup([TIMEOUT, ['EService:Unavailable']])
+    assert query_kraken('public', 'Ticker', {}) == {'error': [], 'result': {'method': 'Ticker'}}
+    assert api.queries == ['Ticker'] * 3
+    assert delays == [0.375, 0.75]
+
+    assert 'retry 2/3' in caplog.text
+    assert '(2 retries)' in caplog.text
+    # only the error of the last attempt is reported
+    assert not [r for r in caplog.records if r.levelname == 'ERROR']
+
+
+def test_retries_exhausted(setup, caplog):
+    api, delays = setup([['EService:Unavailable']] * 5)
+    assert query_kraken('private', 'Balance', {}) == {'error': ['EService:Unavailable']}
+    assert len(api.queries) == 4
+    assert [r.getMessage() for r in caplog.records if r.levelname == 'ERROR'] == ['EService:Unavailable']
+
+
+def test_not_retried(setup, monkeypatch):
+    api, delays = setup([['EGeneral:Invalid arguments']])
+    assert query_kraken('private', 'Balance', {}) == {'error': ['EGeneral:Invalid arguments']}
+    assert api.queries == ['Balance']
+
+    monkeypatch.setattr(gv, 'RETRY_POLICY', None)
+    api, delays = setup([TIMEOUT])
+    assert query_kraken('public', 'Ticker', {}) == {}
+    assert api.queries == ['Ticker']
+
+
+class FakeRateLimiter(object):
+    def __init__(self):
+        self.penalties = 0
+
+    def acquire(self, api_type, api_method):
+        return 0.0
+
+    def penalize(self, api_type):
+        self.penalties += 1
+
+
+def test_rate_limit_penalized_once_per_response(setup, monkeypatch):
+    limiter = FakeRateLimiter()
+    monkeypatch.setattr(gv, 'RATE_LIMITER', limiter)
+    api, delays = setup([['EAPI:Rate limit exceeded']] * 5)
+    assert query_kraken('private', 'Balance', {}) == {'error': ['EAPI:Rate limit exceeded']}
+    assert len(api.queries) == limiter.penalties == 4
+
+
+ORDER = {'pair': 'XETHZEUR', 'type': 'buy', 'ordertype': 'limit', 'volume': '1.5', 'price': '100'}
+
+
+def test_rejected_order_retried(setup):
+    api, delays = setup([['EAPI:Invalid nonce']])
+    assert query_kraken('private', 'AddOrder', dict(ORDER)) == {'error': [], 'result': {'txid': ['O0']}}
+    assert api.queries == ['AddOrder', 'AddOrder']
+
+
+def test_order_without_userref_not_sent_again(setup):
+    api, delays = setup([TIMEOUT], process_failed=True)
+    assert query_kraken('private', 'AddOrder', dict(ORDER)) == {}
+    assert api.queries == ['AddOrder']
+    assert len(api.orders) == 1
+
+
+def test_order_with_userref_reconciled(setup):
+    # the order was placed despite the timeout: it is found instead of placed again
+    api, delays = setup([TIMEOUT], process_failed=True)
+    res = query_kraken('private', 'AddOrder', dict(ORDER, userref=7))
+    assert res['result']['txid'] == ['O0']
+    assert api.queries == ['AddOrder', 'OpenOrders', 'ClosedOrders']
+    assert len(api.orders) == 1
+
+    # the order wasn't placed: it is sent again
+    api, delays = setup([TIMEOUT])
+    res = query_kraken('private', 'AddOrder', dict(ORDER, userref=7))
+    assert res['result']['txid'] == ['O0']
+    assert api.queries == ['AddOrder', 'OpenOrders', 'ClosedOrders', 'AddOrder']
+    assert len(api.orders) == 1
+
+
+def test_identical_orders_reconciled(setup):
+    # an identical order placed before the query isn't taken for the order
+    api, delays = setup([TIMEOUT])
+    api._process('AddOrder', dict(ORDER, userref=7))
+    api.orders['O0']['opentm'] -= 60
+    res = query_kraken('private', 'AddOrder', dict(ORDER, userref=7))
+    assert res['result']['txid'] == ['O1']
+    assert api.queries == ['AddOrder', 'OpenOrders', 'ClosedOrders', 'AddOrder']
+
+    # the identical orders placed by the queries of a batch are each found once
+    api, delays = setup([TIMEOUT, TIMEOUT], process_failed=True)
+    txids = [query_kraken('private', 'AddOrder', dict(ORDER, userref=7))['result']['txid'] for _ in range(2)]
+    assert txids == [['O0'], ['O1']]
+    assert len(api.orders) == 2
+
+    # an order placed without error by another query isn't taken either
+    api, delays = setup([TIMEOUT])
+    query_kraken('private', 'AddOrder', dict(ORDER, userref=7))
+    api.failures = [TIMEOUT]
+    api.queries = []
+    res = query_kraken('private', 'AddOrder', dict(ORDER, userref=7))
+    assert res['result']['txid'] == ['O1']
+    assert api.queries == ['AddOrder', 'OpenOrders', 'ClosedOrders', 'AddOrder']
+
+
+def test_cancel_reconciled(setup):
+    api, delays = setup([TIMEOUT], process_failed=True)
+    api.orders['O9'] = {'status': 'open'}
+    assert query_kraken('private', 'CancelOrder', {'txid': 'O9'}) == {'error': [], 'result': {'count': 1}}
+    assert api.queries == ['CancelOrder', 'QueryOrders']
+
+    api, delays = setup([TIMEOUT])
+    api.orders['O9'] = {'status': 'open'}
+    assert query_kraken('private', 'CancelOrder', {'txid': 'O9'}) == {'error': [], 'result': {'count': 1}}
+    assert api.queries == ['CancelOrder', 'QueryOrders', 'CancelOrder']
+
+
+def test_unexpected_exception_not_retried(setup, caplog):
+    api, delays = setup([RuntimeError('boom')])
+    assert query_kraken('private', 'Balance', {}) == {}
+    assert api.queries == ['Balance']
+    errors = [r for r in caplog.records if r.levelname == 'ERROR']
+    assert errors[0].exc_info[1].args == ('boom',)
@@ -0,0 +1,50 @@
+import random
+
+import arrow
+import pytest
+
+from clikraken.timestamp_utils import TimestampFormatter, humanize_many, to_seconds
+
+
+def arrow_format(ts, tz):
+    """Formatting previously used by clikraken"""
+    return arrow.get(ts).to(tz).replace(microsecond=0).format('YYYY-MM-DD HH:mm:ssZZ')
+
+
+def test_to_seconds():
+    assert to_seconds(1500000000) == 1500000000
+    assert to_seconds(1500000000.4) == 1500000000
+    assert to_seconds('1500000000.5') == 1500000000
+    # rounded to the microsecond first
+    assert to_seconds(1499999999.9999996) == 1500000000
+    assert to_seconds(-0.5) == -1
+
+
+@pytest.mark.parametrize('tz', ['UTC', 'Europe/Berlin', 'America/New_York', 'Australia/Lord_Howe',
+                                '+05:30', '-03:00', 'local'])
+def test_format_same_as_arrow(tz):
+    rng = random.Random(42)
+    timestamps = [rng.randint(0, 2000000000) for _ in range(2000)]
+    timestamps += [rng.uniform(0, 2000000000) for _ in range(2000)]
+    formatter = TimestampFormatter(tz)
+    assert formatter.format_many(timestamps) == [arrow_format(ts, tz) for ts in timestamps]
+
+
+def test_format_dst_transitions():
+    formatter = TimestampFormatter('Europe/Berlin')
+    # every minute around the transitions of 2017 (2017-03-26 01:00 UTC and 2017-10-29 01:00 UTC)
+    for transition in (1490490000, 1509238800):
+        timestamps = range(transition - 7200, transition + 7200, 60)
+        assert formatter.format_many(timestamps) == [arrow_format(ts, 'Europe/Berlin') for ts in timestamps]
+
+    assert formatter.format(1509238800 - 1) == '2017-10-29 02:59:59+02:00'
+    assert formatter.format(1509238800) == '2017-10-29 02:00:00+02:00'
+
+
+def test_humanize_same_as_arrow():
+    now = 1500000000
+    deltas = [0, 5, 9, 10, 44, 45, 89, 90, 2699, 2700, 5399, 5400, 79199, 79200, 129599, 129600,
+              2159999, 2160000, 3887999, 3888000, 29807999, 29808000, 47260799, 47260800, 10 ** 9]
+    timestamps = [now + sign * d for d in deltas for sign in (1, -1)] + [now - 12.4, now + 30.6]
+    expected = [arrow.get(ts).humanize(arrow.get(now)) for ts in timestamps]
+    assert humanize_many(timestamps, now=now) == expected
@@ -0,0 +1,99 @@
+import json
+import time
+
+import pytest
+import requests
+
+import clikraken.global_vars as gv
+from clikraken.api.kraken_api import KrakenAPI
+from clikraken.timings import Timings, report_timings, timed
+
+
+class FakeSession(object):
+    """Stand-in for requests.Session answering every query with the same JSON"""
+
+    content = b'{"error": [], "result": {"XETHZEUR": {}}}'
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        time.sleep(0.01)
+        return self._response(requests.Request('GET', url, params=params).prepare())
+
+    def _response(self, request):
+        response = requests.Response()
+        response.status_code = 200
+        response._content = self.content
+        response.request = request
+        return response
+
+
+@pytest.fixture
+def timings(monkeypatch):
+    timings = Timings()
+    monkeypatch.setattr(gv, 'TIMINGS', timings)
+    return timings
+
+
+def test_nested_phases(timings):
+    with timed('command'):
+        time.sleep(0.02)
+        with timed('http'):
+            time.sleep(0.05)
+        with timed('http'):
+            pass
+
+    count, wall, cpu = timings.phases['http']
+    assert count == 2
+    assert 0.05 <= wall < 0.1
+    # the time of the nested phases is excluded
+    count, wall, cpu = timings.phases['command']
+    assert count == 1
+    assert 0.02 <= wall < 0.05
+
+
+def test_disabled(monkeypatch):
+    monkeypatch.setattr(gv, 'TIMINGS', None)
+    with timed('command'):
+        pass
+
+
+def test_http_and_json_phases(timings):
+    api = KrakenAPI()
+    api.session = FakeSession()
+    assert api.query_public('Ticker', {'pair': 'XETHZEUR'}) == {'error': [], 'result': {'XETHZEUR': {}}}
+
+    assert set(timings.phases) == {'http', 'json'}
+    assert timings.phases['http'][1] >= 0.01
+    url = 'https://api.kraken.com/0/public/Ticker?pair=XETHZEUR'
+    assert timings.requests == {'Ticker': [1, len(url), len(FakeSession.content)]}
+
+
+def test_json_lines(timings, tmpdir):
+    path = str(tmpdir.join('timings.jsonl'))
+    timings.add('http', 0.25, 0.01)
+    timings.add_request('Balance', 100, 200)
+    report_timings(timings, 'balance', path=path)
+    report_timings(timings, 'balance', path=path)
+
+    with open(path) as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 2
+    assert records[0]['command'] == 'balance'
+    assert records[0]['phases'] == {'http': {'calls': 1, 'wall': 0.25, 'cpu': 0.01}}
+    assert records[0]['requests'] == {'Balance': {'calls': 1, 'sent': 100, 'received': 200}}
+
+
+def test_prometheus_textfile(timings, tmpdir):
+    path = str(tmpdir.join('clikraken.prom'))
+    timings.add('http', 0.25, 0.01)
+    report_timings(timings, 'balance', path=path)
+    report_timings(timings, 'ticker', path=path)
+    timings.add('http', 0.25, 0.01)
+    report_timings(timings, 'balance', path=path)
+
+    with open(path) as f:
+        lines = f.read().splitlines()
+    assert 'clikraken_phase_wall_seconds{command="balance",phase="http"} 0.5' in lines
+    assert 'clikraken_phase_wall_seconds{command="ticker",phase="http"} 0.25' in lines
+    # each metric appears once, with the samples of all the commands
+    assert lines.count('# TYPE clikraken_phase_wall_seconds gauge') == 1
+    assert len([line for line in lines if line.startswith('clikraken_wall_seconds')]) == 2
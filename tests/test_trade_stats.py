@@ -0,0 +1,128 @@
+import argparse
+import random
+from decimal import Decimal
+
+import pytest
+
+import clikraken.global_vars as gv
+from clikraken.api.public.last_trades import follow_trades
+from clikraken.trade_stats import Trade, TradeStats, parse_duration, parse_trade
+
+
+def test_parse_duration():
+    assert parse_duration('30s') == 30
+    assert parse_duration('5m') == 300
+    assert parse_duration('1H') == 3600
+    assert parse_duration('90') == 90
+    with pytest.raises(ValueError):
+        parse_duration('5x')
+    with pytest.raises(ValueError):
+        parse_duration('0m')
+
+
+def test_parse_trade():
+    trade = parse_trade(['1234.5', '0.1', 1500000000.1234, 'b', 'l', ''])
+    assert trade == Trade(1500000000.1234, Decimal('1234.5'), Decimal('0.1'), 'buy', 'limit')
+
+
+def test_incremental_stats_match_recomputation():
+    rng = random.Random(1)
+    stats = TradeStats(['1m', '5m'], buffer_size=10)
+    trades = []
+    t = 1500000000.0
+    for _ in range(20):
+        batch = []
+        for _ in range(rng.randint(0, 30)):
+            t += rng.uniform(0, 5)
+            batch.append(Trade(t, Decimal(rng.randint(100, 200)), Decimal(rng.randint(1, 1000)) / 100,
+                               rng.choice(['buy', 'sell']), 'limit'))
+        stats.add(batch)
+        trades.extend(batch)
+        now = t + rng.uniform(0, 30)
+
+        for row, seconds in zip(stats.summary(now), (60, 300)):
+            # the windows keep at most as many trades as the buffer
+            window = [tr for tr in trades[-10:] if tr.time > now - seconds]
+            volume = sum(tr.volume for tr in window)
+            assert row['Trades'] == len(window)
+            assert row['Volume'] == volume
+            assert row['Buy volume'] == sum(tr.volume for tr in window if tr.side == 'buy')
+            assert row['Sell volume'] == sum(tr.volume for tr in window if tr.side == 'sell')
+            if volume:
+                assert row['VWAP'] == round(sum(tr.price * tr.volume for tr in window) / volume, 8)
+            else:
+                assert row['VWAP'] is None
+
+    # the ring buffer only keeps the most recent trades
+    assert list(stats.recent) == trades[-10:]
+
+
+def test_trade_rate():
+    stats = TradeStats(['1m'])
+    assert stats.summary(100)[0]['Trades/min'] is None
+    stats.add([Trade(float(t), Decimal(1), Decimal(1), 'buy', 'market') for t in range(0, 30)])
+    # only 30 seconds elapsed since the first trade
+    assert stats.summary(30)[0]['Trades/min'] == 60
+    # trades older than a minute are expired
+    assert stats.summary(75)[0]['Trades/min'] == 14
+
+
+def test_memory_bounded():
+    # 100 trades per second, which a window of 5 minutes doesn't expire
+    stats = TradeStats(['5m'], buffer_size=50)
+    for t in range(100):
+        stats.add([Trade(1000 + t + i / 100, Decimal(1), Decimal(1), 'buy', 'market') for i in range(100)])
+        window = stats.windows[0]
+        assert len(stats.recent) == window.count == 50
+
+    row = stats.summary(1100)[0]
+    assert row['Trades'] == 50
+    assert row['Volume'] == 50
+    # the rate is computed over the trades kept
+    assert row['Trades/min'] == pytest.approx(50 * 60 / (1100 - 1099.49))
+
+
+class FakeAPI(object):
+    """Stand-in for krakenex.API serving new trades at each Trades query"""
+
+    def __init__(self):
+        self.queries = []
+
+    def query_public(self, method, data):
+        self.queries.append(dict(data))
+        since = int(data.get('since', 0))
+        trades = [['100.0', '1.0', 1500000000 + i, 'b' if i % 2 else 's', 'l', '']
+                  for i in range(since, since + 3)]
+        return {'error': [], 'result': {'XXBTZEUR': trades, 'last': str(since + 3)}}
+
+    def query_private(self, method, data):
+        raise NotImplementedError
+
+
+def test_follow_trades(monkeypatch, capsys):
+    api = FakeAPI()
+    monkeypatch.setattr(gv, 'KRAKEN_API', api)
+    monkeypatch.setattr(gv, 'TZ', 'UTC')
+    monkeypatch.setattr(gv, 'CSV_SEPARATOR', ',')
+    monkeypatch.setattr(gv, 'MAX_CONCURRENT_QUERIES', 8)
+    monkeypatch.setattr(gv, 'ASSET_PAIRS_INDEX', {})
+
+    polls = []
+
+    def sleep(seconds):
+        polls.append(seconds)
+        if len(polls) == 3:
+            raise KeyboardInterrupt
+
+    args = argparse.Namespace(raw=False, csv=True, since=None, count=2, windows='1m', buffer=100, poll=2.5)
+    follow_trades(['XBTEUR'], args, clock=lambda: 1500000010, sleep=sleep)
+
+    # each poll continues from the cursor of the previous results
+    assert api.queries == [{'pair': 'XBTEUR'}, {'pair': 'XBTEUR', 'since': '3'}, {'pair': 'XBTEUR', 'since': '6'}]
+    assert polls == [2.5, 2.5, 2.5]
+
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == 'Time,Pair,Trade type,Order type,Price,Volume'
+    # only the last trades of the first poll, then all the new trades
+    assert lines[1] == '2017-07-14 02:40:01+00:00,XBTEUR,buy,limit,100.0,1.0'
+    assert len(lines) == 1 + 2 + 3 + 3
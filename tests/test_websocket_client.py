@@ -0,0 +1,154 @@
+import argparse
+import zlib
+
+import pytest
+
+import clikraken.global_vars as gv
+from clikraken.api.public.depth import stream_depth
+from clikraken.api.public.last_trades import stream_trades
+from clikraken.api.public.ticker import stream_ticker
+from clikraken.api.websocket_client import ChecksumError, LocalOrderBook, book_depth
+from ws_server import WAIT, StandInServer
+
+pytest.importorskip('websocket')
+
+
+def _crc(asks, bids):
+    """Checksum of Kraken's book channel, for levels already sorted (best first)"""
+    fields = [x.replace('.', '').lstrip('0') for level in asks[:10] + bids[:10] for x in level]
+    return str(zlib.crc32(''.join(fields).encode()))
+
+
+ASKS = [['0.05005', '0.00000500'], ['0.05010', '0.00000500'], ['0.05015', '0.00000500']]
+BIDS = [['0.05000', '0.00000500'], ['0.04995', '0.00000500']]
+
+
+def test_book_checksum():
+    book = LocalOrderBook(depth=10)
+    # the snapshot is not necessarily sorted
+    assert book.apply([{'as': [a + ['1534614057.321597'] for a in reversed(ASKS)],
+                        'bs': [b + ['1534614057.321597'] for b in BIDS]}])
+    expected = '5005500' '5010500' '5015500' '5000500' '4995500'
+    assert book.checksum() == zlib.crc32(expected.encode())
+
+
+def test_book_updates():
+    book = LocalOrderBook(depth=3)
+    # updates received before the snapshot are ignored
+    assert not book.apply([{'a': [['0.05020', '1.0', '1']]}])
+
+    book.apply([{'as': ASKS, 'bs': BIDS}])
+    asks = [ASKS[0], ['0.05007', '1.00000000'], ASKS[1]]
+    bids = [['0.05001', '2.00000000'], BIDS[1]]
+    # add levels on both sides (the worst ask is pushed out of the book), remove a bid
+    book.apply([{'a': [['0.05007', '1.00000000', '1']]},
+                {'b': [['0.05001', '2.00000000', '1'], ['0.05000', '0.00000000', '1']], 'c': _crc(asks, bids)}])
+    assert book.snapshot() == {'asks': dict(asks), 'bids': dict(bids)}
+    assert list(book.snapshot()['asks']) == [a[0] for a in asks]
+
+    with pytest.raises(ChecksumError):
+        book.apply([{'a': [['0.05007', '3.00000000', '1']], 'c': '12345'}])
+    # until a new snapshot
+    assert not book.apply([{'a': [['0.05007', '2.00000000', '1']]}])
+
+
+def test_book_depth():
+    assert book_depth(7) == 10
+    assert book_depth(25) == 25
+    assert book_depth(5000) == 1000
+
+
+@pytest.fixture
+def ws_env(monkeypatch):
+    monkeypatch.setattr(gv, 'ASSET_PAIRS_INDEX', {})
+    monkeypatch.setattr(gv, 'TZ', 'UTC')
+    monkeypatch.setattr(gv, 'CSV_SEPARATOR', ',')
+
+    def serve(script):
+        server = StandInServer(script)
+        monkeypatch.setattr(gv, 'WEBSOCKET_URL', server.url)
+        return server
+
+    return serve
+
+
+def _args(**kwargs):
+    defaults = dict(raw=False, csv=True, spread=False, changes_only=True, count=10)
+    defaults.update(kwargs)
+    return argparse.Namespace(**defaults)
+
+
+def test_stream_depth(ws_env, capsys):
+    update_asks = [ASKS[0], ['0.05007', '1.00000000'], ASKS[1], ASKS[2]]
+    script = [
+        WAIT,
+        {'event': 'systemStatus', 'status': 'online'},
+        [42, {'as': ASKS, 'bs': BIDS}, 'book-10', 'XBT/EUR'],
+        {'event': 'heartbeat'},
+        [42, {'a': [['0.05007', '1.00000000', '1']], 'c': _crc(update_asks, BIDS)}, 'book-10', 'XBT/EUR'],
+    ]
+    with ws_env(script) as server:
+        stream_depth(['XXBTZEUR'], _args())
+
+    assert server.received == [{'event': 'subscribe', 'pair': ['XBT/EUR'],
+                                'subscription': {'name': 'book', 'depth': 10}}]
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == 'time,pair,dtype,change,price,old_volume,new_volume'
+    assert len(lines) == 1 + 5 + 1
+    assert lines[-1].split(',')[1:] == ['XBTEUR', 'asks', 'added', '0.05007', '', '1.00000000']
+
+
+def test_stream_depth_resubscribes_on_checksum_mismatch(ws_env, capsys):
+    script = [
+        WAIT,
+        [42, {'as': ASKS, 'bs': BIDS}, 'book-10', 'XBT/EUR'],
+        [42, {'a': [['0.05007', '1.00000000', '1']], 'c': '1'}, 'book-10', 'XBT/EUR'],
+        WAIT,
+        WAIT,
+        [42, {'as': ASKS, 'bs': BIDS}, 'book-10', 'XBT/EUR'],
+    ]
+    with ws_env(script) as server:
+        stream_depth(['XXBTZEUR'], _args())
+
+    assert [m['event'] for m in server.received] == ['subscribe', 'unsubscribe', 'subscribe']
+    lines = capsys.readouterr().out.splitlines()
+    # the book is unchanged after the new snapshot
+    assert len(lines) == 1 + 5
+
+
+def test_stream_ticker(ws_env, capsys):
+    ticker = {'a': ['5525.40000', 1, '1.000'], 'b': ['5525.10000', 1, '1.000'], 'c': ['5525.10000', '0.00398963'],
+              'v': ['2634.11501494', '3591.17907851'], 'p': ['5631.44067', '5653.78939'],
+              't': [11493, 16267], 'l': ['5505.00000', '5505.00000'], 'h': ['5783.00000', '5783.00000'],
+              'o': ['5760.70000', '5763.40000']}
+    with ws_env([WAIT, [0, ticker, 'ticker', 'XBT/EUR']]) as server:
+        stream_ticker(['XXBTZEUR'], _args())
+
+    assert server.received[0]['subscription'] == {'name': 'ticker'}
+    assert capsys.readouterr().out.splitlines() == [
+        'pair,last,high,low,vol,wavg,vol value,ask,bid',
+        'XBTEUR,5525.10000,5783.00000,5505.00000,3591.17907851,5653.78939,20 MEUR,5525.40000,5525.10000',
+    ]
+
+
+def test_stream_spread(ws_env, capsys):
+    spread = ['5698.40000', '5700.00000', '1542057299.545897', '1.01234567', '0.98765432']
+    with ws_env([WAIT, [0, spread, 'spread', 'XBT/EUR']]) as server:
+        stream_ticker(['XXBTZEUR'], _args(spread=True))
+
+    assert server.received[0]['subscription'] == {'name': 'spread'}
+    assert capsys.readouterr().out.splitlines()[1] == \
+        'XBTEUR,2018-11-12 21:14:59+00:00,5698.40000,1.01234567,5700.00000,0.98765432'
+
+
+def test_stream_trades(ws_env, capsys):
+    trades = [['5541.20000', '0.15850568', '1534614057.321597', 's', 'l', ''],
+              ['6060.00000', '0.02455000', '1534614057.324998', 'b', 'l', '']]
+    with ws_env([WAIT, [0, trades, 'trade', 'XBT/EUR']]):
+        stream_trades(['XXBTZEUR'], _args())
+
+    assert capsys.readouterr().out.splitlines() == [
+        'Time,Pair,Trade type,Order type,Price,Volume',
+        '2018-08-18 17:40:57+00:00,XBTEUR,sell,limit,5541.20000,0.15850568',
+        '2018-08-18 17:40:57+00:00,XBTEUR,buy,limit,6060.00000,0.02455000',
+    ]
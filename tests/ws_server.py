@@ -0,0 +1,92 @@
+"""
+Minimal stand-in for Kraken's WebSocket API, for the tests (stdlib only).
+
+It accepts one connection, records the messages sent by the client,
+and plays a script: each item is either a message to send (converted
+to JSON) or WAIT to wait for the next message of the client. The
+connection is closed at the end of the script.
+"""
+
+import base64
+import hashlib
+import json
+import socket
+import struct
+import threading
+
+WAIT = object()
+
+_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+class StandInServer(object):
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.received = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(1)
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+
+    @property
+    def url(self):
+        return 'ws://127.0.0.1:{}'.format(self.sock.getsockname()[1])
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.thread.join(5)
+        self.sock.close()
+
+    def _serve(self):
+        conn, _ = self.sock.accept()
+        with conn:
+            f = conn.makefile('rb')
+            self._handshake(conn, f)
+            for item in self.script:
+                if item is WAIT:
+                    self.received.append(json.loads(self._read_frame(f)))
+                else:
+                    self._send_frame(conn, json.dumps(item).encode(), opcode=1)
+            # close frame
+            self._send_frame(conn, b'', opcode=8)
+
+    def _handshake(self, conn, f):
+        key = None
+        while True:
+            line = f.readline().decode().strip()
+            if not line:
+                break
+            if line.lower().startswith('sec-websocket-key:'):
+                key = line.split(':', 1)[1].strip()
+        accept = base64.b64encode(hashlib.sha1((key + _GUID).encode()).digest()).decode()
+        conn.sendall(('HTTP/1.1 101 Switching Protocols\r\n'
+                      'Upgrade: websocket\r\n'
+                      'Connection: Upgrade\r\n'
+                      'Sec-WebSocket-Accept: {}\r\n\r\n'.format(accept)).encode())
+
+    @staticmethod
+    def _read_frame(f):
+        b0, b1 = f.read(2)
+        length = b1 & 0x7f
+        if length == 126:
+            length, = struct.unpack('!H', f.read(2))
+        elif length == 127:
+            length, = struct.unpack('!Q', f.read(8))
+        mask = f.read(4) if b1 & 0x80 else b'\0\0\0\0'
+        payload = f.read(length)
+        return bytes(b ^ mask[i % 4] for i, b in enumerate(payload)).decode()
+
+    @staticmethod
+    def _send_frame(conn, payload, opcode):
+        header = bytes([0x80 | opcode])
+        if len(payload) < 126:
+            header += bytes([len(payload)])
+        elif len(payload) < 65536:
+            header += bytes([126]) + struct.pack('!H', len(payload))
+        else:
+            header += bytes([127]) + struct.pack('!Q', len(payload))
+        conn.sendall(header + payload)